@@ -0,0 +1,205 @@
+"""
+探测的自适应并发与超时控制 (AIMD)
+
+AdaptiveController 代替 probe.py 里固定大小的全局并发池，作为 controller= 传给
+probe / sweep / sweep_many / verify:
+    并发    每完成一轮探测 (约等于当前并发数) 评估一次：没有拥塞迹象时加性增加 INCREASE_STEP，
+            出现拥塞迹象时乘性减半 (DECREASE_FACTOR)，上下限为 [minimum, maximum]
+    拥塞    本地资源错误 (文件句柄 / 端口耗尽等) 超过 RESOURCE_ERROR_RATE；
+            本轮 RTT 中位数膨胀到历史各轮最低中位数的 RTT_INFLATION 倍以上 (类似 TCP Vegas，
+            按轮取中位数而不是单个主机的最小 RTT，远近不同的主机混在一起也不会误判)；
+            本轮超时率比基线 (历史各轮的滑动平均) 高出 TIMEOUT_SURGE。
+            整段失效的网段本来就大量超时，只看超时率的绝对值会误判，因此与基线比较
+    超时    只自适应建连超时：按 RFC 6298 由成功 / 被拒绝连接的 RTT 估计 srtt + 4 * rttvar，
+            限制在 [MIN_TIMEOUT, 配置的 TIMEOUT] 之间，没有样本前用配置的 TIMEOUT。
+            被拒绝连接只是一次 RST 往返，爆破时大量出现，会把估计压得很低，
+            因此读响应头仍用配置的 TIMEOUT，响应慢的酒店服务器不会因此被误判失效
+    限速    同一 /24 网段每秒最多发起 SUBNET_RATE 个探测 (允许 SUBNET_BURST 个突发)，
+            避免爆破时触发上游的限流或封禁
+每次调整都打印一行日志，结束时 summary() 打印汇总。设置 ADAPTIVE_PROBE=0 可关闭，
+此时各脚本回到固定并发与超时。
+"""
+import asyncio
+import os
+import resource
+import time
+from collections import deque
+
+ENABLED = os.environ.get("ADAPTIVE_PROBE", "1") != "0"
+MAX_SCALE = 4                 # 并发上限 = 初始并发 * MAX_SCALE (再受文件句柄上限约束)
+MIN_CONCURRENCY = 16
+MIN_ROUND = 32                # 每轮至少这么多次探测才评估
+INCREASE_STEP = 16
+DECREASE_FACTOR = 0.5
+RESOURCE_ERROR_RATE = 0.02
+RTT_INFLATION = 3.0
+MIN_INFLATION_RTT = 0.05      # 本轮中位数低于 50ms 时不判 RTT 膨胀 (回环 / 同机房抖动)
+MIN_RTT_SAMPLES = 8           # 本轮 RTT 样本少于此数时不判 RTT 膨胀
+TIMEOUT_SURGE = 0.25
+BASELINE_ALPHA = 0.2
+MIN_TIMEOUT = 1.0
+FD_RESERVE = 64               # 给缓存、日志等留出的文件句柄
+SUBNET_RATE = float(os.environ.get("ADAPTIVE_SUBNET_RATE", 200))  # 每个 /24 每秒的探测数
+SUBNET_BURST = 64
+
+
+def fd_limit():
+    try:
+        return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (OSError, ValueError):
+        return None
+
+
+def subnet_key(host):
+    """ip:port -> /24 网段 (a.b.c)；非 IPv4 主机按主机名单独限速"""
+    name = host.rsplit(":", 1)[0]
+    parts = name.split(".")
+    return ".".join(parts[:3]) if len(parts) == 4 and name.replace(".", "").isdigit() else name
+
+
+class AdaptiveController:
+    def __init__(self, name, initial, timeout, minimum=MIN_CONCURRENCY, maximum=None,
+                 subnet_rate=SUBNET_RATE, subnet_burst=SUBNET_BURST):
+        self.name = name
+        self.max_timeout = timeout
+        self.minimum = min(minimum, initial)
+        maximum = maximum or initial * MAX_SCALE
+        nofile = fd_limit()
+        if nofile and nofile != resource.RLIM_INFINITY:
+            maximum = min(maximum, max(self.minimum, nofile - FD_RESERVE))
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(initial, self.maximum))
+        self.active = 0
+        self._waiters = deque()
+        # RTT 估计 (RFC 6298)
+        self.srtt = None
+        self.rttvar = None
+        self.base_rtt = None  # 历史各轮 RTT 中位数的最小值
+        # 本轮统计
+        self._round = {"n": 0, "timeout": 0, "resource": 0, "rtts": []}
+        self.baseline = None
+        # /24 限速 (GCRA): 网段 -> 理论到达时间
+        self.interval = 1.0 / subnet_rate if subnet_rate else 0.0
+        self.tolerance = self.interval * (subnet_burst - 1)
+        self._tat = {}
+        self.stats = {"increase": 0, "decrease": 0, "peak": self.limit, "low": self.limit,
+                      "paced": 0, "probes": 0}
+        self.started = time.monotonic()
+
+    # --- 并发池：用法与 asyncio.Semaphore 相同 (async with controller) ---
+    async def __aenter__(self):
+        while self.active >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                self._wake()
+                raise
+        self.active += 1
+
+    async def __aexit__(self, *exc):
+        self.active -= 1
+        self._wake()
+
+    def _wake(self):
+        free = int(self.limit) - self.active
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    # --- 建连超时 ---
+    def connect_timeout(self):
+        if self.srtt is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(MIN_TIMEOUT, self.srtt + 4 * self.rttvar))
+
+    # --- /24 限速 ---
+    async def pace(self, host):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        key = subnet_key(host)
+        tat = max(self._tat.get(key, now), now)
+        delay = tat - now - self.tolerance
+        self._tat[key] = tat + self.interval
+        if delay > 0:
+            self.stats["paced"] += 1
+            await asyncio.sleep(delay)
+
+    # --- 反馈 ---
+    def observe(self, res):
+        """记录一次真正发起的探测 (ProbeResult)"""
+        self.stats["probes"] += 1
+        r = self._round
+        r["n"] += 1
+        if res.ok or res.error == "refused":
+            # 拿到了对端的应答 (含 RST)，是有效的 RTT 样本
+            rtt = res.elapsed
+            r["rtts"].append(rtt)
+            if self.srtt is None:
+                self.srtt, self.rttvar = rtt, rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        elif res.error == "timeout":
+            r["timeout"] += 1
+        elif res.error == "resource":
+            r["resource"] += 1
+        if r["n"] >= max(MIN_ROUND, int(self.limit)):
+            self._adjust()
+
+    def _adjust(self):
+        r = self._round
+        timeout_rate = r["timeout"] / r["n"]
+        resource_rate = r["resource"] / r["n"]
+        reasons = []
+        if resource_rate > RESOURCE_ERROR_RATE:
+            reasons.append(f"本机资源错误 {resource_rate:.0%}")
+        if len(r["rtts"]) >= MIN_RTT_SAMPLES:
+            round_rtt = sorted(r["rtts"])[len(r["rtts"]) // 2]
+            if (self.base_rtt is not None and round_rtt > MIN_INFLATION_RTT
+                    and round_rtt > RTT_INFLATION * self.base_rtt):
+                reasons.append(f"RTT 膨胀 {round_rtt * 1000:.0f}ms / 基准 {self.base_rtt * 1000:.0f}ms")
+            self.base_rtt = round_rtt if self.base_rtt is None else min(self.base_rtt, round_rtt)
+        if self.baseline is not None and timeout_rate > self.baseline + TIMEOUT_SURGE:
+            reasons.append(f"超时率 {timeout_rate:.0%} / 基线 {self.baseline:.0%}")
+
+        old = self.limit
+        if reasons:
+            self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+            self.stats["decrease"] += 1
+            # 拥塞时的超时率不计入基线
+        else:
+            self.limit = min(self.maximum, self.limit + INCREASE_STEP)
+            self.stats["increase"] += 1
+            self.baseline = timeout_rate if self.baseline is None else \
+                (1 - BASELINE_ALPHA) * self.baseline + BASELINE_ALPHA * timeout_rate
+        self.stats["peak"] = max(self.stats["peak"], self.limit)
+        self.stats["low"] = min(self.stats["low"], self.limit)
+        self._round = {"n": 0, "timeout": 0, "resource": 0, "rtts": []}
+
+        if int(old) != int(self.limit):
+            arrow = "↓" if reasons else "↑"
+            why = "，".join(reasons) if reasons else f"超时率 {timeout_rate:.0%}"
+            print(f"🎛️ [{self.name}] 并发 {int(old)} -> {int(self.limit)} {arrow} ({why}，"
+                  f"建连超时 {self.connect_timeout():.2f}s)", flush=True)
+        self._wake()
+
+    def summary(self):
+        s = self.stats
+        srtt = f"{self.srtt * 1000:.0f}ms" if self.srtt is not None else "-"
+        print(f"🎛️ [{self.name}] 自适应汇总：{s['probes']} 次探测，并发 {int(s['low'])}~{int(s['peak'])} "
+              f"(上限 {self.maximum})，加 {s['increase']} 次 / 减 {s['decrease']} 次，"
+              f"srtt {srtt}，最终建连超时 {self.connect_timeout():.2f}s，网段限速等待 {s['paced']} 次", flush=True)
+
+
+def make_controller(name, concurrency, timeout, **kwargs):
+    """ADAPTIVE_PROBE=0 时返回 None (调用方回到固定并发与超时)"""
+    if not ENABLED:
+        return None
+    return AdaptiveController(name, concurrency, timeout, **kwargs)
@@ -1,6 +1,13 @@
-import os, sys, requests, re, concurrent.futures
+import os, sys, re
 from urllib.parse import urlparse
 
+import metrics
+from adaptive import make_controller
+from channel_list import iter_blocks
+from host_history import HostHistory
+from liveness_cache import LivenessCache
+from probe import conclusive, iter_async, verify
+
 # --- 路径配置区 ---
 # 获取当前脚本所在目录 (即 md 文件夹)
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -14,7 +21,8 @@ MID_REVIVED = os.path.join(CURRENT_DIR, "revived_temp.txt")
 MID_DEAD = os.path.join(CURRENT_DIR, "dead_tasks.txt")
 
 TIMEOUT = 3
-MAX_WORKERS = 30
+MAX_CONCURRENCY = 500
+VERIFY_SAMPLES = 4  # 每个网段抽检的频道数，共用一条 keep-alive 连接
 
 def is_valid_ip(ip_str):
     """校验 IP:Port 或 域名:Port 格式"""
@@ -34,28 +42,18 @@ def main():
     def load_data(path, label):
         if not os.path.exists(path): return
         print(f"📖 正在从 [{label}] 加载基因...", flush=True)
-        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
-            cur_ip = None
-            for line in f:
-                line = line.strip()
-                if not line: continue
-                if "#genre#" in line:
-                    potential_ip = line.split(',')[0].strip()
-                    if is_valid_ip(potential_ip):
-                        cur_ip = potential_ip
-                        if cur_ip not in ip_map: ip_map[cur_ip] = {}
-                    else: cur_ip = None
-                    continue
-                if ',' in line and cur_ip:
-                    name, url = line.split(',', 1)
-                    # 关键：优先保护已存在的内容 (底库内容)
-                    name_s, url_s = name.strip(), url.strip()
-                    if name_s not in ip_map[cur_ip]:
-                        ip_map[cur_ip][name_s] = url_s
+        for block in iter_blocks(path):
+            if not is_valid_ip(block.host): continue
+            channels = ip_map.setdefault(block.host, {})
+            for ch in block.channels:
+                # 关键：优先保护已存在的内容 (底库内容)
+                if ch.name not in channels:
+                    channels[ch.name] = ch.url
 
     # ！！！加载顺序：1.底库(md/) 2.新源(根目录) ！！！
-    load_data(LOCAL_BASE, "MD底库(含手动修改)")
-    load_data(INPUT_RAW, "根目录新源")
+    with metrics.phase("parse"):
+        load_data(LOCAL_BASE, "MD底库(含手动修改)")
+        load_data(INPUT_RAW, "根目录新源")
 
     all_ips = list(ip_map.keys())
     total_ips = len(all_ips)
@@ -69,36 +67,53 @@ def main():
     revived, dead = [], []
     processed = 0
 
-    def check(ip):
-        try:
-            first_name = list(ip_map[ip].keys())[0]
-            test_url = ip_map[ip][first_name]
-            r = requests.get(test_url, timeout=TIMEOUT, stream=True, headers={"User-Agent":"Mozilla/5.0"})
-            return ip, r.status_code == 200
-        except: return ip, False
-
-    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as exe:
-        futures = {exe.submit(check, ip): ip for ip in all_ips}
-        for f in concurrent.futures.as_completed(futures):
+    # 按主机历史跳过稳定存活 / 长期失效的网段，沿用上次结果 (见 host_history.py)
+    history = HostHistory("host")
+    skipped = {ip: history.last_up(ip) for ip in all_ips if not history.due(ip)}
+    for ip, ok in skipped.items():
+        block_content = f"{ip},#genre#\n" + "".join(f"{name},{url}\n" for name, url in ip_map[ip].items()) + "\n"
+        (revived if ok else dead).append(block_content)
+        processed += 1
+        print(f"[{processed}/{total_ips}] ⏭️ [{'沿用存活' if ok else '沿用失效'}] {ip} ({history.state(ip)})", flush=True)
+
+    # 每个网段抽检多个频道，任一存活即判网段存活
+    cache = LivenessCache()
+    controller = make_controller("聚合", MAX_CONCURRENCY, TIMEOUT)
+    results = verify(((ip, list(ip_map[ip].values())) for ip in all_ips if ip not in skipped),
+                     samples=VERIFY_SAMPLES, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY,
+                     user_agent="Mozilla/5.0", cache=cache, controller=controller)
+    with metrics.phase("probe"):
+        for ip, checked in iter_async(results):
             processed += 1
-            ip, ok = f.result()
-            
-            # 重组文件块
+            ok = any(checked.values())
+            if conclusive(checked):
+                history.record(ip, ok, reusable=all(checked.values()) or not ok)
+        
+            # 重组文件块：存活网段剔除抽检中确认失效的频道，失效网段原样送去抢救
             block_content = f"{ip},#genre#\n"
             for name, url in ip_map[ip].items():
+                if ok and checked.get(url) is False: continue
                 block_content += f"{name},{url}\n"
             block_content += "\n"
-            
+        
             if ok:
                 revived.append(block_content)
-                print(f"[{processed}/{total_ips}] ✅ [存活] {ip}", flush=True)
+                alive = list(checked.values()).count(True)
+                print(f"[{processed}/{total_ips}] ✅ [存活] {ip} (抽检 {alive}/{len(checked)})", flush=True)
             else:
                 dead.append(block_content)
                 print(f"[{processed}/{total_ips}] 💀 [失效] {ip}", flush=True)
+    cache.close()
+    history.close()
+    if controller:
+        controller.summary()
 
-    with open(MID_REVIVED, 'w', encoding='utf-8') as f: f.writelines(revived)
-    with open(MID_DEAD, 'w', encoding='utf-8') as f: f.writelines(dead)
+    with metrics.phase("write"):
+        with open(MID_REVIVED, 'w', encoding='utf-8') as f: f.writelines(revived)
+        with open(MID_DEAD, 'w', encoding='utf-8') as f: f.writelines(dead)
     print(f"📊 探测完成。存活: {len(revived)} | 待抢救: {len(dead)}", flush=True)
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("聚合"):
+        main()
+    metrics.write_report()
@@ -0,0 +1,342 @@
+"""
+性能基准
+
+用法:
+    python md/benchmark.py alias [m3u 文件]    频道名解析 (默认 md/hotel_original.m3u，不存在则用 demo_output.m3u)
+    python md/benchmark.py parse [txt 文件]    频道列表解析/输出吞吐 (默认 history/merged.txt，M3U 用同规模的合成数据)
+    python md/benchmark.py farm [网段数] [每段存活数]
+                                               启动 md/iptv_farm.py 模拟服务器群，在临时目录中依次运行
+                                               aggregate / check_iptv / rescue_hotel / discovery，
+                                               报告墙钟、探测速率、线程与内存峰值 (延迟、错误率等见 iptv_farm.py)
+    python md/benchmark.py serve [并发] [秒数]  压测 md/serve_playlist.py：keep-alive 客户端混合请求完整 / gzip /
+                                               条件 (304) / Range / 按分组与频道名过滤，期间不断改写播放列表触发热重载
+"""
+import io
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.2f} ms"
+
+
+def bench_alias(path=None):
+    from channel_alias import AliasResolver
+
+    if path is None:
+        path = os.path.join(CURRENT_DIR, "hotel_original.m3u")
+        if not os.path.exists(path):
+            path = os.path.join(PARENT_DIR, "demo_output.m3u")
+    with open(path, encoding="utf-8", errors="ignore") as f:
+        names = [line.split(",", 1)[-1].strip() for line in f if line.startswith("#EXTINF")]
+
+    t0 = time.perf_counter()
+    resolver = AliasResolver()
+    t1 = time.perf_counter()
+    hits = sum(1 for name in names if resolver.resolve(name))
+    t2 = time.perf_counter()
+    for name in names:
+        resolver.resolve(name)
+    t3 = time.perf_counter()
+
+    print(f"📄 {os.path.basename(path)}: {len(names)} 个频道名，{len(set(names))} 个不重复")
+    print(f"  编译别名表: {_ms(t1 - t0)} ({len(resolver.exact)} 个精确别名，{len(resolver._wild_mains)} 个通配别名)")
+    print(f"  首次解析:   {_ms(t2 - t1)} (命中 {hits})")
+    print(f"  记忆化解析: {_ms(t3 - t2)}")
+
+
+def _timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def _peak(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_parse(path=None):
+    from channel_list import Channel, iter_blocks, iter_m3u, write_blocks, write_m3u
+
+    if path is None:
+        path = os.path.join(PARENT_DIR, "history", "merged.txt")
+    size = os.path.getsize(path)
+
+    def count_blocks():
+        return sum(len(b.channels) for b in iter_blocks(path))
+
+    n, elapsed = _timed(count_blocks)
+    print(f"📄 {os.path.basename(path)}: {size / 1e6:.1f} MB，{n} 个频道")
+    print(f"  iter_blocks:  {_ms(elapsed)} ({n / elapsed:,.0f} 频道/s，{size / 1e6 / elapsed:.1f} MB/s)")
+    print(f"  内存峰值:     流式 {_peak(count_blocks) / 1024:.0f} KB，"
+          f"整表 {_peak(lambda: list(iter_blocks(path))) / 1024:.0f} KB")
+
+    blocks = list(iter_blocks(path))
+    _, elapsed = _timed(lambda: write_blocks(io.StringIO(), blocks))
+    print(f"  write_blocks: {_ms(elapsed)}")
+
+    # 同规模的合成 M3U：每个频道一条 #EXTINF + URL
+    channels = [Channel(c.name, c.url, b.host) for b in blocks for c in b.channels]
+    buf = io.StringIO()
+    _, elapsed = _timed(lambda: write_m3u(buf, channels))
+    m3u = buf.getvalue().splitlines()
+    m3u_size = len(buf.getvalue().encode("utf-8"))
+    print(f"  write_m3u:    {_ms(elapsed)} ({m3u_size / 1e6:.1f} MB)")
+
+    n, elapsed = _timed(lambda: sum(1 for _ in iter_m3u(m3u)))
+    print(f"  iter_m3u:     {_ms(elapsed)} ({n / elapsed:,.0f} 频道/s，{m3u_size / 1e6 / elapsed:.1f} MB/s)")
+
+
+FARM_STAGES = ["aggregate", "check_iptv", "rescue_hotel", "discovery"]
+FARM_CHANNELS = 8      # 每个生成块的频道数
+FARM_DEAD_BLOCKS = 2   # 每个网段指向已失效主机的块数 (送去抢救)
+SAMPLE_INTERVAL = 0.02
+
+
+def _farm_inputs(farm, root):
+    """在 root 下生成一套可独立运行的 md/ 与 history/：脚本副本 + 指向服务器群的输入文件"""
+    md_dir = os.path.join(root, "md")
+    os.makedirs(os.path.join(root, "history"))
+    os.makedirs(md_dir)
+    for name in os.listdir(CURRENT_DIR):
+        if name.endswith(".py") or name == "alias.txt":
+            shutil.copy(os.path.join(CURRENT_DIR, name), md_dir)
+
+    def block(host):
+        lines = [f"{host},#genre#"]
+        for k in range(1, FARM_CHANNELS + 1):
+            # 首个频道决定爆破路径，用 HLS；其余混入推流路径
+            path = f"/hls/{k}/index.m3u8" if k % 2 else f"/tsfile/live/{k}.ts"
+            lines.append(f"CCTV{k},http://{host}{path}")
+        return "\n".join(lines) + "\n"
+
+    known, merged = [], []
+    for prefix in farm.prefixes:
+        # 每段留一个存活主机不写入底库，供 discovery 发现
+        live = [f"{prefix}.{i}:{farm.port}" for i in farm.live[prefix]]
+        hang = [f"{prefix}.{i}:{farm.port}" for i in farm.hang[prefix]]
+        dead = [f"{prefix}.{i}:{farm.port}" for i in farm.dead[prefix][:FARM_DEAD_BLOCKS]]
+        known += [block(h) for h in live[:-1] + hang[:1] + dead]
+        merged += [block(h) for h in live[:1] + dead[:1]]
+
+    for path in (os.path.join(md_dir, "manual_fix.txt"), os.path.join(md_dir, "aggregated_hotel.txt")):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(known))
+    with open(os.path.join(root, "history", "merged.txt"), "w", encoding="utf-8") as f:
+        f.write("📺模拟,#genre#\n" + "".join(b.split("\n", 1)[1] for b in merged))
+    return len(known), len(merged)
+
+
+def _run_monitored(cmd, cwd, env, log_path):
+    """运行子进程，返回 (墙钟秒数, 退出码, 线程峰值, 常驻内存峰值 KB)；线程数取自 /proc，非 Linux 为 None"""
+    peak_threads = [None]
+    with open(log_path, "w", encoding="utf-8") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        def sample():
+            status = f"/proc/{proc.pid}/status"
+            while proc.returncode is None:
+                try:
+                    with open(status) as f:
+                        for line in f:
+                            if line.startswith("Threads:"):
+                                peak_threads[0] = max(peak_threads[0] or 0, int(line.split()[1]))
+                except OSError:
+                    return
+                time.sleep(SAMPLE_INTERVAL)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        # wait4 只回收这一个子进程，ru_maxrss 即它自己的内存峰值 (Linux 单位 KB，macOS 为字节)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - t0
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        sampler.join()
+    peak_rss = usage.ru_maxrss // 1024 if sys.platform == "darwin" else usage.ru_maxrss
+    return elapsed, proc.returncode, peak_threads[0], peak_rss
+
+
+def _probed(cache_path):
+    """该流程实际发起的探测数 (写入存活缓存的 URL 数)"""
+    if not os.path.exists(cache_path):
+        return 0
+    with sqlite3.connect(cache_path) as db:
+        return db.execute("SELECT COUNT(*) FROM liveness").fetchone()[0]
+
+
+def bench_farm(subnets=None, live_per_subnet=None):
+    from iptv_farm import Farm
+
+    kwargs = {}
+    if subnets is not None:
+        kwargs["subnets"] = int(subnets)
+    if live_per_subnet is not None:
+        kwargs["live_per_subnet"] = int(live_per_subnet)
+    farm = Farm(**kwargs).start()
+    root = tempfile.mkdtemp(prefix="iptv_farm_")
+    try:
+        known, merged = _farm_inputs(farm, root)
+        print(f"🧪 服务器群: {len(farm.prefixes)} 个 /24，存活 {len(farm.live_hosts())} 台，"
+              f"延迟 {farm.latency * 1000:.0f}±{farm.jitter * 1000:.0f} ms，"
+              f"错误率 {farm.error_rate:.0%}，超时率 {farm.timeout_rate:.0%}")
+        print(f"📂 工作目录: {root} (底库 {known} 个块，merged.txt {merged} 个网段)")
+        print(f"  {'流程':<13}{'墙钟':>9}{'探测':>8}{'探测/s':>10}{'服务端请求':>10}{'线程峰值':>8}{'内存峰值':>10}")
+        for stage in FARM_STAGES:
+            cache_path = os.path.join(root, ".cache", f"{stage}.sqlite3")
+            env = dict(os.environ, LIVENESS_CACHE=cache_path, PYTHONUNBUFFERED="1")
+            before = farm.snapshot()["requests"]
+            elapsed, code, threads, rss = _run_monitored(
+                [sys.executable, os.path.join("md", f"{stage}.py")], root, env,
+                os.path.join(root, f"{stage}.log"))
+            requests = farm.snapshot()["requests"] - before
+            probed = _probed(cache_path)
+            note = "" if code == 0 else f"  ⚠️ 退出码 {code}，见 {stage}.log"
+            print(f"  {stage:<13}{elapsed:8.2f}s{probed:>8}{probed / elapsed:>10,.0f}{requests:>12}"
+                  f"{threads if threads is not None else '-':>10}{rss / 1024:>10.1f} MB{note}", flush=True)
+        stats = farm.snapshot()
+        print(f"📊 服务端合计: 连接 {stats['connections']}，请求 {stats['requests']}，200 {stats['200']}，"
+              f"404 {stats['404']}，500 {stats['500']}，挂起 {stats['timeout']}，假死主机连接 {stats['hang']}")
+    finally:
+        farm.stop()
+        if "--keep" not in sys.argv:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+SERVE_REWRITE_INTERVAL = 0.5  # 压测期间改写播放列表的间隔 (秒)
+
+
+def bench_serve(concurrency=16, seconds=5):
+    import http.client
+    import random
+    from urllib.parse import quote
+
+    from channel_list import iter_m3u
+    from metrics import percentile
+    from serve_playlist import serve
+
+    source = os.path.join(PARENT_DIR, "final_hotel.m3u")
+    if not os.path.exists(source):
+        print(f"❌ 未找到 {source}")
+        return
+    concurrency, seconds = int(concurrency), float(seconds)
+    root = tempfile.mkdtemp(prefix="playlist_serve_")
+    for name in ("final_hotel.m3u", "final_hotel.txt"):
+        if os.path.exists(os.path.join(PARENT_DIR, name)):
+            shutil.copy(os.path.join(PARENT_DIR, name), root)
+    with open(source, "rb") as f:
+        full = f.read()
+    # 改写时在完整版与去掉末尾一半的版本之间交替，两者都是合法的播放列表
+    lines = full.split(b"\n")
+    half = b"\n".join(lines[:1 + (len(lines) - 1) // 4 * 2])
+
+    server, url = serve(0, root, reload_interval=0.1)
+    snap = server.store.snapshot
+    host, port = server.server_address
+    # 只挑两个版本里都有的分组，过滤请求不会因改写而 404
+    groups = sorted({ch.group for ch in iter_m3u(half.decode("utf-8").splitlines()) if ch.group})
+    names = sorted({e.split(b"\n", 1)[0].rsplit(b",", 1)[-1].decode("utf-8") for e in snap.entries[:500]})
+    etag = snap.resources["/final_hotel.m3u"].etag
+    kinds = {
+        "完整": lambda rng: ("/final_hotel.m3u", {}),
+        "gzip": lambda rng: ("/final_hotel.m3u", {"Accept-Encoding": "gzip"}),
+        "条件": lambda rng: ("/final_hotel.m3u", {"If-None-Match": etag}),
+        "Range": lambda rng: ("/final_hotel.m3u", {"Range": "bytes=0-65535"}),
+        "分组": lambda rng: (f"/final_hotel.m3u?group={quote(rng.choice(groups))}", {"Accept-Encoding": "gzip"}),
+        "频道名": lambda rng: (f"/final_hotel.m3u?name={quote(rng.choice(names))}", {"Accept-Encoding": "gzip"}),
+    }
+    results = {kind: [] for kind in kinds}  # 类别 -> [(耗时, 状态码, 字节数)]
+    errors = []
+    stop = threading.Event()
+
+    def client(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection(host, port, timeout=10)
+        i = seed
+        while not stop.is_set():
+            kind = list(kinds)[i % len(kinds)]
+            i += 1
+            path, headers = kinds[kind](rng)
+            t0 = time.perf_counter()
+            try:
+                conn.request("GET", path, headers=headers)
+                resp = conn.getresponse()
+                body = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                errors.append(f"{kind}: {e}")
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=10)
+                continue
+            results[kind].append((time.perf_counter() - t0, resp.status, len(body)))
+            if resp.status not in (200, 206, 304):
+                errors.append(f"{kind}: HTTP {resp.status} {path}")
+        conn.close()
+
+    def rewriter():
+        n = 0
+        while not stop.wait(SERVE_REWRITE_INTERVAL):
+            n += 1
+            tmp = os.path.join(root, "final_hotel.m3u.tmp")
+            with open(tmp, "wb") as f:
+                f.write(half if n % 2 else full)
+            os.replace(tmp, os.path.join(root, "final_hotel.m3u"))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    threads.append(threading.Thread(target=rewriter))
+    print(f"🧪 {url}: {len(snap.entries)} 个频道，{len(snap.groups)} 个分组，并发 {concurrency}，{seconds:.0f}s，"
+          f"每 {SERVE_REWRITE_INTERVAL}s 改写一次播放列表")
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    server.store.stop()
+    server.shutdown()
+    shutil.rmtree(root, ignore_errors=True)
+
+    total = sum(len(r) for r in results.values())
+    print(f"  {'请求':<8}{'次数':>8}{'请求/s':>10}{'p50':>10}{'p99':>10}{'平均字节':>12}  状态码")
+    for kind, rows in results.items():
+        if not rows:
+            continue
+        latencies = sorted(r[0] for r in rows)
+        statuses = {}
+        for _, status, _ in rows:
+            statuses[status] = statuses.get(status, 0) + 1
+        print(f"  {kind:<8}{len(rows):>8}{len(rows) / elapsed:>10,.0f}{_ms(percentile(latencies, 50)):>10}"
+              f"{_ms(percentile(latencies, 99)):>10}{sum(r[2] for r in rows) // len(rows):>12,}  "
+              f"{' '.join(f'{s}×{n}' for s, n in sorted(statuses.items()))}")
+    print(f"📊 合计 {total} 次请求，{total / elapsed:,.0f} 请求/s，热重载 {server.store.reloads} 次，"
+          f"错误 {len(errors)}" + (f" (例: {errors[0]})" if errors else ""))
+
+
+BENCHES = {
+    "alias": bench_alias,
+    "parse": bench_parse,
+    "farm": bench_farm,
+    "serve": bench_serve,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHES:
+        print(__doc__)
+        sys.exit(1)
+    BENCHES[sys.argv[1]](*[arg for arg in sys.argv[2:] if not arg.startswith("--")])
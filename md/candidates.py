@@ -0,0 +1,79 @@
+"""
+爆破候选排序：优先探测历史上在同一 (网段, 端口, 路径) 出现过的主机
+
+索引来源: history/*.m3u (含已打包进 history/pack/ 的快照)、history/merged.txt、manual_fix.txt
+排序规则: 历史命中次数多且最近出现的主机 -> 旧 IP 的相邻主机 -> 其余主机 -> 旧 IP 本身
+"""
+import os
+import re
+from datetime import datetime
+from pathlib import Path
+
+from history_pack import History, file_stamp
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+HISTORY_DIR = Path(PARENT_DIR) / "history"
+EXTRA_SOURCES = [HISTORY_DIR / "merged.txt", Path(CURRENT_DIR) / "manual_fix.txt"]
+
+URL_PATTERN = re.compile(r'http://(\d{1,3}\.\d{1,3}\.\d{1,3})\.(\d{1,3}):(\d+)(/[^\s,?#"]*)')
+
+
+def last_octet(ip):
+    """'1.2.3.4' 或 '1.2.3.4:80' -> 4；非 IPv4 返回 None"""
+    tail = ip.split(":")[0].split(".")[-1]
+    return int(tail) if tail.isdigit() else None
+
+
+class HostIndex:
+    def __init__(self):
+        # 结构: { (prefix, port, path): { 末段: [命中次数, 最近时间戳] } }
+        self.seen = {}
+
+    def add_text(self, text, stamp=0):
+        for prefix, octet, port, path in set(URL_PATTERN.findall(text)):
+            octet = int(octet)
+            if not 1 <= octet <= 255:
+                continue
+            hosts = self.seen.setdefault((prefix, port, path), {})
+            entry = hosts.get(octet)
+            if entry is None:
+                hosts[octet] = [1, stamp]
+            else:
+                entry[0] += 1
+                entry[1] = max(entry[1], stamp)
+
+    def rank(self, prefix, port, path, old_octet=None):
+        """返回 1~255 的探测顺序"""
+        path = path.split("?", 1)[0]
+        hosts = self.seen.get((prefix, str(port), path), {})
+        order = sorted(hosts, key=lambda o: (-hosts[o][0], -hosts[o][1], o))
+
+        if old_octet is not None:
+            for step in range(1, 255):
+                for o in (old_octet - step, old_octet + step):
+                    if 1 <= o <= 255:
+                        order.append(o)
+
+        ordered, seen = [], {old_octet}
+        for o in order + list(range(1, 256)):
+            if o not in seen:
+                seen.add(o)
+                ordered.append(o)
+        if old_octet is not None and 1 <= old_octet <= 255:
+            ordered.append(old_octet)  # 旧 IP 刚被判定失效，放到最后
+        return ordered
+
+
+def build_index(history_dir=HISTORY_DIR, extra=EXTRA_SOURCES):
+    index = HostIndex()
+    now_stamp = int(datetime.now().strftime("%m%d%H%M"))
+    history = History(history_dir)
+    names = history.names(".m3u")
+    for name in names:
+        index.add_text(history.read_text(name), file_stamp(name, now_stamp))
+    for path in extra:
+        if path.exists():
+            index.add_text(path.read_text(encoding="utf-8", errors="ignore"), 0)
+    print(f"🧭 历史候选索引：{len(names) + len(extra)} 个文件，{len(index.seen)} 个 (网段, 端口, 路径)", flush=True)
+    return index
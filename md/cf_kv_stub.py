@@ -0,0 +1,85 @@
+"""
+本地模拟 Cloudflare KV API，用于在不访问 Cloudflare 的情况下测试 kv_upload_simple.py
+
+支持:
+    PUT /client/v4/accounts/{a}/storage/kv/namespaces/{n}/values/{key}   单 Key 写入
+    PUT /client/v4/accounts/{a}/storage/kv/namespaces/{n}/bulk           批量写入 (JSON 数组，支持 base64)
+    GET /_stats                                                          请求计数与已存 Key
+前 FAIL_FIRST 个写入请求返回 503，用于验证退避重试。
+
+用法:
+    python md/cf_kv_stub.py [端口] [FAIL_FIRST]
+    CF_API_BASE=http://127.0.0.1:端口/client/v4 CF_ACCOUNT_ID=a CF_KV_NAMESPACE_ID=n CF_API_TOKEN=t \\
+        python md/kv_upload_simple.py
+"""
+import base64
+import json
+import re
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+NS_RE = re.compile(r"^/client/v4/accounts/[^/]+/storage/kv/namespaces/[^/]+/(values/(.+)|bulk)$")
+
+
+class Handler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    store = {}
+    stats = Counter()
+    fail_first = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/_stats":
+            with self.lock:
+                return self._send(200, {"requests": dict(self.stats), "keys": sorted(self.store)})
+        self._send(404, {"success": False})
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        m = NS_RE.match(self.path)
+        with self.lock:
+            kind = "bulk" if m and m.group(1) == "bulk" else "values"
+            self.stats[f"PUT {kind}"] += 1
+            if not m:
+                return self._send(404, {"success": False})
+            if Handler.fail_first > 0:
+                Handler.fail_first -= 1
+                self.stats["503"] += 1
+                return self._send(503, {"success": False, "errors": [{"message": "injected failure"}]})
+            if kind == "bulk":
+                for item in json.loads(body):
+                    value = item["value"]
+                    self.store[item["key"]] = base64.b64decode(value) if item.get("base64") else value.encode("utf-8")
+            else:
+                self.store[unquote(m.group(2))] = body
+        self._send(200, {"success": True, "errors": [], "messages": [], "result": None})
+
+
+def serve(port=0, fail_first=0):
+    """启动模拟服务 (后台线程)，返回 (server, base_url)"""
+    Handler.fail_first = int(fail_first)
+    server = ThreadingHTTPServer(("127.0.0.1", int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/client/v4"
+
+
+if __name__ == "__main__":
+    server, url = serve(*sys.argv[1:3])
+    print(f"🧪 模拟 Cloudflare KV API: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,80 @@
+"""
+频道名解析器：把各来源的原始频道名映射为 alias.txt 中的主名
+
+精确别名归一化后放进字典，含 * 的通配别名编译成一条合并正则，
+查询结果做记忆化；test22 / test_check / format_output 共用。
+"""
+import os
+import re
+from functools import lru_cache
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+ALIAS_FILE = os.path.join(CURRENT_DIR, "alias.txt")
+
+STRIP_RE = re.compile(r"[-_ .]")
+QUALITY_RE = re.compile(r'\s*[\(\[（【]?(?:HD|SD|高清|标清|超清)[\)\]）】]?\s*', re.I)
+
+
+def normalize(name):
+    """去掉 - _ 空格 . 并转大写，作为别名比较的键"""
+    return STRIP_RE.sub("", name).upper()
+
+
+class AliasResolver:
+    def __init__(self, path=ALIAS_FILE):
+        self.aliases = {}  # 主名 -> 别名集合 (含主名本身)
+        self.exact = {}    # 归一化别名 -> 主名，alias.txt 中靠前的条目优先
+        wildcards = []     # (正则片段, 主名)
+
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line or line.startswith("#"):
+                        continue
+                    parts = [p.strip() for p in line.split(",") if p.strip()]
+                    if not parts:
+                        continue
+                    # 主名本身也可以是通配写法 (如 *HOY TV)，输出时去掉 *
+                    main = parts[0].replace("*", "").strip() or parts[0]
+                    self.aliases[main] = set(parts)
+                    for alias in parts:
+                        if "*" in alias:
+                            pattern = ".*".join(re.escape(normalize(p)) for p in alias.split("*"))
+                            wildcards.append((pattern, main))
+                        else:
+                            self.exact.setdefault(normalize(alias), main)
+
+        self._wild_mains = [main for _, main in wildcards]
+        self._wild_re = re.compile(
+            "|".join(f"(?P<w{i}>{pattern})" for i, (pattern, _) in enumerate(wildcards))
+        ) if wildcards else None
+        self.resolve = lru_cache(maxsize=None)(self._resolve)
+
+    def _lookup(self, key):
+        main = self.exact.get(key)
+        if main is None and self._wild_re is not None:
+            m = self._wild_re.fullmatch(key)
+            if m:
+                main = self._wild_mains[int(m.lastgroup[1:])]
+        return main
+
+    def _resolve(self, name):
+        """原始频道名 -> 主名；先按原名匹配，再去掉画质标记重试，都不中返回 None"""
+        main = self._lookup(normalize(name))
+        if main is None:
+            stripped = QUALITY_RE.sub("", name)
+            if stripped != name:
+                main = self._lookup(normalize(stripped))
+        return main
+
+
+_default = None
+
+
+def resolve(name):
+    """使用默认 alias.txt 解析频道名"""
+    global _default
+    if _default is None:
+        _default = AliasResolver()
+    return _default.resolve(name)
@@ -0,0 +1,123 @@
+"""
+频道列表解析 / 输出：M3U (#EXTINF + URL) 与 "表头,#genre#" 分段 TXT 两种格式
+
+解析器都是逐行流式的生成器，输入可以是文件路径、已打开的文件、
+HTTP 响应或任意字符串行序列；记录对象用 __slots__ 压缩内存。
+"""
+import os
+import re
+
+M3U_HEADER = '#EXTM3U x-tvg-url="https://live.fanmingming.com/e.xml"'
+GROUP_RE = re.compile(r'group-title="([^"]*)"')
+
+
+class Channel:
+    __slots__ = ("name", "url", "group", "extinf")
+
+    def __init__(self, name, url, group=None, extinf=None):
+        self.name = name
+        self.url = url
+        self.group = group
+        self.extinf = extinf
+
+    def __repr__(self):
+        return f"Channel({self.name!r}, {self.url!r})"
+
+
+class HostBlock:
+    """一个 "ip:port,#genre#" 段 (表头也可以是分组名) 及其下的频道"""
+    __slots__ = ("host", "channels")
+
+    def __init__(self, host, channels=None):
+        self.host = host
+        self.channels = channels if channels is not None else []
+
+    def __repr__(self):
+        return f"HostBlock({self.host!r}, {len(self.channels)} channels)"
+
+
+def read_lines(source):
+    """文件路径 / 文本或二进制流 / requests 流式响应 / 字符串序列 -> 逐行产出 str"""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding="utf-8", errors="ignore") as f:
+            yield from f
+        return
+    if hasattr(source, "iter_lines"):
+        for line in source.iter_lines():
+            yield line.decode("utf-8", "ignore") if isinstance(line, bytes) else line
+        return
+    for line in source:
+        yield line.decode("utf-8", "ignore") if isinstance(line, bytes) else line
+
+
+def iter_m3u(source):
+    """
+    逐条产出 M3U 频道：每个非注释行是一个 URL，前面最近的 #EXTINF 是它的描述
+    没有 #EXTINF 的 URL 也会产出 (extinf 为 None)，由调用方决定取舍
+    """
+    extinf = None
+    for raw in read_lines(source):
+        line = raw.strip()
+        if not line:
+            continue
+        if line.startswith("#EXTINF"):
+            extinf = line
+        elif not line.startswith("#"):
+            if extinf is None:
+                yield Channel("", line)
+            else:
+                name = extinf.split(",", 1)[-1].strip() if "," in extinf else ""
+                m = GROUP_RE.search(extinf)
+                yield Channel(name, line, m.group(1) if m else None, extinf)
+            extinf = None
+
+
+def iter_blocks(source):
+    """逐段产出 HostBlock；第一个表头之前的频道行与不含逗号的行忽略"""
+    block = None
+    for raw in read_lines(source):
+        line = raw.strip()
+        if not line:
+            continue
+        if "#genre#" in line:
+            if block is not None:
+                yield block
+            block = HostBlock(line.split(",")[0].strip())
+        elif block is not None and "," in line:
+            name, url = line.split(",", 1)
+            block.channels.append(Channel(name.strip(), url.strip(), block.host))
+    if block is not None:
+        yield block
+
+
+def format_block(block):
+    """HostBlock -> "host,#genre#\\nname,url\\n..." (以换行结尾)"""
+    return f"{block.host},#genre#\n" + "".join(f"{c.name},{c.url}\n" for c in block.channels)
+
+
+def write_blocks(f, blocks):
+    """把 HostBlock 逐段写入已打开的文本文件，段与段之间空一行"""
+    for block in blocks:
+        f.write(format_block(block))
+        f.write("\n")
+
+
+def format_extinf(channel, group=None, logo=None):
+    """按需生成 #EXTINF 行；已有原始 #EXTINF 且未指定覆盖项时原样返回"""
+    if channel.extinf and group is None and logo is None:
+        return channel.extinf
+    attrs = f' tvg-id="{channel.name}"'
+    if logo:
+        attrs += f' tvg-logo="{logo}"'
+    group = group if group is not None else channel.group
+    if group:
+        attrs += f' group-title="{group}"'
+    return f"#EXTINF:-1{attrs},{channel.name}"
+
+
+def write_m3u(f, channels, header=M3U_HEADER):
+    """把 Channel 逐条写成 M3U"""
+    f.write(header + "\n")
+    for channel in channels:
+        f.write(format_extinf(channel) + "\n")
+        f.write(channel.url + "\n")
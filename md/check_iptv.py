@@ -1,4 +1,11 @@
-import os, requests, re, sys
+import os, re, sys
+
+import metrics
+from adaptive import make_controller
+from channel_list import iter_blocks, write_blocks
+from host_history import HostHistory
+from liveness_cache import LivenessCache
+from probe import conclusive, iter_async, verify
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 MANUAL_FIX = os.path.join(CURRENT_DIR, "manual_fix.txt")
@@ -6,39 +13,83 @@ MID_REVIVED = os.path.join(CURRENT_DIR, "revived_temp.txt")
 MID_DEAD = os.path.join(CURRENT_DIR, "dead_tasks.txt")
 
 TIMEOUT = 3
+MAX_CONCURRENCY = 500
+VERIFY_SAMPLES = 4  # 每个网段抽检的频道数，共用一条 keep-alive 连接
 
-def check_url(url):
-    try:
-        with requests.get(url, timeout=TIMEOUT, stream=True, headers={"User-Agent":"VLC/3.0"}) as r:
-            return r.status_code == 200
-    except: return False
+def skip_by_history(blocks, history):
+    """按主机历史挑出本轮不必探测的块 -> {序号: 沿用的上次结果 True/False}"""
+    skipped = {}
+    if history is None:
+        return skipped
+    for idx, block in enumerate(blocks):
+        if not history.due(block.host):
+            skipped[idx] = history.last_up(block.host)
+            mark = "✅ 沿用存活" if skipped[idx] else "💀 沿用失效"
+            print(f"⏭️ {mark}: {block.host} ({history.state(block.host)}，"
+                  f"第 {history.next_run(block.host)} 次运行再探测)", flush=True)
+    return skipped
 
-def main():
-    if not os.path.exists(MANUAL_FIX): return
+def check_blocks(blocks, cache=None, history=None):
+    """
+    体检 HostBlock 列表 -> (存活块, 失效块)，均保持原始顺序；存活块剔除抽检中确认失效的频道
 
-    with open(MANUAL_FIX, 'r', encoding='utf-8') as f:
-        blocks = [b.strip() for b in f.read().split('\n\n') if b.strip()]
-    
+    history 为 HostHistory 时按主机历史跳过稳定存活 / 长期失效的主机 (沿用上次结果)，并记录本轮观测。
+    """
+    skipped = skip_by_history(blocks, history)
+    # 每个网段抽检多个频道，全部并发体检
+    checked = {}
+    done = 0
+    controller = make_controller("体检", MAX_CONCURRENCY, TIMEOUT)
+    results = verify(((idx, [c.url for c in b.channels]) for idx, b in enumerate(blocks) if idx not in skipped),
+                     samples=VERIFY_SAMPLES, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY,
+                     cache=cache, controller=controller)
+    with metrics.phase("probe"):
+        for idx, res in iter_async(results):
+            done += 1
+            checked[idx] = res
+            base_host = blocks[idx].host
+            if history is not None and conclusive(res):
+                # 抽检全部存活 (或全部失效) 时结果可原样沿用；剔除过频道的下一轮照常体检
+                history.record(base_host, any(res.values()), reusable=all(res.values()) or not any(res.values()))
+            if any(res.values()):
+                print(f"[{done}/{len(blocks)}] ✅ 存活: {base_host} (抽检 {list(res.values()).count(True)}/{len(res)})", flush=True)
+            else:
+                print(f"[{done}/{len(blocks)}] 💀 失效 -> 送入抢救队列: {base_host}", flush=True)
+    if controller:
+        controller.summary()
+
+    # 按原始顺序返回，保证结果稳定
     revived_list, dead_list = [], []
-    
     for idx, block in enumerate(blocks):
-        lines = [l.strip() for l in block.split('\n') if l.strip()]
-        if len(lines) < 2: continue
-        
-        base_host = lines[0].split(',')[0].strip()
-        test_url = lines[1].split(',', 1)[1].strip()
-        
-        print(f"[{idx+1}/{len(blocks)}] ⚖️ 体检: {base_host}", flush=True)
-        
-        if check_url(test_url):
-            print("  ✅ 存活", flush=True)
-            revived_list.append(block + "\n\n")
+        if idx in skipped:
+            (revived_list if skipped[idx] else dead_list).append(block)
+            continue
+        res = checked[idx]
+        if any(res.values()):
+            block.channels = [c for c in block.channels if res.get(c.url) is not False]
+            revived_list.append(block)
         else:
-            print("  💀 失效 -> 送入抢救队列", flush=True)
-            dead_list.append(block + "\n\n")
+            dead_list.append(block)
+    return revived_list, dead_list
+
+def load_blocks(path=MANUAL_FIX):
+    with metrics.phase("parse"):
+        return [b for b in iter_blocks(path) if b.channels]
+
+def main():
+    if not os.path.exists(MANUAL_FIX): return
 
-    with open(MID_REVIVED, 'w', encoding='utf-8') as f: f.writelines(revived_list)
-    with open(MID_DEAD, 'w', encoding='utf-8') as f: f.writelines(dead_list)
+    cache = LivenessCache()
+    history = HostHistory("host")
+    revived_list, dead_list = check_blocks(load_blocks(), cache, history)
+    history.close()
+    cache.close()
+    
+    with metrics.phase("write"):
+        with open(MID_REVIVED, 'w', encoding='utf-8') as f: write_blocks(f, revived_list)
+        with open(MID_DEAD, 'w', encoding='utf-8') as f: write_blocks(f, dead_list)
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("体检"):
+        main()
+    metrics.write_report()
@@ -1,13 +1,22 @@
 import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import os
 
+from history_pack import History
+
 # --- 配置 ---
 HISTORY_FOLDER = Path("history")
 # 要保留的文件的类型。merged.* 文件通常需要保留。
 FILE_PATTERNS = ["*.m3u", "*.txt"]
 # 保留策略: 'earliest' (保留时间戳最早的文件), 'latest' (保留时间戳最新的文件)
 RETENTION_POLICY = 'earliest' 
+# 哈希清单: { 文件名: [大小, 哈希] }，文件名与大小都没变就直接复用上次的哈希。
+# 不比较 mtime: CI 每次 checkout 都会重置 mtime，快照文件写出后也不会再改
+MANIFEST_PATH = Path(__file__).resolve().parent / ".cache" / "cleanup_manifest.json"
+READ_BUFFER = 1024 * 1024
+HASH_WORKERS = 8
 # ---------------
 
 def get_file_hash(file_path):
@@ -15,20 +24,39 @@ def get_file_hash(file_path):
     hasher = hashlib.sha256()
     # 以二进制模式分块读取文件，处理大文件
     with open(file_path, 'rb') as f:
-        while chunk := f.read(4096):
+        while chunk := f.read(READ_BUFFER):
             hasher.update(chunk)
     return hasher.hexdigest()
 
+def load_manifest():
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(MANIFEST_PATH)
+
 def cleanup_duplicate_files():
     print(f"🧹 开始清理 {HISTORY_FOLDER} 文件夹中的重复文件...")
     
     # 结构: { 文件类型: { 内容哈希: [文件路径列表 (按时间戳排序)] } }
     duplicates = {}
+    manifest = load_manifest()
+    new_manifest = {}
+    history = History(HISTORY_FOLDER)
+    stats = {"skipped": 0, "cached": 0, "hashed": 0}
     
     for pattern in FILE_PATTERNS:
         # 只处理带时间戳的备份文件，忽略 'merged' 文件
         files_to_check = [f for f in HISTORY_FOLDER.glob(pattern) 
                           if not f.name.startswith("merged.")]
+        # 已打包进归档的快照也参与比较 (大小与哈希取自记录头)，但不能单独删除
+        packed = {HISTORY_FOLDER / name for name in history.names(pattern[1:]) if history.is_packed(name)}
+        files_to_check += packed
         
         # 按文件名（即时间戳）排序文件，确保保留策略的正确性
         # 文件名如 logo12081157.m3u，sorted() 默认按字母顺序排，时间戳越小越靠前
@@ -36,17 +64,53 @@ def cleanup_duplicate_files():
         
         duplicates[pattern] = {}
         
+        # 先按大小分组：大小独一无二的文件不可能重复，无需计算哈希
+        by_size = {}
         for file_path in files_to_check:
             try:
-                file_hash = get_file_hash(file_path)
+                size = history.size(file_path.name)
+            except OSError as e:
+                print(f"警告：无法读取文件 {file_path}: {e}")
+                continue
+            by_size.setdefault(size, []).append((file_path, size))
                 
-                if file_hash not in duplicates[pattern]:
-                    duplicates[pattern][file_hash] = []
+        to_hash = []
+        digests = {}
+        for group in by_size.values():
+            if len(group) == 1:
+                stats["skipped"] += 1
+                continue
+            for file_path, size in group:
+                entry = manifest.get(file_path.name)
+                if file_path in packed:
+                    digests[file_path] = history.digest(file_path.name)
+                elif entry and len(entry) == 2 and entry[0] == size:
+                    digests[file_path] = entry[1]
+                    stats["cached"] += 1
+                else:
+                    to_hash.append(file_path)
                     
-                duplicates[pattern][file_hash].append(file_path)
-                
+        # 大小相同且清单未命中的文件并发计算哈希
+        with ThreadPoolExecutor(HASH_WORKERS) as pool:
+            futures = {file_path: pool.submit(get_file_hash, file_path) for file_path in to_hash}
+        for file_path, future in futures.items():
+            try:
+                digests[file_path] = future.result()
+                stats["hashed"] += 1
             except Exception as e:
                 print(f"警告：无法读取文件 {file_path}: {e}")
+
+        for file_path in files_to_check:
+            file_hash = digests.get(file_path)
+            if file_hash is None:
+                continue
+            if file_path not in packed:
+                new_manifest[file_path.name] = [history.size(file_path.name), file_hash]
+
+            if file_hash not in duplicates[pattern]:
+                duplicates[pattern][file_hash] = []
+
+            duplicates[pattern][file_hash].append(file_path)
     
     total_removed = 0
     
@@ -58,7 +122,12 @@ def cleanup_duplicate_files():
             if len(file_list) > 1:
                 
                 # 保留的文件索引
-                if RETENTION_POLICY == 'latest':
+                kept = [f for f in file_list if f in packed]
+                if kept:
+                    # 归档中已有同内容的快照：保留它，散文件全部删除
+                    file_to_keep = kept[0]
+                    files_to_delete = [f for f in file_list if f not in packed]
+                elif RETENTION_POLICY == 'latest':
                     # 文件列表已按时间戳从小到大排序，保留最后一个
                     file_to_keep = file_list[-1]
                     files_to_delete = file_list[:-1]
@@ -74,11 +143,15 @@ def cleanup_duplicate_files():
                 for f_path in files_to_delete:
                     try:
                         os.remove(f_path)
+                        new_manifest.pop(f_path.name, None)
                         print(f"❌ 删除重复项: {f_path.name}")
                         total_removed += 1
                     except Exception as e:
                         print(f"警告：删除文件 {f_path} 失败: {e}")
                         
+    save_manifest(new_manifest)
+    print(f"\n📊 本次统计：大小唯一跳过 {stats['skipped']} 个，清单命中 {stats['cached']} 个，"
+          f"计算哈希 {stats['hashed']} 个，删除 {total_removed} 个")
     print(f"\n✅ 清理完成！共删除 {total_removed} 个重复的备份文件。")
 
 if __name__ == "__main__":
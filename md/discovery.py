@@ -1,6 +1,13 @@
-import os, requests, re, sys
+import asyncio
+import os, re, sys
 from urllib.parse import urlparse
-from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from adaptive import make_controller
+from candidates import build_index, last_octet
+from channel_list import iter_blocks
+from liveness_cache import LivenessCache
+from probe import probe, sweep
 
 # --- 基础配置 ---
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -9,15 +16,10 @@ MERGED_SOURCE = os.path.join(PARENT_DIR, "history", "merged.txt")
 MANUAL_FIX = os.path.join(CURRENT_DIR, "manual_fix.txt")
 
 TIMEOUT = 2
-MAX_THREADS_CHECK = 100
-MAX_THREADS_SCAN = 60 # 稍微提高爆破效率
-
-def check_url(url):
-    try:
-        with requests.get(url, timeout=TIMEOUT, stream=True, headers={"User-Agent":"VLC/3.0"}) as r:
-            return r.status_code == 200
-    except:
-        return False
+MAX_CONCURRENCY_CHECK = 1000
+MAX_CONCURRENCY_SCAN = 128
+SCAN_WORKERS = 4                     # 同时爆破的失效网段数
+SCAN_QUEUE_SIZE = 2 * SCAN_WORKERS   # 待爆破队列上限，爆破跟不上时阶段 1 在此等待
 
 def get_existing_ip_ports():
     """从现有的 manual_fix.txt 中提取所有 IP:端口，确保彻底去重"""
@@ -33,79 +35,123 @@ def get_existing_ip_ports():
             print(f"⚠️ 读取现有库失败: {e}")
     return ip_ports
 
-def main():
-    if not os.path.exists(MERGED_SOURCE):
-        print(f"❌ 错误：找不到源文件 {MERGED_SOURCE}")
-        return
+def rescue_job(base_ip_port, channels):
+    """失效 ip:port -> 爆破任务 (prefix, port, path, 旧 IP)；不是 ip:port 时返回 None"""
+    ip_parts = base_ip_port.split(':')
+    if len(ip_parts) != 2: return None
+    ip, port = ip_parts
+    prefix = '.'.join(ip.split('.')[:-1])
 
-    # 1. 初始化已存在集合（这是去重的关键）
-    existing_set = get_existing_ip_ports()
-    print(f"📑 现有库检测：已存在 {len(existing_set)} 个唯一网段。")
+    # 获取请求路径
+    sample_url = channels[0].url
+    path = sample_url.split(base_ip_port)[-1]
+    return prefix, port, path, ip
 
-    # 2. 解析原始网段
-    ip_groups = {}
-    with open(MERGED_SOURCE, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            line = line.strip()
-            if "," not in line or "http" not in line: continue
-            parts = line.split(',', 1)
-            url = parts[1].strip()
-            ip_port = urlparse(url).netloc
-            if ip_port:
-                if ip_port not in ip_groups: ip_groups[ip_port] = []
-                ip_groups[ip_port].append(line)
+async def discover(ip_groups, existing_set, cache):
+    """
+    阶段 1 体检与阶段 2 爆破重叠执行，返回 {ip_port: block_text}
 
+    阶段 1 每判定一个失效网段就放入有界队列，由 SCAN_WORKERS 个爆破协程立即开扫；
+    爆破结果等阶段 1 结束后再按失效网段排序统一去重，结果与先体检后爆破一致。
+    """
     final_results_dict = {} # 使用字典存储 {ip_port: block_text} 实现自动去重
     to_rescue = []
+    hits = {}    # 失效 ip_port -> 爆破出的存活主机
+    sweeps = {}  # (prefix, port, path) -> Task，相同网段只扫一次
+    queue = asyncio.Queue(maxsize=SCAN_QUEUE_SIZE)
+    index = build_index()
+    check_controller = make_controller("发现-体检", MAX_CONCURRENCY_CHECK, TIMEOUT)
+    # 各爆破协程共用一个全局池；关闭自适应时每个网段各自限 MAX_CONCURRENCY_SCAN
+    scan_controller = make_controller("发现-爆破", MAX_CONCURRENCY_SCAN * SCAN_WORKERS, TIMEOUT)
 
-    # --- 阶段 1：全量体检 ---
-    print(f"\n📡 阶段 1：全量体检开始...")
-    with ThreadPoolExecutor(max_workers=MAX_THREADS_CHECK) as executor:
-        future_to_ip = {executor.submit(check_url, data[0].split(',')[1]): ip for ip, data in ip_groups.items()}
-        for future in as_completed(future_to_ip):
-            ip_port = future_to_ip[future]
-            if future.result():
+    async def scanner():
+        while True:
+            base_ip_port = await queue.get()
+            if base_ip_port is None:
+                return
+            job = rescue_job(base_ip_port, ip_groups[base_ip_port])
+            if job is None: continue
+            prefix, port, path, ip = job
+            if (prefix, port, path) not in sweeps:
+                # 发现模式要收集网段内全部存活主机，因此不提前结束
+                hosts = index.rank(prefix, port, path, old_octet=last_octet(ip))
+                sweeps[(prefix, port, path)] = asyncio.ensure_future(sweep(
+                    prefix, port, path, hosts=hosts, stop_after=None, timeout=TIMEOUT,
+                    concurrency=MAX_CONCURRENCY_SCAN, cache=cache, controller=scan_controller))
+            hits[base_ip_port] = (await sweeps[(prefix, port, path)]).hosts
+
+    # --- 阶段 1：全量体检 (失效网段同时送入阶段 2) ---
+    print(f"\n📡 阶段 1：全量体检开始，失效网段即时送入爆破队列...")
+    url_to_ip = {data[0].url: ip for ip, data in ip_groups.items()}
+    workers = [asyncio.ensure_future(scanner()) for _ in range(SCAN_WORKERS)]
+    try:
+        async for res in probe(url_to_ip, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY_CHECK, cache=cache,
+                               controller=check_controller):
+            ip_port = url_to_ip[res.url]
+            if res.ok:
                 # 查重：库里没有 且 还没被本次扫描记入
                 if ip_port not in existing_set:
                     print(f"  ✅ [新发现-存活] {ip_port}")
-                    block = f"{ip_port},#genre#\n" + "\n".join(ip_groups[ip_port]) + "\n\n"
+                    block = f"{ip_port},#genre#\n" + "\n".join(f"{ch.name},{ch.url}" for ch in ip_groups[ip_port]) + "\n\n"
                     final_results_dict[ip_port] = block
                     existing_set.add(ip_port) # 实时标记已存在，防止阶段2重复命中
             else:
                 to_rescue.append(ip_port)
+                await queue.put(ip_port)  # 队列满时在此等待
+
+        # --- 阶段 2：等待剩余爆破完成 ---
+        if to_rescue:
+            print(f"\n🚀 阶段 2：爆破失效网段 (数量:{len(to_rescue)}, 已完成:{len(hits)})...")
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers + list(sweeps.values()):
+            task.cancel()
+    for controller in (check_controller, scan_controller):
+        if controller:
+            controller.summary()
 
-    # --- 阶段 2：失效 IP 爆破 ---
-    if to_rescue:
-        print(f"\n🚀 阶段 2：爆破失效网段 (数量:{len(to_rescue)})...")
-        to_rescue.sort()
-        for base_ip_port in to_rescue:
-            ip_parts = base_ip_port.split(':')
-            if len(ip_parts) != 2: continue
-            ip, port = ip_parts
-            prefix = '.'.join(ip.split('.')[:-1])
-            channels = ip_groups[base_ip_port]
-            
-            # 获取请求路径
-            sample_url = channels[0].split(',')[1]
-            path = sample_url.split(base_ip_port)[-1]
-            
-            test_tasks = {f"http://{prefix}.{i}:{port}{path}": f"{prefix}.{i}:{port}" for i in range(1, 256)}
-            
-            with ThreadPoolExecutor(max_workers=MAX_THREADS_SCAN) as executor:
-                future_to_url = {executor.submit(check_url, url): target_ip for url, target_ip in test_tasks.items()}
-                for future in as_completed(future_to_url):
-                    target_ip = future_to_url[future]
-                    if future.result():
-                        # 核心查重：防止爆破出的 IP 与 库内 或 阶段1 冲突
-                        if target_ip not in existing_set:
-                            print(f"  ✨ [命中新源!!] -> {target_ip}")
-                            new_block = f"{target_ip},#genre#\n"
-                            for ch in channels:
-                                name, old_url = ch.split(',', 1)
-                                new_url = old_url.replace(base_ip_port, target_ip)
-                                new_block += f"{name},{new_url}\n"
-                            final_results_dict[target_ip] = new_block + "\n"
-                            existing_set.add(target_ip) # 再次实时标记
+    for base_ip_port in sorted(to_rescue):
+        channels = ip_groups[base_ip_port]
+        for target_ip in hits.get(base_ip_port, []):
+            # 核心查重：防止爆破出的 IP 与 库内 或 阶段1 冲突
+            if target_ip not in existing_set:
+                print(f"  ✨ [命中新源!!] -> {target_ip}")
+                new_block = f"{target_ip},#genre#\n"
+                for ch in channels:
+                    new_url = ch.url.replace(base_ip_port, target_ip)
+                    new_block += f"{ch.name},{new_url}\n"
+                final_results_dict[target_ip] = new_block + "\n"
+                existing_set.add(target_ip) # 再次实时标记
+    return final_results_dict
+
+def main():
+    if not os.path.exists(MERGED_SOURCE):
+        print(f"❌ 错误：找不到源文件 {MERGED_SOURCE}")
+        return
+
+    # 1. 初始化已存在集合（这是去重的关键）
+    existing_set = get_existing_ip_ports()
+    print(f"📑 现有库检测：已存在 {len(existing_set)} 个唯一网段。")
+
+    # 2. 解析原始网段
+    ip_groups = {} # 结构: { ip_port: [Channel, ...] }
+    with metrics.phase("parse"):
+        for group in iter_blocks(MERGED_SOURCE):
+            for ch in group.channels:
+                if "http" not in ch.url: continue
+                ip_port = urlparse(ch.url).netloc
+                if ip_port:
+                    if ip_port not in ip_groups: ip_groups[ip_port] = []
+                    ip_groups[ip_port].append(ch)
+
+    cache = LivenessCache()
+    try:
+        with metrics.phase("probe"):
+            final_results_dict = asyncio.run(discover(ip_groups, existing_set, cache))
+    finally:
+        cache.close()
 
     # 3. 写入文件
     if final_results_dict:
@@ -115,7 +161,7 @@ def main():
 
         if unique_final:
             print(f"\n💾 写入中：过滤重复后，本次实际新增 {len(unique_final)} 个网段。")
-            with open(MANUAL_FIX, 'a', encoding='utf-8') as f:
+            with metrics.phase("write"), open(MANUAL_FIX, 'a', encoding='utf-8') as f:
                 content = "".join(unique_final)
                 if os.path.exists(MANUAL_FIX) and os.path.getsize(MANUAL_FIX) > 0:
                     # 确保文件末尾有且只有一个空行再追加
@@ -128,4 +174,6 @@ def main():
         print("\n📭 本次扫描未发现新网段。")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("发现"):
+        main()
+    metrics.write_report()
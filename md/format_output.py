@@ -1,5 +1,18 @@
+import hashlib
+import json
 import os
 import re
+import zlib
+
+import metrics
+from channel_alias import resolve
+from channel_list import Channel, HostBlock, format_block, format_extinf, iter_blocks
+from playlist_delta import build_delta, etag, host_sort_key, read_m3u_blocks, write_delta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PARENT_DIR = os.path.dirname(CURRENT_DIR)
@@ -7,66 +20,219 @@ MID_REVIVED = os.path.join(CURRENT_DIR, "revived_temp.txt")
 MID_RESCUED = os.path.join(CURRENT_DIR, "rescued_temp.txt")
 OUTPUT_TXT = os.path.join(PARENT_DIR, "final_hotel.txt")
 OUTPUT_M3U = os.path.join(PARENT_DIR, "final_hotel.m3u")
+# 各产物的大小 / SHA-256 / ETag 及预压缩版本，供 CDN / KV 直接下发压缩字节、跳过未变化的文件
+OUTPUT_MANIFEST = os.path.join(PARENT_DIR, "final_hotel.manifest.json")
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11  # 安装了 brotli 时额外写出 .br
 
 LOGO_BASE_URL = "https://tb.yubo.qzz.io/logo/"
 EPG_URL = "https://live.fanmingming.com/e.xml"
 
 def clean_channel_name(name):
     """
-    清理频道名称中的 HD, SD, 高清, 标清 标记
+    统一频道名称：alias.txt 收录的直接映射为主名，
+    未收录的清理其中的 HD, SD, 高清, 标清 标记
     """
+    canonical = resolve(name)
+    if canonical:
+        return canonical
     # 1. 移除 (HD), [HD], -HD 等括号或连字符包装的标记
     # 2. 移除独立的 HD, SD, 高清, 标清 关键字 (不区分大小写)
     # \s* 代表匹配可能存在的空格
     name = re.sub(r'\s*[\(\[（【]?(?:HD|SD|高清|标清)[\)\]）】]?\s*', '', name, flags=re.IGNORECASE)
     return name.strip()
 
-def main():
-    all_blocks = []
-    for path in [MID_REVIVED, MID_RESCUED]:
-        if os.path.exists(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                if content:
-                    blocks = [b.strip() for b in content.split('\n\n') if b.strip()]
-                    all_blocks.extend(blocks)
-
-    if not all_blocks:
-        print("❌ 未发现有效数据。")
-        return
+class _Variant:
+    """一个输出文件 (原文或某种压缩编码)：写入临时文件的同时计算大小与 SHA-256"""
+
+    def __init__(self, path, compressor=None):
+        self.path = path
+        self.tmp = path + ".tmp"
+        self.compressor = compressor
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.f = open(self.tmp, 'wb')
+
+    def _emit(self, data):
+        if data:
+            self.f.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+
+    def write(self, data):
+        self._emit(self.compressor.process(data) if self.compressor else data)
+
+    def finish(self):
+        if self.compressor:
+            self._emit(self.compressor.finish())
+        self.f.close()
+        digest = self.sha256.hexdigest()
+        return {"path": os.path.basename(self.path), "size": self.size, "sha256": digest, "etag": etag(digest)}
+
+    def abort(self):
+        self.f.close()
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+class _Gzip:
+    # mtime 为 0、不带文件名，内容不变时 .gz 逐字节不变
+    def __init__(self):
+        self.z = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def process(self, data):
+        return self.z.compress(data)
+
+    def finish(self):
+        return self.z.flush()
+
+class Artifact:
+    """
+    一个输出产物及其预压缩版本 (.gz，安装了 brotli 时还有 .br)，一次写入同时喂给全部版本；
+    commit() 把临时文件依次改名为正式文件并返回清单条目，abort() 删除临时文件
+    """
+
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.variants = {"identity": _Variant(path), "gzip": _Variant(path + ".gz", _Gzip())}
+        if brotli is not None:
+            self.variants["br"] = _Variant(path + ".br", brotli.Compressor(quality=BROTLI_QUALITY))
 
-    # 1. 生成 TXT (保持原始块结构，但清理名称)
-    cleaned_blocks = []
-    for block in all_blocks:
-        lines = block.split('\n')
-        new_block_lines = [lines[0]] # 保留 IP,#genre# 行
-        for line in lines[1:]:
-            if ',' in line:
-                name, url = line.split(',', 1)
-                new_name = clean_channel_name(name)
-                new_block_lines.append(f"{new_name},{url.strip()}")
-        cleaned_blocks.append('\n'.join(new_block_lines))
-
-    with open(OUTPUT_TXT, 'w', encoding='utf-8') as f:
-        f.write('\n\n'.join(cleaned_blocks))
-
-    # 2. 生成 M3U
-    m3u_lines = [f'#EXTM3U x-tvg-url="{EPG_URL}"']
-    for block in cleaned_blocks:
-        lines = block.split('\n')
-        group_title = lines[0].split(',')[0].strip()
-        for line in lines[1:]:
-            if ',' in line:
-                name, url = line.split(',', 1)
-                # 此时 name 已经是清理过的了
-                clean_n = name.strip()
-                m3u_lines.append(f'#EXTINF:-1 tvg-id="{clean_n}" tvg-logo="{LOGO_BASE_URL}{clean_n}.png" group-title="{group_title}",{clean_n}')
-                m3u_lines.append(url.strip())
-
-    with open(OUTPUT_M3U, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(m3u_lines))
+    def write(self, text):
+        data = text.encode('utf-8')
+        for variant in self.variants.values():
+            variant.write(data)
+
+    def commit(self):
+        entries = {name: variant.finish() for name, variant in self.variants.items()}
+        for variant in self.variants.values():
+            os.replace(variant.tmp, variant.path)
+        entry = entries.pop("identity")
+        entry["content_type"] = self.content_type
+        entry["encodings"] = entries
+        return entry
+
+    def abort(self):
+        for variant in self.variants.values():
+            variant.abort()
+
+def load_manifest(path=OUTPUT_MANIFEST):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(manifest, path=OUTPUT_MANIFEST):
+    """清单只含内容派生的字段，产物不变时清单也不变"""
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp, path)
+
+class OutputWriter:
+    """
+    逐块接收 HostBlock：到达时即清理名称并格式化好 TXT 段与 M3U 行，
+    close() 时按规范顺序 (主机，见 playlist_delta.host_sort_key；同一主机按 key) 排序，
+    单次遍历同时写出 TXT / M3U 及其压缩版本，输出与到达顺序、存活 / 抢救归属无关；
+    全部写完后才改名替换正式文件，中途失败不会留下半截输出。
+    与上次发布的 M3U 相比有变化时序号加一，并写出差分 (见 playlist_delta.py)
+    """
+
+    def __init__(self):
+        self.parts = {}  # key -> (主机, TXT 段, [M3U 行])
+
+    def add(self, key, block):
+        # 在副本上清理名称，不改动调用方的块
+        cleaned = HostBlock(block.host, [Channel(clean_channel_name(ch.name), ch.url, ch.group)
+                                         for ch in block.channels])
+        m3u_lines = []
+        for ch in cleaned.channels:
+            m3u_lines.append(format_extinf(ch, group=block.host, logo=f"{LOGO_BASE_URL}{ch.name}.png"))
+            m3u_lines.append(ch.url)
+        self.parts[key] = (block.host, format_block(cleaned).rstrip('\n'), m3u_lines)
+
+    def close(self):
+        """写出 final_hotel.txt / final_hotel.m3u、预压缩版本与清单，返回是否写出"""
+        if not self.parts:
+            print("❌ 未发现有效数据。")
+            return False
     
-    print(f"🎉 处理完成，画质标记已剔除。网段总数: {len(all_blocks)}")
+        ordered = sorted(self.parts, key=lambda k: (host_sort_key(self.parts[k][0]), k))
+        new_blocks = {}  # 主机 -> [(#EXTINF 行, URL)]，用于与上次发布比较
+        with metrics.phase("write"):
+            old_blocks, old_etag = read_m3u_blocks(OUTPUT_M3U)
+            # TXT 保持原始块结构 (名称已清理)，块之间空一行；M3U 先写 EPG 头
+            txt = Artifact(OUTPUT_TXT, "text/plain; charset=utf-8")
+            m3u = Artifact(OUTPUT_M3U, "audio/x-mpegurl; charset=utf-8")
+            try:
+                m3u.write(f'#EXTM3U x-tvg-url="{EPG_URL}"')
+                for i, key in enumerate(ordered):
+                    host, block_txt, lines = self.parts[key]
+                    txt.write(('\n\n' if i else '') + block_txt)
+                    if lines:
+                        m3u.write('\n' + '\n'.join(lines))
+                        new_blocks.setdefault(host, []).extend(zip(lines[::2], lines[1::2]))
+            except BaseException:
+                txt.abort()
+                m3u.abort()
+                raise
+            files = {os.path.basename(a.path): a.commit() for a in (txt, m3u)}
+            manifest = self.publish_delta(files, old_blocks, old_etag, new_blocks)
+            write_manifest(manifest)
+
+        print(f"🎉 处理完成，画质标记已剔除。网段总数: {len(self.parts)}")
+        for name, entry in files.items():
+            sizes = " / ".join(f"{enc} {e['size']}" for enc, e in entry["encodings"].items())
+            print(f"📦 {name}: {entry['size']} 字节 ({sizes})，ETag {entry['etag']}")
+        return True
+
+    @staticmethod
+    def publish_delta(files, old_blocks, old_etag, new_blocks):
+        """与上次发布比较，有变化时写出差分 -> 新清单 (含序号与最新差分)"""
+        previous = load_manifest()
+        seq, latest = previous.get("seq", 0), previous.get("delta")
+        new_etag = files[os.path.basename(OUTPUT_M3U)]["etag"]
+        if old_blocks is None:
+            # 没有上次的输出可比，只推进序号，客户端需下载完整文件
+            seq, latest = seq + 1, None
+            print(f"🧾 序号 {seq}：没有上次的 {os.path.basename(OUTPUT_M3U)}，不生成差分")
+        elif old_etag != new_etag:
+            # 只有块顺序变化时差分为空，客户端应用后按规范顺序重排即可
+            seq += 1
+            path, data = write_delta(build_delta(old_blocks, new_blocks, seq, old_etag, new_etag))
+            digest = hashlib.sha256(data).hexdigest()
+            latest = {"seq": seq, "path": os.path.relpath(path, PARENT_DIR).replace(os.sep, "/"),
+                      "size": len(data), "sha256": digest, "etag": etag(digest)}
+            st = json.loads(data)["stats"]
+            print(f"🧾 序号 {seq}：块 +{st['blocks_added']} / -{st['blocks_removed']} / "
+                  f"~{st['blocks_changed']}，频道行 +{st['lines_added']} / -{st['lines_removed']}，"
+                  f"差分 {len(data)} 字节")
+        return {"seq": seq, "files": files, "delta": latest}
+
+def format_blocks(all_blocks):
+    """把 HostBlock 列表写成 final_hotel.txt / final_hotel.m3u，返回是否写出"""
+    writer = OutputWriter()
+    with metrics.phase("format"):
+        for idx, block in enumerate(all_blocks):
+            writer.add(idx, block)
+    return writer.close()
+
+def main():
+    # 中转文件不入库，只由同一次运行的 check_iptv / rescue_hotel 写出；都不存在时不发布空列表
+    paths = [path for path in [MID_REVIVED, MID_RESCUED] if os.path.exists(path)]
+    if not paths:
+        print("❌ 未找到 revived_temp.txt / rescued_temp.txt，请先运行 check_iptv.py 与 rescue_hotel.py "
+              "(或直接运行 pipeline.py)")
+        return
+    all_blocks = []
+    with metrics.phase("parse"):
+        for path in paths:
+            all_blocks.extend(iter_blocks(path))
+    format_blocks(all_blocks)
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("发布"):
+        main()
+    metrics.write_report()
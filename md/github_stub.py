@@ -0,0 +1,203 @@
+"""
+本地模拟 GitHub API，用于在不访问 GitHub 的情况下测试 history.py
+
+把一个本地目录当作仓库内容，支持:
+    GET    /repos/{o}/{r}/contents/{path}        逐目录列表 (download_url 指向本服务的 /raw/)
+    GET    /raw/{path}                           文件内容
+    DELETE /repos/{o}/{r}/contents/{path}        单文件删除
+    GET    /repos/{o}/{r}/git/trees/{ref}?recursive=1
+    GET    /repos/{o}/{r}/git/ref/heads/{branch}
+    GET    /repos/{o}/{r}/git/commits/{sha}
+    POST   /repos/{o}/{r}/git/trees | git/commits
+    PATCH  /repos/{o}/{r}/git/refs/heads/{branch}
+    GET    /_stats                               各类请求计数
+
+用法:
+    python md/github_stub.py [仓库目录] [端口]
+    GITHUB_API_URL=http://127.0.0.1:端口 PERSONAL_ACCESS_TOKEN=x python md/history.py --tree
+删除只作用于内存中的仓库状态，不会改动磁盘文件。
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+REPO_RE = re.compile(r"^/repos/[^/]+/[^/]+/(.*)$")
+
+
+def blob_sha(data):
+    """与 git hash-object 相同的 blob SHA"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _object_sha(kind, payload):
+    return hashlib.sha1(f"{kind}:{json.dumps(payload, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+
+class FakeRepo:
+    def __init__(self, root):
+        self.lock = threading.Lock()
+        self.blobs = {}  # blob SHA -> bytes
+        files = {}       # 路径 -> blob SHA
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+            for name in filenames:
+                full = os.path.join(dirpath, name)
+                with open(full, "rb") as f:
+                    data = f.read()
+                sha = blob_sha(data)
+                self.blobs[sha] = data
+                files[os.path.relpath(full, root).replace(os.sep, "/")] = sha
+        self.trees = {}
+        self.commits = {}
+        tree = self._put_tree(files)
+        self.head = self._put_commit("initial", tree, [])
+        self.stats = Counter()
+
+    def _put_tree(self, files):
+        sha = _object_sha("tree", files)
+        self.trees[sha] = dict(files)
+        return sha
+
+    def _put_commit(self, message, tree, parents):
+        sha = _object_sha("commit", {"message": message, "tree": tree, "parents": parents})
+        self.commits[sha] = {"sha": sha, "message": message, "tree": {"sha": tree}, "parents": parents}
+        return sha
+
+    def files(self):
+        return self.trees[self.commits[self.head]["tree"]["sha"]]
+
+
+class Handler(BaseHTTPRequestHandler):
+    repo = None
+    base_url = ""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=None, raw=None):
+        data = raw if raw is not None else json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if raw is not None else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        path, query = url.path, url.query
+        repo = self.repo
+        with repo.lock:
+            m = REPO_RE.match(path)
+            parts = (m.group(1) if m else path.lstrip("/")).split("/")
+            repo.stats[f"{method} {'/'.join(parts[:2] if parts[0] == 'git' else parts[:1])}"] += 1
+            if path == "/_stats":
+                return self._send(200, dict(repo.stats))
+            if method == "GET" and path.startswith("/raw/"):
+                sha = repo.files().get(path[len("/raw/"):])
+                return self._send(200, raw=repo.blobs[sha]) if sha else self._send(404, {"message": "Not Found"})
+
+            if not m:
+                return self._send(404, {"message": "Not Found"})
+            route = m.group(1)
+            files = repo.files()
+
+            if route.startswith("contents/"):
+                target = route[len("contents/"):].strip("/")
+                if method == "DELETE":
+                    if target not in files:
+                        return self._send(404, {"message": "Not Found"})
+                    remaining = {p: s for p, s in files.items() if p != target}
+                    repo.head = repo._put_commit(self._body().get("message", ""), repo._put_tree(remaining), [repo.head])
+                    return self._send(200, {"commit": {"sha": repo.head}})
+                prefix = target + "/"
+                items, dirs = [], set()
+                for p, sha in sorted(files.items()):
+                    if not p.startswith(prefix):
+                        continue
+                    rest = p[len(prefix):]
+                    if "/" in rest:
+                        sub = rest.split("/", 1)[0]
+                        if sub not in dirs:
+                            dirs.add(sub)
+                            items.append({"type": "dir", "name": sub, "path": prefix + sub})
+                    else:
+                        items.append({"type": "file", "name": rest, "path": p, "sha": sha,
+                                      "size": len(repo.blobs[sha]), "download_url": f"{self.base_url}/raw/{p}"})
+                return self._send(200, items) if items else self._send(404, {"message": "Not Found"})
+
+            if method == "GET" and route.startswith("git/trees/"):
+                ref = route[len("git/trees/"):]
+                tree_sha = repo.commits[repo.head]["tree"]["sha"] if ref not in repo.trees else ref
+                entries = [{"path": p, "mode": "100644", "type": "blob", "sha": sha, "size": len(repo.blobs[sha])}
+                           for p, sha in sorted(repo.trees[tree_sha].items())]
+                if "recursive" in query:
+                    dirs = sorted({p.rsplit("/", i)[0] for p in repo.trees[tree_sha]
+                                   for i in range(1, p.count("/") + 1)})
+                    entries += [{"path": d, "mode": "040000", "type": "tree", "sha": tree_sha} for d in dirs]
+                return self._send(200, {"sha": tree_sha, "tree": entries, "truncated": False})
+            if method == "GET" and route.startswith("git/ref/heads/"):
+                return self._send(200, {"object": {"sha": repo.head, "type": "commit"}})
+            if method == "GET" and route.startswith("git/commits/"):
+                commit = repo.commits.get(route[len("git/commits/"):])
+                return self._send(200, commit) if commit else self._send(404, {"message": "Not Found"})
+            if method == "POST" and route == "git/trees":
+                body = self._body()
+                new = dict(repo.trees[body["base_tree"]])
+                for entry in body["tree"]:
+                    if entry.get("sha") is None:
+                        new.pop(entry["path"], None)
+                    else:
+                        new[entry["path"]] = entry["sha"]
+                return self._send(201, {"sha": repo._put_tree(new)})
+            if method == "POST" and route == "git/commits":
+                body = self._body()
+                return self._send(201, {"sha": repo._put_commit(body["message"], body["tree"], body["parents"])})
+            if method == "PATCH" and route.startswith("git/refs/heads/"):
+                body = self._body()
+                if not body.get("force") and repo.head not in repo.commits[body["sha"]]["parents"]:
+                    return self._send(422, {"message": "Update is not a fast forward"})
+                repo.head = body["sha"]
+                return self._send(200, {"object": {"sha": repo.head}})
+            return self._send(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+def serve(root=PARENT_DIR, port=0):
+    """启动模拟服务 (后台线程)，返回 (server, base_url)"""
+    Handler.repo = FakeRepo(root)
+    server = ThreadingHTTPServer(("127.0.0.1", int(port)), Handler)
+    Handler.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, Handler.base_url
+
+
+if __name__ == "__main__":
+    server, url = serve(*sys.argv[1:3])
+    print(f"🧪 模拟 GitHub API: {url} ({len(Handler.repo.files())} 个文件)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -4,6 +4,7 @@ import hashlib
 import json
 import os
 import re
+import sys
 from datetime import datetime
 
 # ========== 配置 ==========
@@ -14,6 +15,7 @@ DIRECTORY = "history"
 FILE_PATTERN = r'^(logo|tvbox_)\d{8}\.(m3u|txt)$'  # 匹配 logoMMDDHHMM.m3u 或 tvbox_MMDDHHMM.txt
 OUTPUT_FILE = "duplicate_history_files.txt"
 GITHUB_TOKEN = os.getenv('PERSONAL_ACCESS_TOKEN')  # 必须：用于 API 删除文件，需 public_repo 权限
+API_BASE = os.getenv('GITHUB_API_URL', 'https://api.github.com')  # 可指向本地模拟服务 (md/github_stub.py)
 
 HEADERS = {
     'Accept': 'application/vnd.github.v3+json',
@@ -26,7 +28,7 @@ else:
 
 def get_github_contents(repo_owner, repo_name, path, branch='main', recursive=False):
     """递归获取 GitHub 目录/文件内容"""
-    api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{path}?ref={branch}"
+    api_url = f"{API_BASE}/repos/{repo_owner.strip('/')}/{repo_name}/contents/{path}?ref={branch}"
     files = []
     try:
         response = requests.get(api_url, headers=HEADERS)
@@ -60,7 +62,7 @@ def get_file_content(item):
 
 def delete_file(file_path, sha):
     """通过 GitHub API 删除文件"""
-    api_url = f"https://api.github.com/repos/{REPO_OWNER}/{REPO_NAME}/contents/{file_path}"
+    api_url = repo_api(f"contents/{file_path}")
     data = {
         'message': f'Delete duplicate file {file_path}',
         'sha': sha,
@@ -75,6 +77,113 @@ def delete_file(file_path, sha):
         print(f"❌ 删除失败 {file_path}: {e}")
         return False
 
+def repo_api(path):
+    return f"{API_BASE}/repos/{REPO_OWNER.strip('/')}/{REPO_NAME}/{path}"
+
+def get_tree_files(branch=BRANCH, directory=DIRECTORY):
+    """
+    一次请求取回整棵 git 树 (recursive=1)，每个条目自带 blob SHA (即内容哈希)，
+    无需逐个下载文件；树过大被截断时返回 None，由调用方退回逐目录模式
+    """
+    response = requests.get(repo_api(f"git/trees/{branch}?recursive=1"), headers=HEADERS)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('truncated'):
+        return None
+    prefix = directory.rstrip('/') + '/'
+    files = []
+    for item in data['tree']:
+        name = item['path'].rsplit('/', 1)[-1]
+        if item['type'] == 'blob' and item['path'].startswith(prefix) and re.match(FILE_PATTERN, name):
+            files.append({'path': item['path'], 'name': name, 'size': item.get('size', 0), 'sha': item['sha']})
+    return files
+
+def delete_files_batched(paths, message, branch=BRANCH):
+    """
+    一次提交删除多个文件：读分支头 -> 基于原树建一棵删掉这些路径的新树 -> 建提交 -> 移动分支
+    共 5 次请求，与删除的文件数无关
+    """
+    ref = requests.get(repo_api(f"git/ref/heads/{branch}"), headers=HEADERS)
+    ref.raise_for_status()
+    head_sha = ref.json()['object']['sha']
+    commit = requests.get(repo_api(f"git/commits/{head_sha}"), headers=HEADERS)
+    commit.raise_for_status()
+    base_tree = commit.json()['tree']['sha']
+
+    tree = requests.post(repo_api("git/trees"), headers=HEADERS, json={
+        'base_tree': base_tree,
+        'tree': [{'path': p, 'mode': '100644', 'type': 'blob', 'sha': None} for p in paths],
+    })
+    tree.raise_for_status()
+    new_commit = requests.post(repo_api("git/commits"), headers=HEADERS, json={
+        'message': message,
+        'tree': tree.json()['sha'],
+        'parents': [head_sha],
+    })
+    new_commit.raise_for_status()
+    # 不强制推进：期间分支有新提交时这里会失败，下次运行重新计算即可
+    update = requests.patch(repo_api(f"git/refs/heads/{branch}"), headers=HEADERS,
+                            json={'sha': new_commit.json()['sha'], 'force': False})
+    update.raise_for_status()
+    return new_commit.json()['sha']
+
+def check_duplicates_tree():
+    """按 git 树中的 blob SHA 分组查重，重复文件在一次提交中批量删除，保留时间戳最新的文件"""
+    print(f"🔍 [树模式] 检查 {REPO_OWNER}/{REPO_NAME}/{DIRECTORY} 中的 logo*.m3u 和 tvbox_*.txt 重复文件...")
+    start_time = datetime.now()
+
+    try:
+        files = get_tree_files()
+    except requests.exceptions.RequestException as e:
+        print(f"❌ 获取 git 树失败: {e}")
+        return
+    if files is None:
+        print("⚠️ git 树过大被截断，退回逐目录模式")
+        check_duplicates()
+        return
+    print(f"📋 发现 {len(files)} 个目标文件 (1 次请求)")
+
+    sha_map = {}
+    for item in files:
+        timestamp_match = re.search(r'\d{8}', item['name'])
+        item['timestamp'] = timestamp_match.group(0) if timestamp_match else '00000000'
+        sha_map.setdefault(item['sha'], []).append(item)
+
+    duplicates = {h: items for h, items in sha_map.items() if len(items) > 1}
+    for file_list in duplicates.values():
+        file_list.sort(key=lambda x: x['timestamp'], reverse=True)
+    to_delete = [info['path'] for file_list in duplicates.values() for info in file_list[1:]]
+
+    deleted_count = 0
+    if to_delete:
+        try:
+            commit_sha = delete_files_batched(to_delete, f"Delete {len(to_delete)} duplicate history files")
+            deleted_count = len(to_delete)
+            print(f"🗑️ 已在提交 {commit_sha[:7]} 中删除 {deleted_count} 个重复文件")
+        except requests.exceptions.RequestException as e:
+            print(f"❌ 批量删除失败: {e}")
+
+    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f:
+        f.write(f"重复文件检查报告 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"仓库: {REPO_OWNER}/{REPO_NAME}/{DIRECTORY}\n")
+        f.write(f"总文件数: {len(files)}\n")
+        f.write(f"重复文件数: {len(to_delete)}\n")
+        f.write(f"删除文件数: {deleted_count}\n\n")
+        for blob_sha, file_list in duplicates.items():
+            f.write(f"blob SHA: {blob_sha}\n")
+            f.write(f"重复文件数: {len(file_list)}\n")
+            f.write(f"保留文件: {file_list[0]['path']} (时间戳: {file_list[0]['timestamp']})\n")
+            for file_info in file_list[1:]:
+                f.write(f"- 删除: {file_info['path']} (时间戳: {file_info['timestamp']})\n")
+                f.write(f"  名称: {file_info['name']} (大小: {file_info['size']} bytes)\n")
+            f.write("---\n\n")
+        if not duplicates:
+            f.write("🎉 未发现重复文件\n")
+
+    print(f"✅ 发现 {len(to_delete)} 个重复文件，删除 {deleted_count} 个，详情保存到 {OUTPUT_FILE}" if duplicates
+          else "🎉 未发现重复文件")
+    print(f"⏱️ 完成，用时: {datetime.now() - start_time}")
+
 def check_duplicates():
     """检查并删除重复文件，保留时间戳最新的文件"""
     print(f"🔍 开始检查 {REPO_OWNER}/{REPO_NAME}/{DIRECTORY} 中的 logo*.m3u 和 tvbox_*.txt 重复文件...")
@@ -152,4 +261,8 @@ def check_duplicates():
     print(f"⏱️ 完成，用时: {end_time - start_time}")
 
 if __name__ == "__main__":
-    check_duplicates()
+    # --tree: 按 git 树的 blob SHA 查重并批量删除；默认沿用逐文件下载计算 MD5 的方式
+    if "--tree" in sys.argv:
+        check_duplicates_tree()
+    else:
+        check_duplicates()
@@ -0,0 +1,410 @@
+"""
+history 快照打包：按行差分 + 定期关键帧 + 逐条压缩
+
+每个系列 (logo*.m3u / tvbox_*.txt) 按时间顺序切成若干段 (history/pack/<系列>.<序号>.hpk)，
+段内第一条是完整快照 (关键帧)，其后每条只存相对上一条的行级差分；
+每条记录单独压缩 (优先 zstd，未安装时用 zlib)，记录头带压缩后长度、原始长度与原文 SHA-256，
+读取某个快照只需解压它所在段中它之前的记录，不必解开整个归档；比较大小与内容摘要只读记录头。
+与系列中已有快照内容完全相同的快照不再打包 (与 cleanup_history 一样保留最早的一份)。
+
+用法:
+    python md/history_pack.py pack [--remove]   把 history/ 中尚未打包的快照追加进归档 (--remove 打包校验后删除原文件)
+                                                Generate 工作流每次运行 pack --remove，history/ 下只留 merged.* 与归档
+    python md/history_pack.py list              列出归档中的快照
+    python md/history_pack.py cat <时间戳|文件名> 输出某个快照
+    python md/history_pack.py unpack <目录>      还原全部快照到目录
+    python md/history_pack.py verify            逐个还原并与 history/ 中仍存在的原文件逐字节比对
+
+读取方 (merge_tvlist / test_check / candidates / cleanup_history / kv_upload_simple) 都经由 History，
+按文件名列出、读取快照，不关心它已经打包还是仍是散文件。
+"""
+import hashlib
+import io
+import os
+import re
+import struct
+import sys
+import zlib
+from datetime import datetime
+from difflib import SequenceMatcher
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+HISTORY_DIR = Path(PARENT_DIR) / "history"
+PACK_DIR = HISTORY_DIR / "pack"
+KEYFRAME_EVERY = 32  # 每段记录数，即关键帧间隔
+
+MAGIC = b"HPK1"
+KEYFRAME, DELTA = 0, 1
+RECORD_HEAD = struct.Struct(">BHII32s")  # 类型, 文件名长度, 压缩后长度, 原始长度, 原文 SHA-256
+SNAPSHOT_RE = re.compile(r"^(.*?)(\d{8})(\.\w+)$")
+STAMP_PATTERN = re.compile(r'(\d{8})')
+
+
+def file_stamp(name, now_stamp):
+    """logoMMDDHHMM.m3u -> 可比较的时间戳；比当前时刻还大的视为去年的快照"""
+    m = STAMP_PATTERN.search(name)
+    if not m:
+        return 0
+    stamp = int(m.group(1))
+    return stamp - 100000000 if stamp > now_stamp else stamp
+
+
+def _compress(codec, data):
+    if codec == b"s":
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    return zlib.compress(data, 9)
+
+
+def _decompress(codec, data):
+    if codec == b"s":
+        if zstandard is None:
+            raise RuntimeError("该段使用 zstd 压缩，需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def encode_delta(base, lines):
+    """
+    行级差分: C(起始, 行数) 复制上一快照的行，I(行数, 各行) 插入新行
+    行保留原始换行符，还原结果与原文件逐字节一致
+    """
+    out = []
+    matcher = SequenceMatcher(None, base, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            out.append(b"C" + struct.pack(">II", i1, i2 - i1))
+        elif j2 > j1:
+            out.append(b"I" + struct.pack(">I", j2 - j1))
+            for line in lines[j1:j2]:
+                out.append(struct.pack(">I", len(line)) + line)
+    return b"".join(out)
+
+
+def apply_delta(base, delta):
+    lines, pos = [], 0
+    while pos < len(delta):
+        op = delta[pos:pos + 1]
+        if op == b"C":
+            start, count = struct.unpack_from(">II", delta, pos + 1)
+            lines.extend(base[start:start + count])
+            pos += 9
+        elif op == b"I":
+            (count,) = struct.unpack_from(">I", delta, pos + 1)
+            pos += 5
+            for _ in range(count):
+                (size,) = struct.unpack_from(">I", delta, pos)
+                lines.append(delta[pos + 4:pos + 4 + size])
+                pos += 4 + size
+        else:
+            raise ValueError(f"无效的差分操作 {op!r}")
+    return lines
+
+
+def series_of(name):
+    """logo01010232.m3u -> ('logo_m3u', '01010232')；不是快照文件名时返回 None"""
+    m = SNAPSHOT_RE.match(name)
+    if not m or name.startswith("merged."):
+        return None
+    return f"{m.group(1).rstrip('_')}_{m.group(3)[1:]}", m.group(2)
+
+
+class Segment:
+    """一个 .hpk 段文件：文件头 (魔数 + 压缩算法) 之后是连续的记录"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.codec = None
+        self.records = []  # [(类型, 文件名, 数据偏移, 数据长度, 原始长度, 原文 SHA-256)]
+        self._cursor = None  # (记录序号, 行列表)：顺序读取时从上次读到的位置继续应用差分
+        if self.path.exists():
+            self._scan()
+
+    def _scan(self):
+        """只读记录头，跳过压缩数据"""
+        with open(self.path, "rb") as f:
+            head = f.read(5)
+            if head[:4] != MAGIC:
+                raise ValueError(f"{self.path} 不是快照归档")
+            self.codec = head[4:5]
+            while True:
+                raw = f.read(RECORD_HEAD.size)
+                if len(raw) < RECORD_HEAD.size:
+                    break
+                kind, name_len, size, raw_size, digest = RECORD_HEAD.unpack(raw)
+                name = f.read(name_len).decode("utf-8")
+                self.records.append((kind, name, f.tell(), size, raw_size, digest.hex()))
+                f.seek(size, os.SEEK_CUR)
+
+    def names(self):
+        return [record[1] for record in self.records]
+
+    def iter_lines(self, stop=None):
+        """依次还原段内快照 -> (文件名, 行列表)，到 stop 为止"""
+        lines = []
+        with open(self.path, "rb") as f:
+            for kind, name, offset, size, *_ in self.records:
+                f.seek(offset)
+                payload = _decompress(self.codec, f.read(size))
+                lines = payload.splitlines(keepends=True) if kind == KEYFRAME else apply_delta(lines, payload)
+                yield name, lines
+                if name == stop:
+                    return
+
+    def lines_at(self, index):
+        """还原第 index 条记录的行；从上次读到的位置 (或段首) 继续，按顺序读完整段只解压一遍"""
+        start, lines = self._cursor if self._cursor and self._cursor[0] <= index else (-1, None)
+        with open(self.path, "rb") as f:
+            for kind, _, offset, size, *_ in self.records[start + 1:index + 1]:
+                f.seek(offset)
+                payload = _decompress(self.codec, f.read(size))
+                lines = payload.splitlines(keepends=True) if kind == KEYFRAME else apply_delta(lines, payload)
+        self._cursor = (index, lines)
+        return lines
+
+    def append(self, name, data, base_lines=None):
+        """追加一条记录；段为空时写关键帧，否则写相对 base_lines 的差分"""
+        if not self.records:
+            self.codec = b"s" if zstandard is not None else b"z"
+            with open(self.path, "wb") as f:
+                f.write(MAGIC + self.codec)
+        lines = data.splitlines(keepends=True)
+        if self.records:
+            kind, payload = DELTA, encode_delta(base_lines, lines)
+        else:
+            kind, payload = KEYFRAME, data
+        payload = _compress(self.codec, payload)
+        encoded = name.encode("utf-8")
+        digest = hashlib.sha256(data).digest()
+        with open(self.path, "ab") as f:
+            f.write(RECORD_HEAD.pack(kind, len(encoded), len(payload), len(data), digest) + encoded)
+            offset = f.tell()
+            f.write(payload)
+        self.records.append((kind, name, offset, len(payload), len(data), digest.hex()))
+        return lines
+
+
+class HistoryPack:
+    """一个系列的全部段；按追加顺序 (即时间顺序) 排列"""
+
+    def __init__(self, series, pack_dir=PACK_DIR, keyframe_every=KEYFRAME_EVERY):
+        self.series = series
+        self.pack_dir = Path(pack_dir)
+        self.keyframe_every = keyframe_every
+        paths = sorted(self.pack_dir.glob(f"{series}.*.hpk"), key=lambda p: int(p.name.split(".")[-2]))
+        self.segments = [Segment(p) for p in paths]
+        self._where = {name: (seg, i) for seg in self.segments for i, name in enumerate(seg.names())}
+        self._tail = None  # 最后一条快照的行，追加差分时复用
+
+    def names(self):
+        return [name for seg in self.segments for name in seg.names()]
+
+    def __contains__(self, name):
+        return name in self._where
+
+    def stat(self, name):
+        """(原始长度, SHA-256)，只读记录头"""
+        seg, index = self._where[name]
+        return tuple(seg.records[index][4:6])
+
+    def digests(self):
+        return {record[5] for seg in self.segments for record in seg.records}
+
+    def __iter__(self):
+        """按时间顺序还原全部快照 -> (文件名, bytes)；每段只顺序解压一遍"""
+        for seg in self.segments:
+            for name, lines in seg.iter_lines():
+                yield name, b"".join(lines)
+
+    def read(self, key):
+        """按文件名或时间戳 (MMDDHHMM) 还原单个快照；只解压所在段中它之前的记录"""
+        name = key if key in self._where else next((n for n in self._where if series_of(n)[1] == key), None)
+        if name is None:
+            raise KeyError(key)
+        seg, index = self._where[name]
+        return b"".join(seg.lines_at(index))
+
+    def append(self, name, data):
+        if not self.segments or len(self.segments[-1].records) >= self.keyframe_every:
+            self.pack_dir.mkdir(parents=True, exist_ok=True)
+            self.segments.append(Segment(self.pack_dir / f"{self.series}.{len(self.segments):04d}.hpk"))
+            self._tail = None
+        seg = self.segments[-1]
+        if seg.records and self._tail is None:
+            for _, self._tail in seg.iter_lines():
+                pass
+        self._tail = seg.append(name, data, self._tail)
+        self._where[name] = (seg, len(seg.records) - 1)
+
+
+def open_packs(pack_dir=PACK_DIR):
+    """{系列: HistoryPack}"""
+    series = {p.name.rsplit(".", 2)[0] for p in Path(pack_dir).glob("*.hpk")}
+    return {s: HistoryPack(s, pack_dir) for s in sorted(series)}
+
+
+def iter_snapshots(pack_dir=PACK_DIR):
+    """遍历全部归档快照 -> (文件名, bytes)"""
+    for pack in open_packs(pack_dir).values():
+        yield from pack
+
+
+def loose_snapshots(history_dir=HISTORY_DIR):
+    """history/ 中的快照文件，按系列分组并按时间排序 (MMDDHHMM 比当前时刻大的视为去年)"""
+    now_stamp = int(datetime.now().strftime("%m%d%H%M"))
+    groups = {}
+    for path in Path(history_dir).iterdir():
+        parsed = series_of(path.name) if path.is_file() else None
+        if parsed:
+            groups.setdefault(parsed[0], []).append(path)
+    for paths in groups.values():
+        paths.sort(key=lambda p: (file_stamp(p.name, now_stamp), p.name))
+    return groups
+
+
+class History:
+    """
+    history/ 的统一读取入口：归档中的快照 + history/ 下的散文件 (尚未打包的快照、merged.* 等)，
+    同名时以散文件为准
+    """
+
+    def __init__(self, history_dir=HISTORY_DIR, pack_dir=None):
+        self.history_dir = Path(history_dir)
+        packs = open_packs(self.history_dir / "pack" if pack_dir is None else pack_dir)
+        self._packed = {name: hp for hp in packs.values() for name in hp.names()}
+        self._loose = {}
+        if self.history_dir.is_dir():
+            self._loose = {p.name: p for p in self.history_dir.iterdir() if p.is_file()}
+
+    def names(self, suffixes=""):
+        """以 suffixes (字符串或元组) 结尾的文件名，按文件名排序"""
+        return sorted(name for name in self._loose.keys() | self._packed.keys() if name.endswith(suffixes))
+
+    def __contains__(self, name):
+        return name in self._loose or name in self._packed
+
+    def path(self, name):
+        """散文件的路径；已打包的快照返回 None"""
+        return self._loose.get(name)
+
+    def is_packed(self, name):
+        return name not in self._loose and name in self._packed
+
+    def read(self, name):
+        if name in self._loose:
+            return self._loose[name].read_bytes()
+        if name in self._packed:
+            return self._packed[name].read(name)
+        raise KeyError(name)
+
+    def read_text(self, name):
+        return self.read(name).decode("utf-8", "ignore")
+
+    def open(self, name):
+        """与 open(路径, encoding="utf-8", errors="ignore") 行为一致的文本流 (含通用换行)"""
+        return io.StringIO(self.read_text(name), newline=None)
+
+    def size(self, name):
+        if name in self._loose:
+            return self._loose[name].stat().st_size
+        return self._packed[name].stat(name)[0]
+
+    def digest(self, name):
+        """内容的 SHA-256：已打包的取自记录头，散文件现算"""
+        if name in self._loose:
+            return hashlib.sha256(self._loose[name].read_bytes()).hexdigest()
+        return self._packed[name].stat(name)[1]
+
+
+def pack(history_dir=HISTORY_DIR, pack_dir=PACK_DIR, remove=False):
+    """
+    把尚未打包的快照按时间顺序追加进归档；与系列中已打包快照内容相同的不再追加。
+    remove=True 时把归档中的快照还原后与散文件逐字节比对，一致 (或内容重复未打包) 的散文件删除
+    """
+    packs = open_packs(pack_dir)
+    added = skipped = duplicate = removed = 0
+    raw_size = 0
+    for series, paths in sorted(loose_snapshots(history_dir).items()):
+        hp = packs.setdefault(series, HistoryPack(series, pack_dir))
+        digests = hp.digests()
+        for path in paths:
+            if path.name in hp:
+                skipped += 1
+                continue
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            if digest in digests:
+                duplicate += 1
+                continue
+            hp.append(path.name, data)
+            digests.add(digest)
+            raw_size += len(data)
+            added += 1
+        if remove:
+            for path in paths:
+                data = path.read_bytes()
+                if path.name in hp:
+                    same = hp.read(path.name) == data
+                else:
+                    same = hashlib.sha256(data).hexdigest() in digests
+                if same:
+                    path.unlink()
+                    removed += 1
+                else:
+                    print(f"❌ {path.name} 与归档中的内容不一致，保留原文件")
+    packed_size = sum(p.stat().st_size for p in Path(pack_dir).glob("*.hpk"))
+    print(f"📦 新打包 {added} 个快照 ({raw_size / 1e6:.1f} MB)，已在归档中 {skipped} 个，"
+          f"内容重复未打包 {duplicate} 个，删除原文件 {removed} 个；归档总大小 {packed_size / 1e6:.2f} MB")
+
+
+def verify(history_dir=HISTORY_DIR, pack_dir=PACK_DIR):
+    ok = checked = 0
+    for name, data in iter_snapshots(pack_dir):
+        path = Path(history_dir) / name
+        if path.exists():
+            checked += 1
+            if path.read_bytes() == data:
+                ok += 1
+            else:
+                print(f"❌ {name} 还原结果与原文件不一致")
+    print(f"{'✅' if ok == checked else '❌'} 校验 {checked} 个快照，{ok} 个一致")
+    return ok == checked
+
+
+def main(argv):
+    cmd = argv[0] if argv else None
+    if cmd == "pack":
+        pack(remove="--remove" in argv)
+    elif cmd == "list":
+        for series, hp in open_packs().items():
+            for seg in hp.segments:
+                print(f"{seg.path.name}: {' '.join(seg.names())}")
+    elif cmd == "cat" and len(argv) > 1:
+        for hp in open_packs().values():
+            try:
+                sys.stdout.buffer.write(hp.read(argv[1]))
+                return
+            except KeyError:
+                pass
+        print(f"未找到快照 {argv[1]}", file=sys.stderr)
+        sys.exit(1)
+    elif cmd == "unpack" and len(argv) > 1:
+        out = Path(argv[1])
+        out.mkdir(parents=True, exist_ok=True)
+        for name, data in iter_snapshots():
+            (out / name).write_bytes(data)
+    elif cmd == "verify":
+        sys.exit(0 if verify() else 1)
+    else:
+        print(__doc__)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+"""
+跨运行的主机可用性历史与探测排程 (SQLite)
+
+每个键 (主机 ip:port，或爆破任务 网段:端口路径) 保存最近 HISTORY_RUNS 次观测的位图
+(最低位为最近一次，1 = 应答)、连续失效次数与下次应探测的运行序号。
+每次打开 HostHistory 记为该类别的一次运行，据历史决定本轮是否需要探测:
+    稳定存活  最近 RELIABLE_RUNS 次全部应答     每 RELIABLE_INTERVAL 次运行探测一次，其余沿用存活
+    抖动      最近 FLAP_WINDOW 次内状态翻转 >= FLAP_CHANGES 次   每次都探测
+    失效      连续失效                          间隔按 2 的幂次指数退避，上限 MAX_BACKOFF 次运行；
+              历史窗口内应答过的主机先宽限 DEAD_GRACE 次再退避，从未应答过的立即退避
+    新主机    没有历史                          每次都探测
+跳过时调用方沿用上一次的观测结果 (last_up)。record(reusable=False) 表示上次结果不能原样沿用
+(如存活主机抽检时剔除了部分频道、爆破扫到了新主机)，此时下一轮照常探测。
+设置 HOST_SCHEDULE=0 时每次都全量探测，但仍记录历史。
+"""
+import os
+import sqlite3
+from collections import Counter
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.environ.get("HOST_HISTORY", os.path.join(CURRENT_DIR, ".cache", "host_history.sqlite3"))
+ENABLED = os.environ.get("HOST_SCHEDULE", "1") != "0"
+HISTORY_RUNS = 32         # 位图覆盖的观测次数
+RELIABLE_RUNS = 8
+RELIABLE_INTERVAL = 4
+FLAP_WINDOW = 8
+FLAP_CHANGES = 2
+DEAD_GRACE = 3
+MAX_BACKOFF = 32
+PRUNE_AFTER = 4 * MAX_BACKOFF  # 这么多次运行都没有观测的键视为已下线，删除
+MASK = (1 << HISTORY_RUNS) - 1
+
+LABELS = {"new": "新主机", "reliable": "稳定存活", "flapping": "抖动", "recovering": "存活", "dead": "失效",
+          "never": "从未应答"}
+
+
+def classify(bits, seen, streak):
+    """位图与连续失效次数 -> 状态标签"""
+    if not seen:
+        return "new"
+    if streak:
+        return "dead" if bits else "never"
+    window = min(seen, FLAP_WINDOW)
+    changes = bin((bits ^ (bits >> 1)) & ((1 << (window - 1)) - 1)).count("1")
+    if changes >= FLAP_CHANGES:
+        return "flapping"
+    if seen >= RELIABLE_RUNS and bits & ((1 << RELIABLE_RUNS) - 1) == (1 << RELIABLE_RUNS) - 1:
+        return "reliable"
+    return "recovering"
+
+
+def interval(bits, seen, streak):
+    """距下次探测的运行次数"""
+    state = classify(bits, seen, streak)
+    if state == "reliable":
+        return RELIABLE_INTERVAL
+    if state in ("dead", "never"):
+        grace = DEAD_GRACE if state == "dead" else 0
+        return min(MAX_BACKOFF, 2 ** max(0, streak - 1 - grace))
+    return 1
+
+
+class HostHistory:
+    def __init__(self, kind, path=HISTORY_PATH, enabled=ENABLED):
+        """kind 区分不同类别的键 ("host" / "sweep")，各自独立计数运行次数"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.kind = kind
+        self.enabled = enabled
+        self.skipped = Counter()
+        self.probed = 0
+        self._pending = {}
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS runs (kind TEXT PRIMARY KEY, run INTEGER NOT NULL)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " kind TEXT NOT NULL, key TEXT NOT NULL, bits INTEGER NOT NULL, seen INTEGER NOT NULL,"
+            " streak INTEGER NOT NULL, last_run INTEGER NOT NULL, next_run INTEGER NOT NULL,"
+            " reusable INTEGER NOT NULL, PRIMARY KEY (kind, key))")
+        row = self._db.execute("SELECT run FROM runs WHERE kind = ?", (kind,)).fetchone()
+        self.run = (row[0] if row else 0) + 1
+        self._rows = {key: list(rest) for key, *rest in self._db.execute(
+            "SELECT key, bits, seen, streak, last_run, next_run, reusable FROM history WHERE kind = ?", (kind,))}
+
+    def state(self, key):
+        row = self._rows.get(key)
+        return classify(*row[:3]) if row else "new"
+
+    def last_up(self, key):
+        """最近一次观测是否应答；没有历史返回 None"""
+        row = self._rows.get(key)
+        return bool(row[0] & 1) if row and row[1] else None
+
+    def due(self, key):
+        """本轮是否需要探测；不需要时计入跳过统计，调用方沿用 last_up()"""
+        row = self._rows.get(key)
+        if not self.enabled or row is None or not row[5] or self.run >= row[4]:
+            self.probed += 1
+            return True
+        self.skipped[self.state(key)] += 1
+        return False
+
+    def next_run(self, key):
+        row = self._rows.get(key)
+        return row[4] if row else self.run
+
+    def record(self, key, up, reusable=True):
+        bits, seen, streak = self._rows.get(key, [0, 0, 0])[:3]
+        bits = ((bits << 1) | int(bool(up))) & MASK
+        seen = min(seen + 1, HISTORY_RUNS)
+        streak = 0 if up else streak + 1
+        row = [bits, seen, streak, self.run, self.run + interval(bits, seen, streak), int(bool(reusable))]
+        self._rows[key] = row
+        self._pending[key] = row
+
+    def close(self):
+        with self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO history (kind, key, bits, seen, streak, last_run, next_run, reusable)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(self.kind, key, *row) for key, row in self._pending.items()])
+            self._db.execute("INSERT OR REPLACE INTO runs (kind, run) VALUES (?, ?)", (self.kind, self.run))
+            self._db.execute("DELETE FROM history WHERE kind = ? AND last_run < ?",
+                             (self.kind, self.run - PRUNE_AFTER))
+        self._db.close()
+        self._pending = {}
+        if self.skipped:
+            detail = "，".join(f"{LABELS[s]} {n}" for s, n in self.skipped.most_common())
+            print(f"🗓️ [{self.kind}] 第 {self.run} 次运行：探测 {self.probed} | "
+                  f"按历史跳过 {sum(self.skipped.values())} ({detail})", flush=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
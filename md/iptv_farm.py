@@ -0,0 +1,186 @@
+"""
+本地模拟酒店 IPTV 服务器群，用于在不访问真实服务器的情况下压测探测 / 抢救 / 发现流程
+
+在回环地址 127.A.B.0/24 上模拟若干个网段，每个网段:
+    LIVE_PER_SUBNET 个存活主机   正常应答
+    HANG_PER_SUBNET 个假死主机   接受连接但从不应答 (探测端超时)
+    其余主机                     无人监听 (连接被拒绝)
+存活主机支持的路径:
+    /hls/N/index.m3u8   HLS 播放列表 (带 Content-Length，可复用连接)
+    /tsfile/...         持续推流的 TS 数据 (无 Content-Length，发送一段后断开)
+    /udp/... /rtp/...   同 /tsfile/
+    其它                404
+每个请求先等待 LATENCY_MS ± JITTER_MS，再按 ERROR_RATE 返回 500、按 TIMEOUT_RATE 挂起不应答。
+以上参数均可用同名的 FARM_* 环境变量覆盖。Linux 上整个 127.0.0.0/8 都可直接绑定，
+macOS 需先为用到的地址配置 lo0 别名。
+
+用法:
+    python md/iptv_farm.py [网段数] [每段存活数]
+    python md/benchmark.py farm [网段数] [每段存活数]   启动服务器群并压测各流程
+"""
+import asyncio
+import os
+import random
+import sys
+import threading
+from collections import Counter
+
+FIRST_OCTETS = "127.77"                                      # 网段为 127.77.B.0/24
+PORT = int(os.environ.get("FARM_PORT", 18400))
+SUBNETS = int(os.environ.get("FARM_SUBNETS", 16))
+LIVE_PER_SUBNET = int(os.environ.get("FARM_LIVE_PER_SUBNET", 4))
+HANG_PER_SUBNET = int(os.environ.get("FARM_HANG_PER_SUBNET", 2))
+LATENCY_MS = float(os.environ.get("FARM_LATENCY_MS", 20))
+JITTER_MS = float(os.environ.get("FARM_JITTER_MS", 10))
+ERROR_RATE = float(os.environ.get("FARM_ERROR_RATE", 0.02))
+TIMEOUT_RATE = float(os.environ.get("FARM_TIMEOUT_RATE", 0.01))
+SEED = int(os.environ.get("FARM_SEED", 0))
+TS_CHUNK = 188 * 64          # 推流路径每次发送的 TS 包
+MAX_HEADER_BYTES = 16 * 1024
+STREAM_PREFIXES = ("/tsfile/", "/udp/", "/rtp/")
+
+PLAYLIST = (b"#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:1\n"
+            b"#EXTINF:6.0,\nseg1.ts\n#EXTINF:6.0,\nseg2.ts\n")
+
+
+class Farm:
+    """一组回环地址上的模拟 IPTV 主机，在后台线程的事件循环中运行"""
+
+    def __init__(self, subnets=SUBNETS, live_per_subnet=LIVE_PER_SUBNET, hang_per_subnet=HANG_PER_SUBNET,
+                 port=PORT, latency_ms=LATENCY_MS, jitter_ms=JITTER_MS, error_rate=ERROR_RATE,
+                 timeout_rate=TIMEOUT_RATE, seed=SEED):
+        self.port = int(port)
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+        self.prefixes = [f"{FIRST_OCTETS}.{b}" for b in range(1, int(subnets) + 1)]
+        # 每个网段随机挑出存活与假死主机，其余地址无人监听
+        self.live, self.hang = {}, {}
+        for prefix in self.prefixes:
+            octets = self.rng.sample(range(1, 255), int(live_per_subnet) + int(hang_per_subnet))
+            self.live[prefix] = sorted(octets[:int(live_per_subnet)])
+            self.hang[prefix] = sorted(octets[int(live_per_subnet):])
+        self.dead = {prefix: [i for i in range(1, 255) if i not in self.live[prefix] and i not in self.hang[prefix]]
+                     for prefix in self.prefixes}
+        self.loop = None
+        self._servers = []
+        self._ready = threading.Event()
+
+    def live_hosts(self):
+        return [f"{prefix}.{i}:{self.port}" for prefix in self.prefixes for i in self.live[prefix]]
+
+    # --- 服务端 ---
+    async def _respond(self, writer, status, body=b"", stream=False, content_type="application/vnd.apple.mpegurl"):
+        reason = {200: "OK", 404: "Not Found", 500: "Internal Server Error"}[status]
+        head = f"HTTP/1.1 {status} {reason}\r\nServer: farm\r\nContent-Type: {content_type}\r\n"
+        if stream:
+            head += "Connection: close\r\n\r\n"
+        else:
+            head += f"Content-Length: {len(body)}\r\n\r\n"
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _serve_live(self, reader, writer):
+        self.stats["connections"] += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                if len(head) > MAX_HEADER_BYTES:
+                    return
+                request_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+                path = request_line.split(" ")[1] if request_line.count(" ") >= 2 else "/"
+                keep_alive = b"connection: close" not in head.lower()
+                self.stats["requests"] += 1
+
+                await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+                roll = self.rng.random()
+                if roll < self.timeout_rate:
+                    self.stats["timeout"] += 1
+                    await asyncio.sleep(3600)
+                    return
+                if roll < self.timeout_rate + self.error_rate:
+                    self.stats["500"] += 1
+                    await self._respond(writer, 500, b"error")
+                elif path.startswith("/hls/"):
+                    self.stats["200"] += 1
+                    await self._respond(writer, 200, PLAYLIST)
+                elif path.startswith(STREAM_PREFIXES):
+                    self.stats["200"] += 1
+                    self.stats["stream_bytes"] += TS_CHUNK
+                    await self._respond(writer, 200, b"\x47" * TS_CHUNK, stream=True, content_type="video/mp2t")
+                    return
+                else:
+                    self.stats["404"] += 1
+                    await self._respond(writer, 404, b"not found")
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, asyncio.CancelledError):
+            # CancelledError: stop() 取消仍挂着的连接
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_hang(self, reader, writer):
+        # 假死主机：接受连接后不读不写，直到对端放弃
+        self.stats["hang"] += 1
+        try:
+            await reader.read()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _start(self):
+        for prefix in self.prefixes:
+            for i in self.live[prefix]:
+                self._servers.append(await asyncio.start_server(self._serve_live, f"{prefix}.{i}", self.port))
+            for i in self.hang[prefix]:
+                self._servers.append(await asyncio.start_server(self._serve_hang, f"{prefix}.{i}", self.port))
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self._start())
+        self._ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        """在后台线程启动全部主机，返回 self"""
+        threading.Thread(target=self._run, daemon=True).start()
+        self._ready.wait()
+        return self
+
+    async def _shutdown(self):
+        for server in self._servers:
+            server.close()
+        # 先取消仍挂着的连接 (假死主机、挂起的请求)，再停事件循环
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def snapshot(self):
+        """当前计数的副本 (线程安全)"""
+        return asyncio.run_coroutine_threadsafe(self._snapshot(), self.loop).result()
+
+    async def _snapshot(self):
+        return Counter(self.stats)
+
+
+if __name__ == "__main__":
+    farm = Farm(*sys.argv[1:3]).start()
+    print(f"🧪 模拟 IPTV 服务器群: {len(farm.prefixes)} 个网段 ({farm.prefixes[0]}.0/24 起)，"
+          f"存活主机 {len(farm.live_hosts())} 个，端口 {farm.port}")
+    for host in farm.live_hosts()[:5]:
+        print(f"  http://{host}/hls/1/index.m3u8")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        farm.stop()
@@ -1,8 +1,15 @@
 # md/kv_upload_simple.py
+import base64
+import hashlib
+import json
 import os
+import sys
 import requests
-import glob
 import re
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from history_pack import History
 
 # 从环境变量中获取 Secrets
 ACCOUNT_ID = os.environ.get("CF_ACCOUNT_ID")
@@ -13,14 +20,51 @@ if not all([ACCOUNT_ID, NAMESPACE_ID, API_TOKEN]):
     print("错误：缺少 Cloudflare 环境变量。请检查 Secrets 是否已正确设置。")
     exit(1)
 
-CF_URL_BASE = f"https://api.cloudflare.com/client/v4/accounts/{ACCOUNT_ID}/storage/kv/namespaces/{NAMESPACE_ID}/values"
+# CF_API_BASE 可指向本地模拟服务 (md/cf_kv_stub.py)
+CF_API_BASE = os.environ.get("CF_API_BASE", "https://api.cloudflare.com/client/v4")
+CF_NAMESPACE_URL = f"{CF_API_BASE}/accounts/{ACCOUNT_ID}/storage/kv/namespaces/{NAMESPACE_ID}"
+CF_BULK_URL = f"{CF_NAMESPACE_URL}/bulk"
 AUTH_HEADERS = {"Authorization": f"Bearer {API_TOKEN}"}
 
+# 上次成功上传的内容哈希: { KV Key: sha256 }，内容没变的 Key 不再上传
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "kv_manifest.json")
+# 批量写入接口单次上限 10000 个 Key / 100 MB，留出 base64 膨胀的余量
+BULK_MAX_KEYS = 10000
+BULK_MAX_BYTES = 64 * 1024 * 1024
+RETRY_TOTAL = 5
+RETRY_BACKOFF = 1  # 重试间隔 1s, 2s, 4s, ...
+
+def make_session():
+    """带连接池与指数退避重试的会话；429/5xx 与连接错误都会重试"""
+    retry = Retry(total=RETRY_TOTAL, backoff_factor=RETRY_BACKOFF,
+                  status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=["PUT"], respect_retry_after_header=True)
+    session = requests.Session()
+    session.headers.update(AUTH_HEADERS)
+    session.mount("https://", HTTPAdapter(max_retries=retry))
+    session.mount("http://", HTTPAdapter(max_retries=retry))
+    return session
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_manifest(manifest):
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+    tmp = MANIFEST_PATH + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
 def find_latest_timestamp_key():
     """找到 history/ 目录下最新的带时间戳的备份文件，并提取其时间戳。"""
     
     # 查找所有匹配的文件 (logo 或 tvbox 备份)
-    files = glob.glob("history/*_*.m3u") + glob.glob("history/*_*.txt")
+    # 快照可能已打包进 history/pack/，经由 History 列出
+    files = [f"history/{name}" for name in History("history").names((".m3u", ".txt")) if "_" in name]
     
     # 匹配格式 logo[时间戳].m3u 或 tvbox_[时间戳].txt
     pattern_logo = re.compile(r"history/logo(\d{8})\.m3u$")
@@ -44,14 +88,26 @@ def find_latest_timestamp_key():
 
     return latest_timestamp
 
-def upload_kv_files():
-    """执行 KV 上传操作，只上传固定的 6 个文件。"""
+def bulk_batches(pairs):
+    """按批量接口的 Key 数与体积上限切分 [(kv_key, 内容)]"""
+    batch, size = [], 0
+    for kv_key, data in pairs:
+        if batch and (len(batch) >= BULK_MAX_KEYS or size + len(data) > BULK_MAX_BYTES):
+            yield batch
+            batch, size = [], 0
+        batch.append((kv_key, data))
+        size += len(data)
+    if batch:
+        yield batch
+
+def upload_kv_files(force=False):
+    """执行 KV 上传操作：固定的 6 个文件中只有内容变化的才会上传，一次批量写入。"""
     latest_timestamp = find_latest_timestamp_key()
     if not latest_timestamp:
         print("错误：未找到最新的备份文件时间戳。KV 上传中止。")
         return
 
-    print("--- 正在上传 6 个 Key 到 KV 存储 (覆盖固定 Key) ---")
+    print("--- 正在检查 6 个 Key 是否需要上传到 KV 存储 (覆盖固定 Key) ---")
     print(f"使用的最新时间戳：{latest_timestamp}")
 
     # 定义要上传的文件和对应的 KV Key 名称
@@ -69,27 +125,49 @@ def upload_kv_files():
         (f"history/tvbox_{latest_timestamp}.txt", f"history/tvbox_{latest_timestamp}.txt"),
     ]
     
-    
+    manifest = {} if force else load_manifest()
+    changed, digests = [], {}
+    history = History("history")
     for local_file, kv_key in uploads:
-        if not os.path.exists(local_file):
+        name = local_file[len("history/"):] if local_file.startswith("history/") else None
+        if name is not None and name in history:
+            data = history.read(name)
+        elif name is None and os.path.exists(local_file):
+            with open(local_file, 'rb') as f:
+                data = f.read()
+        else:
             print(f"警告：本地文件 {local_file} 不存在，跳过上传。")
             continue
+        digest = hashlib.sha256(data).hexdigest()
+        if manifest.get(kv_key) == digest:
+            print(f"  ⏭️ 内容未变化，跳过 Key: {kv_key}")
+            continue
+        changed.append((kv_key, data))
+        digests[kv_key] = digest
             
-        upload_url = f"{CF_URL_BASE}/{kv_key}"
+    if not changed:
+        print("所有 Key 均未变化，无需上传。")
+        return
         
+    session = make_session()
+    for batch in bulk_batches(changed):
+        payload = [{"key": kv_key, "value": base64.b64encode(data).decode("ascii"), "base64": True}
+                   for kv_key, data in batch]
+        keys = [kv_key for kv_key, _ in batch]
         try:
-            with open(local_file, 'rb') as f:
-                response = requests.put(upload_url, data=f, headers=AUTH_HEADERS)
-            
+            response = session.put(CF_BULK_URL, json=payload, timeout=60)
             if response.status_code == 200 and response.json().get("success"):
-                print(f"  ✅ 成功上传 Key: {kv_key}")
+                for kv_key in keys:
+                    manifest[kv_key] = digests[kv_key]
+                    print(f"  ✅ 成功上传 Key: {kv_key}")
+                save_manifest(manifest)
             else:
-                print(f"  ❌ 上传 Key {kv_key} 失败 (HTTP {response.status_code}): {response.text[:100]}...")
-                
+                print(f"  ❌ 批量上传 {len(keys)} 个 Key 失败 (HTTP {response.status_code}): {response.text[:100]}...")
         except Exception as e:
-            print(f"  致命错误：上传 {local_file} 时发生异常: {e}")
+            print(f"  致命错误：批量上传 {keys} 时发生异常: {e}")
 
     print("Cloudflare KV 文件上传完成。")
 
 if __name__ == "__main__":
-    upload_kv_files()
+    # --force: 忽略清单，6 个 Key 全部重新上传
+    upload_kv_files(force="--force" in sys.argv)
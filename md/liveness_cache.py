@@ -0,0 +1,88 @@
+"""
+跨流程共享的存活缓存 (SQLite)
+
+键为 (ip:port, 路径)，存活与失效结果各有独立的有效期；
+probe.probe(cache=...) 探测前先查缓存，探测后写回。
+"""
+import os
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.environ.get("LIVENESS_CACHE", os.path.join(CURRENT_DIR, ".cache", "liveness.sqlite3"))
+POSITIVE_TTL = int(os.environ.get("LIVENESS_POSITIVE_TTL", 2 * 3600))  # 存活结果有效期 (秒)
+NEGATIVE_TTL = int(os.environ.get("LIVENESS_NEGATIVE_TTL", 30 * 60))   # 失效结果有效期 (秒)
+FLUSH_EVERY = 500
+
+
+def _split(url):
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    return parts.netloc, path
+
+
+class LivenessCache:
+    def __init__(self, path=CACHE_PATH, positive_ttl=POSITIVE_TTL, negative_ttl=NEGATIVE_TTL):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._pending = []
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS liveness ("
+            " host TEXT NOT NULL, path TEXT NOT NULL, ok INTEGER NOT NULL, checked REAL NOT NULL,"
+            " PRIMARY KEY (host, path))")
+
+    def get(self, url):
+        """返回未过期的缓存结果 True/False；没有或已过期返回 None"""
+        host, path = _split(url)
+        row = self._db.execute(
+            "SELECT ok, checked FROM liveness WHERE host = ? AND path = ?", (host, path)).fetchone()
+        if row:
+            ok, checked = bool(row[0]), row[1]
+            if time.time() - checked < (self.positive_ttl if ok else self.negative_ttl):
+                self.hits += 1
+                return ok
+        self.misses += 1
+        return None
+
+    def put(self, url, ok, checked=None):
+        host, path = _split(url)
+        self._pending.append((host, path, int(bool(ok)), checked or time.time()))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO liveness (host, path, ok, checked) VALUES (?, ?, ?, ?)",
+                    self._pending)
+            self._pending = []
+
+    def prune(self):
+        """删除已过期的记录，防止缓存文件无限增长"""
+        now = time.time()
+        with self._db:
+            self._db.execute(
+                "DELETE FROM liveness WHERE (ok = 1 AND checked < ?) OR (ok = 0 AND checked < ?)",
+                (now - self.positive_ttl, now - self.negative_ttl))
+
+    def close(self):
+        self.flush()
+        self.prune()
+        self._db.close()
+        if self.hits or self.misses:
+            print(f"🗃️ 存活缓存：命中 {self.hits} | 未命中 {self.misses}", flush=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,108 +1,245 @@
-import re
+"""
+合并 history/ 下的全部快照 (散文件与 history/pack/ 归档，经由 history_pack.History 读取) 为 merged.m3u / merged.txt
+
+用法:
+    python md/merge_tvlist.py            增量合并：只解析清单中没有的新快照，其余状态从清单恢复
+    python md/merge_tvlist.py --full     全量重建
+    python md/merge_tvlist.py --verify   全量重建 (与 --full 相同的文件顺序)，并与现有输出逐字节比对
+
+清单 (md/.cache/merge_manifest.json) 记录已处理的快照 (文件名, 大小；快照打包前后大小不变)、
+已见过的 URL 与 (频道名, 链接) 以及两个输出文件的摘要；
+快照被删改、输出被改动或清单缺失时自动退回全量重建。
+全量重建按文件名顺序合并，新快照的文件名排在已处理快照之前时 (如跨年后的 logo0101...)
+只追加无法得到相同结果，同样退回全量重建。
+"""
+import hashlib
+import json
+import sys
 from pathlib import Path
 from collections import defaultdict
 
+from channel_list import iter_m3u
+from history_pack import History
+
 folder = Path("history")
 output_m3u = folder / "merged.m3u"
 output_txt = folder / "merged.txt"
+manifest_path = Path(__file__).resolve().parent / ".cache" / "merge_manifest.json"
+MANIFEST_VERSION = 1
 
 # M3U 文件头
 tvg_header = '#EXTM3U x-tvg-url="https://live.fanmingming.com/e.xml"\n'
 
-# 解析 M3U 结构
-pattern_m3u = re.compile(r'(#EXTINF[^\n]*\n)(http[^\n]+)', re.MULTILINE)
+# TXT 分组表头
+GROUP_PREFIX = "📺"
+GROUP_SUFFIX = ",#genre#"
 
-def extract_m3u(file_path):
-    text = file_path.read_text(encoding="utf-8", errors="ignore")
-    return pattern_m3u.findall(text)
+def extract_m3u(history, name):
+    """逐行流式提取 M3U 中的 (EXTINF, 链接)"""
+    return [(ch.extinf, ch.url) for ch in iter_m3u(history.open(name))
+            if ch.extinf and ch.url.startswith("http")]
 
-def extract_txt(file_path):
+def extract_txt(history, name):
     """提取 TXT 格式中的频道名和链接"""
-    text = file_path.read_text(encoding="utf-8", errors="ignore").strip().splitlines()
+    text = history.open(name).read().strip().splitlines()
     entries = []
     current_group = "其他频道"
     for line in text:
         line = line.strip()
         if not line:
             continue
-        if line.startswith("📺"):
-            current_group = line.strip().replace("📺", "").replace(",#genre#", "")
+        if line.startswith(GROUP_PREFIX):
+            current_group = line.strip().replace(GROUP_PREFIX, "").replace(GROUP_SUFFIX, "")
         elif "," in line:
             name, url = line.split(",", 1)
             entries.append((current_group, name.strip(), url.strip()))
     return entries
 
-def merge_m3u():
-    all_entries = []
-    for f in folder.glob("*.m3u"):
-        if f.name.startswith("merged."):
-            continue
-        all_entries.extend(extract_m3u(f))
-
-    seen = set()
-    unique = []
-    for extinf, url in all_entries:
-        if url not in seen:
-            seen.add(url)
-            unique.append((extinf.strip(), url.strip()))
-
-    # 分类
-    cctv, weishi, others = [], [], []
-    for extinf, url in unique:
-        if "央视频道" in extinf:
-            cctv.append((extinf, url))
-        elif "卫视频道" in extinf:
-            weishi.append((extinf, url))
-        else:
-            others.append((extinf, url))
-
-    lines = [tvg_header]
-    for extinf, url in cctv + weishi + others:
-        lines.append(extinf)
-        lines.append(url)
-    return "\n".join(lines) + "\n"
-
-def merge_txt():
-    all_entries = []
-    for f in folder.glob("*.txt"):
-        if f.name.startswith("merged."):
-            continue
-        all_entries.extend(extract_txt(f))
-
-    # 去重：按 频道名 + 链接
-    seen = set()
-    grouped = defaultdict(list)
-    for group, name, url in all_entries:
-        key = (name, url)
-        if key not in seen:
-            seen.add(key)
-            grouped[group].append((name, url))
-
-    # 分类排序
-    ordered_groups = []
-    for title in ["央视频道", "卫视频道"]:
-        if title in grouped:
-            ordered_groups.append((title, grouped.pop(title)))
-    ordered_groups += sorted(grouped.items())  # 其他分类按字母排序放最后
-
-    # 输出格式
-    lines = []
-    for group, channels in ordered_groups:
-        lines.append(f"📺{group},#genre#")
-        for name, url in channels:
-            lines.append(f"{name},{url}")
-    return "\n".join(lines) + "\n"
+def snapshot_files(history, suffix):
+    """参与合并的快照，按文件名排序保证全量重建的顺序稳定"""
+    return [name for name in history.names(suffix) if not name.startswith("merged.")]
+
+def m3u_section(extinf):
+    """M3U 分类：0 央视 / 1 卫视 / 2 其他"""
+    if "央视频道" in extinf:
+        return 0
+    if "卫视频道" in extinf:
+        return 1
+    return 2
+
+class MergeState:
+    """合并中间状态，全量重建与增量合并共用；render_* 的结果只取决于加入条目的顺序"""
+
+    def __init__(self):
+        self.urls = set()                # M3U 去重：按链接
+        self.keys = set()                # TXT 去重：按 频道名 + 链接
+        self.sections = ([], [], [])     # M3U 各分类的 (EXTINF, 链接)
+        self.groups = defaultdict(list)  # TXT 分组 -> [(频道名, 链接)]，保持首次出现顺序
+
+    def add_m3u(self, entries):
+        for extinf, url in entries:
+            if url not in self.urls:
+                self.urls.add(url)
+                self.sections[m3u_section(extinf)].append((extinf, url))
+
+    def add_txt(self, entries):
+        for group, name, url in entries:
+            key = (name, url)
+            if key not in self.keys:
+                self.keys.add(key)
+                self.groups[group].append((name, url))
+
+    def render_m3u(self):
+        lines = [tvg_header]
+        for section in self.sections:
+            for extinf, url in section:
+                lines.append(extinf)
+                lines.append(url)
+        return "\n".join(lines) + "\n"
+
+    def render_txt(self):
+        # 分类排序：央视、卫视在前，其他分类按字母排序放最后
+        titles = [t for t in ["央视频道", "卫视频道"] if t in self.groups]
+        titles += sorted(t for t in self.groups if t not in titles)
+        lines = []
+        for group in titles:
+            lines.append(f"{GROUP_PREFIX}{group}{GROUP_SUFFIX}")
+            for name, url in self.groups[group]:
+                lines.append(f"{name},{url}")
+        return "\n".join(lines) + "\n"
+
+    def load_outputs(self, m3u_text, txt_text):
+        """从上次的输出恢复各分类条目 (去重集合由清单恢复)"""
+        body = m3u_text.split("\n")[2:-1]
+        for extinf, url in zip(body[::2], body[1::2]):
+            self.sections[m3u_section(extinf)].append((extinf, url))
+
+        group = None
+        for line in txt_text.split("\n")[:-1]:
+            if line.startswith(GROUP_PREFIX):
+                group = line[len(GROUP_PREFIX):-len(GROUP_SUFFIX)]
+                self.groups[group]
+            elif group is not None:
+                name, url = line.split(",", 1)
+                self.groups[group].append((name, url))
+
+def digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def read_output(path):
+    return path.read_bytes().decode("utf-8") if path.exists() else None
+
+def full_rebuild(history, m3u_files=None, txt_files=None):
+    """按给定顺序 (默认按文件名) 解析全部快照"""
+    m3u_files = snapshot_files(history, ".m3u") if m3u_files is None else m3u_files
+    txt_files = snapshot_files(history, ".txt") if txt_files is None else txt_files
+    state = MergeState()
+    for name in m3u_files:
+        state.add_m3u(extract_m3u(history, name))
+    for name in txt_files:
+        state.add_txt(extract_txt(history, name))
+    return state, m3u_files, txt_files
+
+def load_manifest(history):
+    """读取清单并校验快照与输出文件都未被改动；不可用时返回 None"""
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    for name, size in manifest["m3u_files"] + manifest["txt_files"]:
+        if name not in history or history.size(name) != size:
+            print(f"⚠️ 快照 {name} 已删除或改动，改为全量重建")
+            return None
+    for path, key in [(output_m3u, "m3u_digest"), (output_txt, "txt_digest")]:
+        text = read_output(path)
+        if text is None or digest(text) != manifest[key]:
+            print(f"⚠️ {path.name} 与清单记录不一致，改为全量重建")
+            return None
+    return manifest
+
+def save_manifest(history, state, m3u_files, txt_files, m3u_text, txt_text):
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "m3u_files": [[name, history.size(name)] for name in m3u_files],
+        "txt_files": [[name, history.size(name)] for name in txt_files],
+        "m3u_digest": digest(m3u_text),
+        "txt_digest": digest(txt_text),
+        "urls": sorted(state.urls),
+        "keys": sorted(state.keys),
+    }
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = manifest_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8")
+    tmp.replace(manifest_path)
+
+def write_output(path, old_text, new_text):
+    """新内容只是在末尾追加时直接追加，否则整体改写"""
+    if old_text == new_text:
+        return "未变化"
+    if old_text and new_text.startswith(old_text):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(new_text[len(old_text):])
+        return "追加"
+    path.write_text(new_text, encoding="utf-8")
+    return "改写"
+
+def incremental(history, manifest):
+    """只合并新快照；新快照不全排在已处理快照之后 (与全量重建顺序不一致) 时返回 None"""
+    m3u_files = [name for name, _ in manifest["m3u_files"]]
+    txt_files = [name for name, _ in manifest["txt_files"]]
+    new_m3u = sorted(set(snapshot_files(history, ".m3u")) - set(m3u_files))
+    new_txt = sorted(set(snapshot_files(history, ".txt")) - set(txt_files))
+    for done, new in [(m3u_files, new_m3u), (txt_files, new_txt)]:
+        if done and new and (new[0] < max(done) or done != sorted(done)):
+            print(f"⚠️ 新快照 {new[0]} 排在已处理的快照之前，改为全量重建")
+            return None
+
+    m3u_old, txt_old = read_output(output_m3u), read_output(output_txt)
+    state = MergeState()
+    state.urls = set(manifest["urls"])
+    state.keys = {tuple(key) for key in manifest["keys"]}
+    state.load_outputs(m3u_old, txt_old)
+    print(f"🔁 增量合并：新快照 M3U {len(new_m3u)} 个，TXT {len(new_txt)} 个")
+    for name in new_m3u:
+        state.add_m3u(extract_m3u(history, name))
+    for name in new_txt:
+        state.add_txt(extract_txt(history, name))
+    return state, m3u_files + new_m3u, txt_files + new_txt, m3u_old, txt_old
+
+def verify(history):
+    """按与 --full 相同的文件顺序全量重建，逐字节比对现有输出"""
+    state, _, _ = full_rebuild(history)
+    ok = True
+    for path, expected in [(output_m3u, state.render_m3u()), (output_txt, state.render_txt())]:
+        same = read_output(path) == expected
+        ok &= same
+        print(f"{'✅' if same else '❌'} {path} {'与全量重建一致' if same else '与全量重建不一致'}")
+    return ok
 
 def main():
-    print("📺 正在合并 M3U 文件...")
-    output_m3u.write_text(merge_m3u(), encoding="utf-8")
-
-    print("📄 正在合并 TXT 文件...")
-    output_txt.write_text(merge_txt(), encoding="utf-8")
+    history = History(folder)
+    if "--verify" in sys.argv:
+        sys.exit(0 if verify(history) else 1)
+
+    manifest = None if "--full" in sys.argv else load_manifest(history)
+    result = incremental(history, manifest) if manifest is not None else None
+    if result is None:
+        print("📺 正在全量合并 M3U / TXT 文件...")
+        state, m3u_files, txt_files = full_rebuild(history)
+        m3u_old, txt_old = read_output(output_m3u), read_output(output_txt)
+    else:
+        state, m3u_files, txt_files, m3u_old, txt_old = result
+
+    m3u_text, txt_text = state.render_m3u(), state.render_txt()
+    m3u_action = write_output(output_m3u, m3u_old, m3u_text)
+    txt_action = write_output(output_txt, txt_old, txt_text)
+    save_manifest(history, state, m3u_files, txt_files, m3u_text, txt_text)
 
     print("✅ 合并完成！")
-    print(f" - {output_m3u}")
-    print(f" - {output_txt}")
+    print(f" - {output_m3u} ({m3u_action})")
+    print(f" - {output_txt} ({txt_action})")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+"""
+各流程阶段的结构化指标
+
+    with metrics.stage("体检"):
+        with metrics.phase("probe"):
+            ...
+    metrics.write_report()
+
+probe.py 在每次真正发起的探测结束时调用 record_probe()，读取响应时调用 add_bytes()，
+命中存活缓存时调用 record_cached()，都记到当前活动阶段上；没有活动阶段时什么都不做。
+每个阶段记录: 探测数、成功 / 超时 / 拒绝连接 / 其它错误、缓存命中、读取字节数、
+延迟的 p50/p95/p99 与分桶直方图、parse / probe / write 等子阶段耗时。
+
+write_report() 把本进程的全部阶段写入 final_hotel.metrics.json，按阶段名与其它流程
+已写入的阶段合并，因此同一工作流中依次运行的多个脚本共用一份报告。
+
+STAGE_PROFILE 环境变量打开逐阶段剖析 (逗号分隔，可同时打开):
+    cprofile     写出 md/.cache/profile/<阶段>.prof，并打印累计耗时前 PROFILE_TOP 的函数
+    tracemalloc  报告中记录该阶段的内存峰值与分配最多的 PROFILE_TOP 个位置
+"""
+import bisect
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+REPORT_PATH = os.environ.get("METRICS_REPORT", os.path.join(PARENT_DIR, "final_hotel.metrics.json"))
+PROFILE_DIR = os.path.join(CURRENT_DIR, ".cache", "profile")
+PROFILE = {p.strip() for p in os.environ.get("STAGE_PROFILE", "").lower().split(",") if p.strip()}
+PROFILE_TOP = 15
+# 延迟分桶上界 (毫秒)，最后一桶为 "+inf"
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2000, 4000)
+PERCENTILES = (50, 95, 99)
+
+_stages = {}     # 阶段名 -> StageMetrics，按开始顺序
+_current = None  # 当前活动阶段
+
+
+class StageMetrics:
+    def __init__(self, name):
+        self.name = name
+        self.probes = 0
+        self.ok = 0
+        self.timeouts = 0
+        self.refused = 0
+        self.errors = 0
+        self.cached = 0
+        self.bytes = 0
+        self.latencies = []
+        self.phases = {}
+        self.wall = 0.0
+        self.memory = None
+
+    def record(self, res):
+        self.probes += 1
+        if res.ok:
+            self.ok += 1
+        elif res.error == "timeout":
+            self.timeouts += 1
+        elif res.error == "refused":
+            self.refused += 1
+        elif res.error:
+            self.errors += 1
+        self.latencies.append(res.elapsed)
+
+    def to_dict(self):
+        latencies = sorted(self.latencies)
+        buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        for seconds in latencies:
+            buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + ["+inf"]
+        report = {
+            "wall_s": round(self.wall, 3),
+            "phases_s": {name: round(elapsed, 3) for name, elapsed in self.phases.items()},
+            "probes": self.probes,
+            "ok": self.ok,
+            "timeouts": self.timeouts,
+            "refused": self.refused,
+            "errors": self.errors,
+            "cached": self.cached,
+            "bytes_read": self.bytes,
+            "probes_per_s": round(self.probes / self.wall, 1) if self.wall else None,
+            "latency_ms": {f"p{p}": round(percentile(latencies, p) * 1000, 1) if latencies else None
+                           for p in PERCENTILES},
+            "latency_histogram": dict(zip(labels, buckets)),
+            "finished": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        if self.memory:
+            report["memory"] = self.memory
+        return report
+
+
+def percentile(sorted_values, p):
+    """最近秩法百分位数；sorted_values 须已排序且非空"""
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+@contextmanager
+def stage(name):
+    """开始一个阶段；同名阶段再次进入时累加到同一条记录上"""
+    global _current
+    outer, m = _current, _stages.get(name) or StageMetrics(name)
+    _stages[name] = m
+    _current = m
+    profiler = cProfile.Profile() if "cprofile" in PROFILE else None
+    tracing = "tracemalloc" in PROFILE and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    t0 = time.perf_counter()
+    try:
+        yield m
+    finally:
+        m.wall += time.perf_counter() - t0
+        if profiler:
+            profiler.disable()
+            _dump_profile(name, profiler)
+        if tracing:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            m.memory = {
+                "peak_kb": round(peak / 1024, 1),
+                "top": [{"where": str(s.traceback[0]), "kb": round(s.size / 1024, 1), "count": s.count}
+                        for s in snapshot.statistics("lineno")[:PROFILE_TOP]],
+            }
+        _current = outer
+
+
+@contextmanager
+def phase(name):
+    """在当前阶段内计时一个子阶段 (parse / probe / write ...)；没有活动阶段时只执行不计时"""
+    m = _current
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if m is not None:
+            m.phases[name] = m.phases.get(name, 0.0) + time.perf_counter() - t0
+
+
+def record_probe(res):
+    """记录一次真正发起的探测 (ProbeResult)"""
+    if _current is not None:
+        _current.record(res)
+
+
+def record_cached():
+    if _current is not None:
+        _current.cached += 1
+
+
+def add_bytes(n):
+    if _current is not None:
+        _current.bytes += n
+
+
+def _dump_profile(name, profiler):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}.prof")
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+    print(f"🔬 [{name}] cProfile 已写入 {path}\n{out.getvalue()}", flush=True)
+
+
+def write_report(path=REPORT_PATH):
+    """把本进程的阶段合并写入 JSON 报告，返回报告内容"""
+    if not _stages:
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        report = {}
+    stages = report.get("stages", {})
+    for name, m in _stages.items():
+        stages[name] = m.to_dict()
+    report = {"updated": time.strftime("%Y-%m-%d %H:%M:%S"), "stages": stages}
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+    print(f"📈 阶段指标已写入 {os.path.basename(path)} ({', '.join(_stages)})", flush=True)
+    return report
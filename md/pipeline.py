@@ -0,0 +1,213 @@
+"""
+体检 -> 抢救 -> 发布 三个阶段在同一进程内串联，阶段之间直接传递 HostBlock 列表
+
+用法:
+    python md/pipeline.py           依次运行三个阶段，只写最终的 final_hotel.txt / final_hotel.m3u
+    python md/pipeline.py --debug   额外写出中转文件 revived_temp.txt / dead_tasks.txt / rescued_temp.txt
+    python md/pipeline.py --stream  流式模式：体检与抢救重叠执行
+各阶段共用一个存活缓存，结束时打印每个阶段的耗时，并把各阶段指标写入 final_hotel.metrics.json
+(见 metrics.py，STAGE_PROFILE=cprofile,tracemalloc 可打开逐阶段剖析)。
+体检按主机历史、抢救按网段历史决定本轮是否探测 (见 host_history.py)。
+
+流式模式下，体检每判定一个失效块就立即放入有界的抢救队列，由已在运行的
+MAX_ACTIVE_SWEEPS 个抢救协程消费；队列满时体检暂停等待 (背压)。存活块与
+抢救成功的块直接交给 OutputWriter 格式化；输出按主机规范排序 (见 playlist_delta.py)，
+与到达顺序无关。爆破候选以网段内第一个送达的失效块 (串行模式为序号最小的块) 的旧 IP
+为中心排序，网段内有多台存活主机时两种模式可能选中不同的新主机；每段抢救结果唯一时
+输出与串行模式逐字节一致 (见 tests/test_pipeline.py)。
+"""
+import asyncio
+import os
+import sys
+import time
+
+import check_iptv
+import format_output
+import metrics
+import rescue_hotel
+from adaptive import make_controller
+from candidates import build_index, last_octet
+from channel_list import write_blocks
+from host_history import HostHistory
+from liveness_cache import LivenessCache
+from probe import conclusive, sweep, verify
+
+# 待抢救队列上限：抢救跟不上时体检在此等待，避免失效块无限堆积
+RESCUE_QUEUE_SIZE = 2 * rescue_hotel.MAX_ACTIVE_SWEEPS
+
+
+class StageTimer:
+    """记录各阶段的墙钟耗时"""
+
+    def __init__(self):
+        self.stages = []
+
+    def run(self, name, fn, *args):
+        t0 = time.perf_counter()
+        with metrics.stage(name):
+            result = fn(*args)
+        self.add(name, time.perf_counter() - t0)
+        return result
+
+    def add(self, name, elapsed):
+        self.stages.append((name, elapsed))
+
+    def report(self):
+        total = sum(elapsed for _, elapsed in self.stages)
+        print("⏱️ 各阶段耗时:", flush=True)
+        for name, elapsed in self.stages:
+            print(f"  {name:<6} {elapsed:8.2f}s", flush=True)
+        print(f"  {'合计':<6} {total:8.2f}s", flush=True)
+
+
+def write_debug(path, blocks):
+    with open(path, 'w', encoding='utf-8') as f:
+        write_blocks(f, blocks)
+
+
+async def stream_blocks(blocks, cache, index, writer, timer, hosts=None, subnets=None):
+    """
+    体检与抢救重叠执行 -> (存活块, 失效块, 抢救成功的块)，均保持原始顺序
+
+    存活块以 key (0, 序号)、抢救块以 key (1, 序号) 交给 writer，写出顺序由 writer 排序决定。
+    抢救块按完成顺序到达，各网段的候选顺序与缓存、历史记录也按这一顺序产生 (见模块说明)。
+    hosts / subnets 为 HostHistory 时按历史跳过体检的主机与爆破的网段，并记录本轮观测。
+    """
+    queue = asyncio.Queue(maxsize=RESCUE_QUEUE_SIZE)
+    check_controller = make_controller("体检", check_iptv.MAX_CONCURRENCY, check_iptv.TIMEOUT)
+    rescue_controller = make_controller("抢救", rescue_hotel.MAX_CONCURRENCY, rescue_hotel.TIMEOUT)
+    slots = rescue_controller or asyncio.Semaphore(rescue_hotel.MAX_CONCURRENCY)
+    sweeps = {}  # (prefix, port, path) -> Task，相同网段只扫一次
+    revived, dead, rescued = {}, {}, {}
+
+    def start_sweep(job, old_ip):
+        # 以第一个送达的失效块的旧 IP 为中心，按历史命中排序候选
+        prefix, port, path = job
+        return asyncio.ensure_future(sweep(
+            prefix, port, path, hosts=index.rank(*job, old_octet=last_octet(old_ip)),
+            timeout=rescue_hotel.TIMEOUT, concurrency=rescue_hotel.SWEEP_CONCURRENCY,
+            slots=slots, cache=cache, controller=rescue_controller))
+
+    def record_sweep(job, task):
+        if subnets is not None and not task.cancelled() and task.exception() is None:
+            found = bool(task.result().hosts)
+            if found or not task.result().starved:
+                subnets.record(rescue_hotel.history_key(job), found, reusable=not found)
+
+    def add_block(idx, block, ok):
+        if ok:
+            revived[idx] = block
+            writer.add((0, idx), block)
+        else:
+            dead[idx] = block
+
+    async def rescuer():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            idx, block = item
+            try:
+                job = rescue_hotel.sweep_job(block)
+            except ValueError as e:
+                print(f"[抢救] {e}", flush=True)
+                continue
+            if job not in sweeps:
+                if not rescue_hotel.job_due(job, subnets):
+                    sweeps[job] = None
+                else:
+                    sweeps[job] = start_sweep(job, block.host)
+                    sweeps[job].add_done_callback(lambda t, job=job: record_sweep(job, t))
+            result = sweeps[job] and await sweeps[job]
+            if result and result.hosts:
+                new_host = result.hosts[0]
+                print(f"[抢救] ✨ 成功: {block.host} -> {new_host} (省下 {result.saved} 次探测)", flush=True)
+                rescued[idx] = rescue_hotel.rebuild_block(block, new_host)
+                writer.add((1, idx), rescued[idx])
+            else:
+                print(f"[抢救] ❌ 失败: {block.host}", flush=True)
+
+    t0 = time.perf_counter()
+    workers = [asyncio.ensure_future(rescuer()) for _ in range(rescue_hotel.MAX_ACTIVE_SWEEPS)]
+    try:
+        skipped = check_iptv.skip_by_history(blocks, hosts)
+        for idx, ok in skipped.items():
+            add_block(idx, blocks[idx], ok)
+            if not ok:
+                await queue.put((idx, blocks[idx]))
+        results = verify(((idx, [c.url for c in b.channels]) for idx, b in enumerate(blocks) if idx not in skipped),
+                         samples=check_iptv.VERIFY_SAMPLES, timeout=check_iptv.TIMEOUT,
+                         concurrency=check_iptv.MAX_CONCURRENCY, cache=cache, controller=check_controller)
+        async for idx, res in results:
+            block = blocks[idx]
+            done = len(revived) + len(dead) + 1
+            ok = any(res.values())
+            if hosts is not None and conclusive(res):
+                hosts.record(block.host, ok, reusable=all(res.values()) or not ok)
+            if ok:
+                print(f"[{done}/{len(blocks)}] ✅ 存活: {block.host} (抽检 {list(res.values()).count(True)}/{len(res)})", flush=True)
+                block.channels = [c for c in block.channels if res.get(c.url) is not False]
+            else:
+                print(f"[{done}/{len(blocks)}] 💀 失效 -> 送入抢救队列: {block.host}", flush=True)
+            add_block(idx, block, ok)
+            if not ok:
+                await queue.put((idx, block))  # 队列满时在此等待
+        timer.add("体检", time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        timer.add("抢救收尾", time.perf_counter() - t0)
+    finally:
+        for task in workers + [t for t in sweeps.values() if t is not None]:
+            task.cancel()
+
+    for controller in (check_controller, rescue_controller):
+        if controller:
+            controller.summary()
+    print(f"📊 抢救完成。成功: {len(rescued)} | 失败: {len(dead) - len(rescued)} | 爆破网段: {sum(t is not None for t in sweeps.values())}", flush=True)
+    ordered = lambda found: [found[idx] for idx in sorted(found)]
+    return ordered(revived), ordered(dead), ordered(rescued)
+
+
+def main(debug=False, stream=False):
+    if not os.path.exists(check_iptv.MANUAL_FIX):
+        print(f"❌ 未找到 {check_iptv.MANUAL_FIX}", flush=True)
+        return
+
+    timer = StageTimer()
+    cache = LivenessCache()
+    hosts, subnets = HostHistory("host"), HostHistory("sweep")
+    try:
+        blocks = timer.run("读取", check_iptv.load_blocks)
+        if stream:
+            index = timer.run("索引", build_index)
+            writer = format_output.OutputWriter()
+            with metrics.stage("体检+抢救"):
+                revived, dead, rescued = asyncio.run(
+                    stream_blocks(blocks, cache, index, writer, timer, hosts, subnets))
+        else:
+            revived, dead = timer.run("体检", check_iptv.check_blocks, blocks, cache, hosts)
+            rescued = timer.run("抢救", rescue_hotel.rescue_blocks, dead, cache, None, subnets)
+    finally:
+        hosts.close()
+        subnets.close()
+        cache.close()
+
+    if debug:
+        write_debug(check_iptv.MID_REVIVED, revived)
+        write_debug(check_iptv.MID_DEAD, dead)
+        write_debug(rescue_hotel.OUTPUT_RESCUED, rescued)
+
+    if stream:
+        # 名称清理与格式化已在块到达时完成，这里只按顺序写出
+        timer.run("发布", writer.close)
+    else:
+        timer.run("发布", format_output.format_blocks, revived + rescued)
+    timer.report()
+    metrics.write_report()
+
+
+if __name__ == "__main__":
+    main(debug="--debug" in sys.argv, stream="--stream" in sys.argv)
@@ -0,0 +1,134 @@
+"""
+final_hotel.m3u 的跨运行差分
+
+输出中的主机块按规范顺序排列 (IPv4 主机按四段数值与端口升序，其余主机名按字典序排在后面)，
+块内频道保持 manual_fix.txt 中的顺序；块以 group-title (即 ip:port) 标识。
+每次发布的 M3U 与上次不同时序号 seq 加一，并写出 delta/final_hotel.<seq>.json:
+    {
+     "seq": 序号, "base": {"seq": 上一序号, "etag": 旧 M3U 的 ETag}, "etag": 新 M3U 的 ETag,
+     "added":   {主机: [[#EXTINF 行, URL], ...]},     新出现的块
+     "removed": [主机, ...],                           消失的块
+     "changed": {主机: [操作, ...]},                   块内频道行的差分:
+                 ["C", 起始, 条数] 复制旧块的频道，["I", [[#EXTINF 行, URL], ...]] 插入新频道
+     "stats":   各类变化的块数与频道行数
+    }
+客户端持有序号 k 时依次应用 k+1 .. 最新的差分 (apply_delta)，再按 host_sort_key 排序即得新播放列表；
+缺少某个序号 (只保留最近 DELTA_KEEP 个) 时回退到下载完整文件。
+"""
+import hashlib
+import json
+import os
+import re
+from difflib import SequenceMatcher
+
+from channel_list import iter_m3u
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+DELTA_DIR = os.path.join(PARENT_DIR, "delta")
+DELTA_PREFIX = "final_hotel."
+DELTA_KEEP = 48
+IPV4_HOST = re.compile(r'^(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(?::(\d+))?$')
+DELTA_NAME = re.compile(r'^final_hotel\.(\d+)\.json$')
+
+
+def host_sort_key(host):
+    """主机块的规范顺序：IPv4 按数值，其余按名称排在后面"""
+    m = IPV4_HOST.match(host)
+    if m:
+        return (0, tuple(int(x) for x in m.groups()[:4]), int(m.group(5) or 0), host)
+    return (1, (), 0, host)
+
+
+def etag(digest):
+    """SHA-256 十六进制摘要 -> 强 ETag"""
+    return f'"{digest[:32]}"'
+
+
+def read_m3u_blocks(path):
+    """已发布的 M3U -> ({主机: [(#EXTINF 行, URL), ...]}, ETag)；文件不存在返回 (None, None)"""
+    if not os.path.exists(path):
+        return None, None
+    with open(path, 'rb') as f:
+        data = f.read()
+    blocks = {}
+    for ch in iter_m3u(data.decode('utf-8', 'ignore').splitlines()):
+        blocks.setdefault(ch.group or "", []).append((ch.extinf, ch.url))
+    return blocks, etag(hashlib.sha256(data).hexdigest())
+
+
+def diff_blocks(old, new):
+    """两次发布的块 -> (added, removed, changed)；没有变化时三者皆空"""
+    added = {host: [list(e) for e in entries] for host, entries in new.items() if host not in old}
+    removed = sorted((host for host in old if host not in new), key=host_sort_key)
+    changed = {}
+    for host, entries in new.items():
+        base = old.get(host)
+        if base is None or base == entries:
+            continue
+        ops = []
+        for tag, i1, i2, j1, j2 in SequenceMatcher(None, base, entries, autojunk=False).get_opcodes():
+            if tag == "equal":
+                ops.append(["C", i1, i2 - i1])
+            elif j2 > j1:
+                ops.append(["I", [list(e) for e in entries[j1:j2]]])
+        changed[host] = ops
+    return added, removed, changed
+
+
+def apply_delta(old, delta):
+    """在旧块上应用一个差分 -> 新块 (按规范顺序)"""
+    blocks = {host: list(entries) for host, entries in old.items() if host not in delta["removed"]}
+    for host, entries in delta["added"].items():
+        blocks[host] = [tuple(e) for e in entries]
+    for host, ops in delta["changed"].items():
+        base, entries = old[host], []
+        for op in ops:
+            if op[0] == "C":
+                entries.extend(base[op[1]:op[1] + op[2]])
+            elif op[0] == "I":
+                entries.extend(tuple(e) for e in op[1])
+            else:
+                raise ValueError(f"无效的差分操作 {op[0]!r}")
+        blocks[host] = entries
+    return {host: blocks[host] for host in sorted(blocks, key=host_sort_key)}
+
+
+def build_delta(old, new, seq, base_etag, new_etag):
+    """构造序号为 seq 的差分；只有顺序变化时三类变化皆空"""
+    added, removed, changed = diff_blocks(old, new)
+    lines_added = sum(len(e) for e in added.values())
+    lines_removed = sum(len(old[host]) for host in removed)
+    for host, ops in changed.items():
+        copied = sum(op[2] for op in ops if op[0] == "C")
+        lines_added += sum(len(op[1]) for op in ops if op[0] == "I")
+        lines_removed += len(old[host]) - copied
+    return {
+        "seq": seq,
+        "base": {"seq": seq - 1, "etag": base_etag},
+        "etag": new_etag,
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "stats": {"blocks_added": len(added), "blocks_removed": len(removed), "blocks_changed": len(changed),
+                  "lines_added": lines_added, "lines_removed": lines_removed},
+    }
+
+
+def delta_path(seq, directory=DELTA_DIR):
+    return os.path.join(directory, f"{DELTA_PREFIX}{seq}.json")
+
+
+def write_delta(delta, directory=DELTA_DIR, keep=DELTA_KEEP):
+    """写出差分 (先写临时文件再改名)，只保留最近 keep 个；返回 (路径, 字节内容)"""
+    os.makedirs(directory, exist_ok=True)
+    path = delta_path(delta["seq"], directory)
+    data = (json.dumps(delta, ensure_ascii=False, separators=(",", ":")) + "\n").encode('utf-8')
+    with open(path + ".tmp", 'wb') as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    for name in os.listdir(directory):
+        m = DELTA_NAME.match(name)
+        if m and int(m.group(1)) <= delta["seq"] - keep:
+            os.remove(os.path.join(directory, name))
+    return path, data
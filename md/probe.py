@@ -0,0 +1,429 @@
+"""
+异步探测引擎：aggregate / check_iptv / rescue_hotel / discovery 共用
+
+基于 asyncio 非阻塞套接字，一个线程即可同时挂起数千个探测；
+并发同时受「单主机上限」与「全局上限」两道闸门约束。
+"""
+import asyncio
+import errno
+import ssl
+import time
+from collections import namedtuple
+from urllib.parse import urlsplit, urljoin
+
+import metrics
+
+TIMEOUT = 3
+MAX_CONCURRENCY = 1000  # 全局同时在途的探测数
+PER_HOST_LIMIT = 4      # 同一 ip:port 同时在途的探测数
+SWEEP_CONCURRENCY = 64  # 单个 /24 爆破同时在途的探测数，命中后其余候选不再发起
+MAX_ACTIVE_SWEEPS = 32  # sweep_many 同时展开的网段数
+MAX_REDIRECTS = 5
+VERIFY_SAMPLES = 4      # 多频道体检时每个网段抽样的频道数
+MAX_DRAIN_BYTES = 256 * 1024  # 复用连接前最多读掉的响应体大小
+USER_AGENT = "VLC/3.0"
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+PROBE_ERRORS = (OSError, ValueError, IndexError, asyncio.IncompleteReadError, asyncio.LimitOverrunError)
+# 本机资源耗尽类错误 (句柄 / 缓冲区 / 本地端口)：说明并发超出了本机或出口的承受能力
+RESOURCE_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.ENOMEM, errno.EADDRNOTAVAIL}
+
+# ok: 是否 200 | status: HTTP 状态码 (失败为 None) | error: timeout / refused / resource (本机资源耗尽) / error
+# cached: 结果来自存活缓存，未真正发起请求
+ProbeResult = namedtuple("ProbeResult", "url ok status error elapsed cached", defaults=(False,))
+# hosts: 命中的 ip:port 列表 | probed: 实际完成的探测数 | saved: 因提前结束而省下的探测数
+# starved: 因本机资源耗尽而失败的探测数 (没有命中时，网段是否失效无法确定)
+SweepResult = namedtuple("SweepResult", "hosts probed saved starved", defaults=(0,))
+
+_ssl_ctx = None
+
+
+def _ssl_context():
+    global _ssl_ctx
+    if _ssl_ctx is None:
+        _ssl_ctx = ssl.create_default_context()
+    return _ssl_ctx
+
+
+def host_key(url):
+    """提取 URL 的 ip:port，用作单主机限流的键"""
+    return urlsplit(url).netloc
+
+
+async def _connect(parts, timeout):
+    secure = parts.scheme == "https"
+    port = parts.port or (443 if secure else 80)
+    return await asyncio.wait_for(
+        asyncio.open_connection(parts.hostname, port, ssl=_ssl_context() if secure else None),
+        timeout)
+
+
+async def _request(reader, writer, parts, timeout, user_agent, keep_alive=False):
+    """在已建立的连接上发出一个 GET，只读到响应头为止，返回 (状态码, 响应头字典, 协议版本)"""
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    writer.write((
+        f"GET {path} HTTP/1.1\r\n"
+        f"Host: {parts.netloc}\r\n"
+        f"User-Agent: {user_agent}\r\n"
+        "Accept: */*\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1"))
+    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+    metrics.add_bytes(len(head))
+
+    lines = head.decode("latin-1").split("\r\n")
+    version, status = lines[0].split(" ", 2)[:2]
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    return int(status), headers, version
+
+
+async def _drain_body(reader, headers, timeout):
+    """读完响应体以便复用连接；长度未知 (流式输出) 或过大时返回 False"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size_line = await asyncio.wait_for(reader.readline(), timeout)
+            size = int(size_line.split(b";")[0].strip() or b"0", 16)
+            if size > MAX_DRAIN_BYTES:
+                return False
+            await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+            metrics.add_bytes(size)
+            if size == 0:
+                return True
+    if "content-length" in headers:
+        size = int(headers["content-length"])
+        if size > MAX_DRAIN_BYTES:
+            return False
+        await asyncio.wait_for(reader.readexactly(size), timeout)
+        metrics.add_bytes(size)
+        return True
+    return False
+
+
+async def fetch_head(url, timeout=TIMEOUT, user_agent=USER_AGENT, connect_timeout=None):
+    """发起 GET 但只读到响应头为止，返回 (状态码, 响应头字典)；connect_timeout 默认同 timeout"""
+    parts = urlsplit(url)
+    reader, writer = await _connect(parts, connect_timeout or timeout)
+    try:
+        status, headers, _ = await _request(reader, writer, parts, timeout, user_agent)
+    finally:
+        writer.close()
+    return status, headers
+
+
+def _error_kind(exc):
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, ConnectionRefusedError):
+        return "refused"
+    if isinstance(exc, OSError) and exc.errno in RESOURCE_ERRNOS:
+        return "resource"
+    return "error"
+
+
+async def check_url(url, timeout=TIMEOUT, user_agent=USER_AGENT, connect_timeout=None):
+    """探测单个 URL (跟随重定向)，返回 ProbeResult；建连与读响应头分别受 connect_timeout / timeout 约束"""
+    start = time.monotonic()
+    status, error, target = None, None, url
+    try:
+        for _ in range(MAX_REDIRECTS + 1):
+            status, headers = await fetch_head(target, timeout, user_agent, connect_timeout)
+            if status in REDIRECT_CODES and headers.get("location"):
+                target = urljoin(target, headers["location"])
+                continue
+            break
+    except PROBE_ERRORS + (asyncio.TimeoutError,) as e:
+        error = _error_kind(e)
+    if error:
+        status = None
+    res = ProbeResult(url, status == 200, status, error, time.monotonic() - start)
+    metrics.record_probe(res)
+    return res
+
+
+def conclusive(results):
+    """verify / verify_block 的结果能否作为主机的观测：有存活频道，或没有因本机资源耗尽而未知 (None) 的频道"""
+    return any(results.values()) or None not in results.values()
+
+
+def sample(urls, n):
+    """从频道列表中均匀抽取 n 个 (总包含第一个频道)"""
+    urls = list(urls)
+    if n <= 1:
+        return urls[:1]
+    if n >= len(urls):
+        return urls
+    step = (len(urls) - 1) / (n - 1)
+    return [urls[round(i * step)] for i in range(n)]
+
+
+async def verify_block(urls, timeout=TIMEOUT, user_agent=USER_AGENT, cache=None, controller=None):
+    """
+    在同一条 HTTP/1.1 keep-alive 连接上依次请求多个频道，返回 {url: 是否存活}；
+    本机资源耗尽 (error 为 resource) 时无法判断主机死活，该频道记为 None，也不写入缓存
+
+    响应体长度可知时读完后复用连接，否则 (如持续推流) 为下一个频道重新建连；
+    建连本身失败说明主机不可达，余下频道直接判失效，不再逐个等待超时。
+    controller 为 AdaptiveController 时，建连超时取自其 RTT 估计 (读响应头仍用 timeout)，
+    建连前按 /24 限速，结果回馈给它。
+    """
+    results = {}
+    conn, conn_host, unreachable, starved = None, None, set(), set()
+
+    def drop():
+        nonlocal conn
+        if conn is not None:
+            conn[1].close()
+            conn = None
+
+    try:
+        for url in urls:
+            if cache is not None:
+                ok = cache.get(url)
+                if ok is not None:
+                    metrics.record_cached()
+                    results[url] = ok
+                    continue
+            parts = urlsplit(url)
+            connect_timeout = controller.connect_timeout() if controller is not None else timeout
+            ok, status, error, start = False, None, None, time.monotonic()
+            # 复用的连接可能已被服务端关闭，此时换新连接重试一次
+            for _ in range(2):
+                if parts.netloc in unreachable:
+                    break
+                reused = conn is not None and conn_host == parts.netloc
+                if not reused:
+                    drop()
+                    conn_host = parts.netloc
+                    if controller is not None:
+                        await controller.pace(parts.netloc)
+                    try:
+                        conn = await _connect(parts, connect_timeout)
+                    except PROBE_ERRORS + (asyncio.TimeoutError,) as e:
+                        error = _error_kind(e)
+                        unreachable.add(parts.netloc)
+                        if error == "resource":
+                            starved.add(parts.netloc)
+                        break
+                try:
+                    status, headers, version = await _request(*conn, parts, timeout, user_agent,
+                                                              keep_alive=True)
+                    if status in REDIRECT_CODES:
+                        ok = (await check_url(url, timeout, user_agent, connect_timeout)).ok
+                    else:
+                        ok = status == 200
+                    if not (version == "HTTP/1.1"
+                            and headers.get("connection", "").lower() != "close"
+                            and await _drain_body(conn[0], headers, timeout)):
+                        drop()
+                    break
+                except asyncio.TimeoutError:
+                    error = "timeout"
+                    drop()
+                    break
+                except PROBE_ERRORS as e:
+                    error = _error_kind(e)
+                    drop()
+                    if not reused:
+                        break
+            if status is not None or error is not None:
+                # 同一主机已判不可达后余下的频道没有真正发起请求，不计入探测
+                res = ProbeResult(url, ok, status, None if ok else error, time.monotonic() - start)
+                metrics.record_probe(res)
+                if controller is not None:
+                    controller.observe(res)
+            if status is None and (error == "resource" or parts.netloc in starved):
+                results[url] = None
+                continue
+            results[url] = ok
+            if cache is not None:
+                cache.put(url, ok)
+    finally:
+        drop()
+    return results
+
+
+async def _bounded(coros, window):
+    """
+    惰性地从 coros 取协程执行，最多 window 个同时挂起，按完成顺序产出结果
+
+    调用方提前退出迭代时，剩余协程不再启动，已启动的任务全部取消。
+    """
+    it = iter(coros)
+    pending = set()
+
+    def fill():
+        while len(pending) < window:
+            try:
+                coro = next(it)
+            except StopIteration:
+                return
+            pending.add(asyncio.ensure_future(coro))
+
+    fill()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                yield task.result()
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def probe(urls, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY, per_host=PER_HOST_LIMIT,
+                user_agent=USER_AGENT, slots=None, cache=None, controller=None):
+    """
+    并发探测一批 URL，按完成顺序逐个产出 ProbeResult (异步迭代器)
+
+    urls 可以是任意可迭代对象，会按需惰性读取；调用方提前退出迭代时，
+    尚未开始的探测不会再发起，在途的探测会被取消并关闭套接字。
+    slots 可传入共享的 asyncio.Semaphore，让多路 probe 共用一个全局并发池。
+    cache 为 LivenessCache 时，命中未过期记录的 URL 直接产出缓存结果，探测结果写回缓存
+    (本机资源耗尽导致的失败不写回，以免把正常主机记成失效)。
+    controller 为 AdaptiveController 时由它充当全局并发池 (AIMD 动态伸缩)、给出每次探测的建连超时，
+    并对同一 /24 限速；读响应头的超时始终是 timeout。
+    """
+    total_slots = controller or slots or asyncio.Semaphore(concurrency)
+    host_slots = {}
+
+    async def one(url):
+        if cache is not None:
+            ok = cache.get(url)
+            if ok is not None:
+                metrics.record_cached()
+                return ProbeResult(url, ok, 200 if ok else None, None, 0.0, True)
+        key = host_key(url)
+        slot = host_slots.get(key)
+        if slot is None:
+            slot = host_slots[key] = asyncio.Semaphore(per_host)
+        # 先拿主机名额再拿全局名额，排队等同一主机的任务不占全局名额
+        async with slot:
+            if controller is not None:
+                await controller.pace(key)
+            async with total_slots:
+                res = await check_url(url, timeout, user_agent,
+                                      controller.connect_timeout() if controller else None)
+        if controller is not None:
+            controller.observe(res)
+        if cache is not None and res.error != "resource":
+            cache.put(url, res.ok)
+        return res
+
+    # 自适应池独占时窗口按其上限放大，否则并发上不去
+    window = controller.maximum if controller is not None and slots is None else concurrency
+    agen = _bounded((one(url) for url in urls), window * 2)
+    try:
+        async for res in agen:
+            yield res
+    finally:
+        await agen.aclose()
+
+
+def iter_async(agen):
+    """在独立的事件循环里逐个驱动异步迭代器，供同步脚本直接 for 循环使用"""
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+        loop.close()
+
+
+def iter_probe(urls, **kwargs):
+    """probe() 的同步版本"""
+    return iter_async(probe(urls, **kwargs))
+
+
+async def sweep(prefix, port, path, hosts=range(1, 256), stop_after=1, timeout=TIMEOUT,
+                concurrency=SWEEP_CONCURRENCY, user_agent=USER_AGENT, slots=None, cache=None,
+                controller=None):
+    """
+    爆破一个 /24 网段：按 hosts 顺序探测 http://prefix.N:port/path
+
+    命中 stop_after 个存活主机后立即返回：排队中的候选不再发起，
+    在途的探测被取消并关闭套接字。stop_after=None 表示扫完整个网段。
+    """
+    urls = [f"http://{prefix}.{i}:{port}{path}" for i in hosts]
+    found, probed, starved = [], 0, 0
+    agen = probe(urls, timeout=timeout, concurrency=concurrency, user_agent=user_agent,
+                 slots=slots, cache=cache, controller=controller)
+    try:
+        async for res in agen:
+            probed += 1
+            starved += res.error == "resource"
+            if res.ok:
+                found.append(host_key(res.url))
+                if stop_after and len(found) >= stop_after:
+                    break
+    finally:
+        await agen.aclose()
+    return SweepResult(found, probed, len(urls) - probed, starved)
+
+
+def run_sweep(prefix, port, path, **kwargs):
+    """sweep() 的同步版本"""
+    return asyncio.run(sweep(prefix, port, path, **kwargs))
+
+
+async def sweep_many(jobs, stop_after=1, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY,
+                     sweep_concurrency=SWEEP_CONCURRENCY, max_sweeps=MAX_ACTIVE_SWEEPS,
+                     user_agent=USER_AGENT, cache=None, order=None, controller=None):
+    """
+    批量爆破：jobs 为 (prefix, port, path) 的可迭代对象
+
+    所有网段共用一个全局并发池 (concurrency)，同时最多展开 max_sweeps 个网段，
+    每个网段各自命中即停；按完成顺序产出 (job, SweepResult)。
+    order(job) 可返回该网段的候选末段顺序，默认 1~255 顺序探测。
+    controller 为 AdaptiveController 时代替固定的全局并发池。
+    """
+    slots = controller or asyncio.Semaphore(concurrency)
+
+    async def one(job):
+        prefix, port, path = job
+        hosts = order(job) if order else range(1, 256)
+        return job, await sweep(prefix, port, path, hosts=hosts, stop_after=stop_after, timeout=timeout,
+                                concurrency=sweep_concurrency, user_agent=user_agent,
+                                slots=slots, cache=cache, controller=controller)
+
+    agen = _bounded((one(job) for job in jobs), max_sweeps)
+    try:
+        async for item in agen:
+            yield item
+    finally:
+        await agen.aclose()
+
+
+async def verify(blocks, samples=VERIFY_SAMPLES, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY,
+                 user_agent=USER_AGENT, cache=None, controller=None):
+    """
+    多频道体检：blocks 为 (key, [频道 url, ...]) 的可迭代对象
+
+    每个网段均匀抽样 samples 个频道，经一条 keep-alive 连接逐个确认；
+    按完成顺序产出 (key, {url: 是否存活})。
+    controller 为 AdaptiveController 时代替固定的并发池 (以网段为单位)。
+    """
+    slots = controller or asyncio.Semaphore(concurrency)
+
+    async def one(key, urls):
+        async with slots:
+            return key, await verify_block(sample(urls, samples), timeout, user_agent, cache, controller)
+
+    window = controller.maximum if controller is not None else concurrency
+    agen = _bounded((one(key, urls) for key, urls in blocks), window * 2)
+    try:
+        async for item in agen:
+            yield item
+    finally:
+        await agen.aclose()
@@ -1,69 +1,134 @@
-import os, requests, re, concurrent.futures
+import os, re
 from urllib.parse import urlparse
 
+import metrics
+from adaptive import make_controller
+from candidates import build_index, last_octet
+from channel_list import Channel, HostBlock, iter_blocks, write_blocks
+from host_history import HostHistory
+from liveness_cache import LivenessCache
+from probe import iter_async, sweep_many
+
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_DEAD = os.path.join(CURRENT_DIR, "dead_tasks.txt")
 OUTPUT_RESCUED = os.path.join(CURRENT_DIR, "rescued_temp.txt")
 
 TIMEOUT = 4 
-MAX_WORKERS = 60
+MAX_CONCURRENCY = 1000    # 所有网段共用的全局并发池
+SWEEP_CONCURRENCY = 64    # 单个网段同时在途的探测数
+MAX_ACTIVE_SWEEPS = 32    # 同时展开的网段数
+
+def sweep_job(block):
+    """HostBlock -> 爆破任务 (prefix, port, path)；旧地址不是 IP:端口 时抛出 ValueError"""
+    old_ip = block.host
 
-def check_url(url):
+    # --- 修复逻辑：必须包含冒号且符合 IP 结构 ---
+    if ':' not in old_ip or not re.match(r'^\d', old_ip):
+        raise ValueError(f"⚠️ 跳过非 IP 格式: {old_ip}")
     try:
-        r = requests.get(url, timeout=TIMEOUT, stream=True)
-        return r.status_code == 200
-    except: return False
+        ip_part, port = old_ip.split(':')
+        prefix = ".".join(ip_part.split('.')[:3])
+        path = urlparse(block.channels[0].url).path
+    except Exception as e:
+        raise ValueError(f"⚠️ 错误: {old_ip} {e}")
+    return prefix, port, path
+
+def history_key(job):
+    """爆破任务在 HostHistory("sweep") 中的键: a.b.c.0/24:端口/路径"""
+    prefix, port, path = job
+    return f"{prefix}.0/24:{port}{path}"
+
+def job_due(job, history):
+    """本轮是否爆破该任务；长期扫不到的网段按历史指数退避"""
+    if history is None or history.due(history_key(job)):
+        return True
+    key = history_key(job)
+    print(f"⏭️ 跳过爆破 {key} ({history.state(key)}，第 {history.next_run(key)} 次运行再扫)", flush=True)
+    return False
+
+def plan_sweeps(blocks):
+    """把全部失效块展开为爆破任务，相同 (prefix, port, path) 只扫一次"""
+    jobs = {}  # 结构: { (prefix, port, path): [块序号, ...] }
+    for idx, block in enumerate(blocks):
+        try:
+            job = sweep_job(block)
+        except ValueError as e:
+            print(f"[{idx+1}/{len(blocks)}] {e}", flush=True)
+            continue
+        jobs.setdefault(job, []).append(idx)
+    return jobs
+
+def rebuild_block(block, new_host):
+    return HostBlock(new_host, [Channel(c.name, f"http://{new_host}{urlparse(c.url).path}", new_host)
+                                for c in block.channels])
+
+def rescue_blocks(blocks, cache=None, index=None, history=None):
+    """
+    爆破失效 HostBlock 列表 -> 抢救成功的新块 (按原始顺序)
+
+    history 为 HostHistory 时跳过按历史退避中的网段，并记录本轮各网段是否扫到存活主机。
+    """
+    if not blocks:
+        return []
+
+    jobs = plan_sweeps(blocks)
+    total = sum(len(ids) for ids in jobs.values())
+    print(f"🚀 {total} 个失效块合并为 {len(jobs)} 个爆破任务，统一调度...", flush=True)
+    # 跳过的任务直接算作失败
+    skipped = sum(len(jobs.pop(job)) for job in list(jobs) if not job_due(job, history))
+
+    index = index or build_index()
+
+    def order(job):
+        # 以该任务第一个失效块的旧 IP 为中心，按历史命中排序候选
+        old_ip = blocks[jobs[job][0]].host
+        return index.rank(*job, old_octet=last_octet(old_ip))
+
+    rescued = {}
+    done = skipped
+    controller = make_controller("抢救", MAX_CONCURRENCY, TIMEOUT)
+    results = sweep_many(jobs, timeout=TIMEOUT, concurrency=MAX_CONCURRENCY,
+                         sweep_concurrency=SWEEP_CONCURRENCY, max_sweeps=MAX_ACTIVE_SWEEPS,
+                         cache=cache, order=order, controller=controller)
+    with metrics.phase("probe"):
+        for (prefix, port, path), sweep in iter_async(results):
+            new_host = sweep.hosts[0] if sweep.hosts else None
+            if history is not None and (new_host or not sweep.starved):
+                # 扫到的新主机不入历史，成功的任务下一轮照常爆破；只有失败可以沿用
+                history.record(history_key((prefix, port, path)), bool(new_host), reusable=not new_host)
+            for idx in jobs[(prefix, port, path)]:
+                done += 1
+                old_ip = blocks[idx].host
+                if new_host:
+                    print(f"[{done}/{total}] ✨ 成功: {old_ip} -> {new_host} (省下 {sweep.saved} 次探测)", flush=True)
+                    rescued[idx] = rebuild_block(blocks[idx], new_host)
+                else:
+                    print(f"[{done}/{total}] ❌ 失败: {old_ip}", flush=True)
+    if controller:
+        controller.summary()
+
+    print(f"📊 抢救完成。成功: {len(rescued)} | 失败: {total - len(rescued)}", flush=True)
+    # 按原始顺序返回，保证结果稳定
+    return [rescued[idx] for idx in sorted(rescued)]
 
 def main():
     if not os.path.exists(INPUT_DEAD) or os.path.getsize(INPUT_DEAD) == 0:
         print("🚑 没有待抢救的任务。", flush=True)
         return
 
-    with open(INPUT_DEAD, 'r', encoding='utf-8') as f:
-        blocks = [b.strip() for b in f.read().split('\n\n') if b.strip()]
+    cache = LivenessCache()
+    history = HostHistory("sweep")
+    with metrics.phase("parse"):
+        blocks = list(iter_blocks(INPUT_DEAD))
+    rescued = rescue_blocks(blocks, cache, history=history)
+    history.close()
+    cache.close()
 
-    rescued_blocks = []
-    for idx, block in enumerate(blocks):
-        lines = block.split('\n')
-        old_ip = lines[0].split(',')[0].strip()
-        
-        # --- 修复逻辑：必须包含冒号且符合 IP 结构 ---
-        if ':' not in old_ip or not re.match(r'^\d', old_ip):
-            print(f"[{idx+1}/{len(blocks)}] ⚠️ 跳过非 IP 格式: {old_ip}", flush=True)
-            continue
-
-        print(f"[{idx+1}/{len(blocks)}] 🔎 爆破抢救: {old_ip}", flush=True)
-        
-        try:
-            ip_part, port = old_ip.split(':')
-            prefix = ".".join(ip_part.split('.')[:3])
-            path = urlparse(lines[1].split(',')[1]).path
-            
-            tasks = [f"http://{prefix}.{i}:{port}{path}" for i in range(1, 256)]
-            new_host = None
-            
-            with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as exe:
-                fut_to_url = {exe.submit(check_url, u): u for u in tasks}
-                for fut in concurrent.futures.as_completed(fut_to_url):
-                    if fut.result():
-                        new_host = urlparse(fut_to_url[fut]).netloc
-                        break
-            
-            if new_host:
-                print(f"  ✨ 成功: {new_host}", flush=True)
-                res = f"{new_host},#genre#\n"
-                for l in lines[1:]:
-                    if ',' in l:
-                        name, url = l.split(',', 1)
-                        res += f"{name},http://{new_host}{urlparse(url).path}\n"
-                rescued_blocks.append(res + "\n\n")
-            else:
-                print("  ❌ 失败", flush=True)
-        except Exception as e:
-            print(f"  ⚠️ 错误: {e}", flush=True)
-
-    with open(OUTPUT_RESCUED, 'w', encoding='utf-8') as f:
-        f.writelines(rescued_blocks)
+    with metrics.phase("write"):
+        with open(OUTPUT_RESCUED, 'w', encoding='utf-8') as f:
+            write_blocks(f, rescued)
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("抢救"):
+        main()
+    metrics.write_report()
@@ -0,0 +1,331 @@
+"""
+本地播放列表服务：把最新的输出一次读进内存，按 HTTP 缓存语义提供给播放器 / 镜像
+
+路由:
+    GET /final_hotel.m3u                       完整 M3U
+    GET /final_hotel.m3u?group=ip:port         只含该 group-title 的频道 (参数可重复，取并集)
+    GET /final_hotel.m3u?name=CCTV1            只含该频道 (按 alias.txt 归一化，参数可重复)；
+                                               group 与 name 同时给出时取交集
+    GET /final_hotel.txt                       完整 TXT
+    GET /final_hotel.manifest.json             内容清单 (见 format_output.py)
+    GET /delta/final_hotel.<seq>.json          差分 (见 playlist_delta.py)
+    GET /groups.json                           各分组的频道数
+    GET /_stats                                请求计数与当前快照
+HEAD 与 GET 相同但不带正文。每个资源 (含每个过滤视图) 都带强 ETag，每种编码各一个:
+    If-None-Match 命中                         304
+    Accept-Encoding 含 gzip                    返回预先压缩好的字节 (Vary: Accept-Encoding)
+    Range: bytes=a-b (单段)                    206；越界 416；If-Range 与 ETag 不符时忽略 Range
+过滤视图由载入时建好的 分组 / 频道名 -> 条目序号 索引拼出，不逐请求扫描播放列表，
+并按快照缓存最近 MAX_VIEWS 个视图。
+
+热重载: 后台线程每 RELOAD_INTERVAL 秒检查各文件的 (大小, mtime)，有变化时在旁边构建新快照，
+再整体替换引用；进行中的请求继续使用它开始时拿到的快照，不会中断，也不会读到新旧混杂的内容。
+
+用法:
+    python md/serve_playlist.py [端口] [目录]       目录默认为仓库根目录
+    python md/benchmark.py serve [并发] [秒数]      压测 (同时不断改写播放列表以覆盖热重载)
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from channel_alias import normalize, resolve
+from channel_list import iter_m3u
+from playlist_delta import etag
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARENT_DIR = os.path.dirname(CURRENT_DIR)
+PORT = int(os.environ.get("PLAYLIST_PORT", 8380))
+RELOAD_INTERVAL = float(os.environ.get("PLAYLIST_RELOAD_INTERVAL", 1.0))
+GZIP_LEVEL = 6
+MAX_VIEWS = 256
+FILES = {
+    "/final_hotel.m3u": ("final_hotel.m3u", "audio/x-mpegurl; charset=utf-8"),
+    "/final_hotel.txt": ("final_hotel.txt", "text/plain; charset=utf-8"),
+    "/final_hotel.manifest.json": ("final_hotel.manifest.json", "application/json"),
+}
+DELTA_DIR = "delta"
+DELTA_NAME = re.compile(r'^final_hotel\.\d+\.json$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+HEADER_RE = re.compile(r'^#EXTM3U.*$', re.M)
+
+
+class Resource:
+    """一份响应正文及其 gzip 版本，各带强 ETag"""
+    __slots__ = ("body", "gzip", "etag", "gzip_etag", "content_type")
+
+    def __init__(self, body, content_type):
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag(hashlib.sha256(body).hexdigest())
+        packed = gzip.compress(body, GZIP_LEVEL, mtime=0)
+        # 压缩后反而更大时不提供 gzip
+        self.gzip = packed if len(packed) < len(body) else None
+        self.gzip_etag = etag(hashlib.sha256(packed).hexdigest()) if self.gzip else None
+
+
+def channel_key(name):
+    """频道名 -> 过滤用的键：alias.txt 收录的先映射为主名"""
+    return normalize(resolve(name) or name)
+
+
+def signature(root):
+    """各被服务文件的 (名称, 大小, mtime)；变化即重载"""
+    names = [name for name, _ in FILES.values()]
+    delta_dir = os.path.join(root, DELTA_DIR)
+    if os.path.isdir(delta_dir):
+        names += [f"{DELTA_DIR}/{n}" for n in sorted(os.listdir(delta_dir)) if DELTA_NAME.match(n)]
+    sig = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(root, name))
+        except OSError:
+            continue
+        sig.append((name, st.st_size, st.st_mtime_ns))
+    return tuple(sig)
+
+
+class Snapshot:
+    """某一时刻全部输出的只读内存副本，外加分组 / 频道名索引"""
+
+    def __init__(self, root, sig=None):
+        self.signature = sig if sig is not None else signature(root)
+        self.loaded = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.resources = {}
+        for name, _, _ in self.signature:
+            with open(os.path.join(root, name), 'rb') as f:
+                data = f.read()
+            path = "/" + name
+            content_type = FILES[path][1] if path in FILES else "application/json"
+            self.resources[path] = Resource(data, content_type)
+
+        # M3U 条目与索引: 分组 / 频道键 -> 条目序号 (升序)
+        self.header = b"#EXTM3U"
+        self.entries = []
+        self.groups, self.names = {}, {}
+        m3u = self.resources.get("/final_hotel.m3u")
+        if m3u is not None:
+            text = m3u.body.decode('utf-8', 'ignore')
+            m = HEADER_RE.search(text)
+            if m:
+                self.header = m.group(0).encode('utf-8')
+            for ch in iter_m3u(text.splitlines()):
+                idx = len(self.entries)
+                self.entries.append(f"{ch.extinf}\n{ch.url}".encode('utf-8') if ch.extinf else ch.url.encode('utf-8'))
+                self.groups.setdefault(ch.group or "", []).append(idx)
+                self.names.setdefault(channel_key(ch.name), []).append(idx)
+        groups = {group: len(ids) for group, ids in self.groups.items()}
+        self.resources["/groups.json"] = Resource(
+            json.dumps(groups, ensure_ascii=False, indent=1).encode('utf-8'), "application/json")
+        self._views = OrderedDict()
+        self._lock = threading.Lock()
+
+    def view(self, groups, names):
+        """按分组 / 频道名过滤的 M3U；没有匹配的条目返回 None"""
+        key = (tuple(sorted(groups)), tuple(sorted(channel_key(n) for n in names)))
+        with self._lock:
+            if key in self._views:
+                self._views.move_to_end(key)
+                return self._views[key]
+        selected = None
+        for index, wanted in ((self.groups, key[0]), (self.names, key[1])):
+            if wanted:
+                ids = set()
+                for k in wanted:
+                    ids.update(index.get(k, ()))
+                selected = ids if selected is None else selected & ids
+        if not selected:
+            return None
+        body = b"\n".join([self.header] + [self.entries[i] for i in sorted(selected)])
+        res = Resource(body, FILES["/final_hotel.m3u"][1])
+        with self._lock:
+            self._views[key] = res
+            while len(self._views) > MAX_VIEWS:
+                self._views.popitem(last=False)
+        return res
+
+
+class PlaylistStore:
+    """持有当前快照，后台线程发现文件变化时整体替换"""
+
+    def __init__(self, root=PARENT_DIR, reload_interval=RELOAD_INTERVAL):
+        self.root = root
+        self.reload_interval = reload_interval
+        self.snapshot = Snapshot(root)
+        self.reloads = 0
+        self._stop = threading.Event()
+        if reload_interval:
+            threading.Thread(target=self._watch, daemon=True).start()
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            sig = signature(self.root)
+            if sig == self.snapshot.signature:
+                continue
+            try:
+                snapshot = Snapshot(self.root, sig)
+            except OSError as e:
+                # 文件在读取途中被替换 / 删除，下一轮再试
+                print(f"⚠️ 重载失败: {e}", flush=True)
+                continue
+            self.snapshot = snapshot
+            self.reloads += 1
+            print(f"🔄 已重载 ({len(snapshot.entries)} 个频道，{len(snapshot.groups)} 个分组)", flush=True)
+
+    def stop(self):
+        self._stop.set()
+
+
+def accepts_gzip(header):
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if token.strip().lower() in ("gzip", "*"):
+            q = params.strip()
+            try:
+                return not (q.startswith("q=") and float(q[2:] or 0) == 0)
+            except ValueError:
+                return True
+    return False
+
+
+def etag_matches(header, tag):
+    """If-None-Match 采用弱比较 (忽略 W/ 前缀)"""
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == tag:
+            return True
+    return False
+
+
+def parse_range(header, size):
+    """单段 Range -> (起, 止) 闭区间；无法满足返回 False；多段或格式不认识返回 None (按完整内容响应)"""
+    m = RANGE_RE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if not m.group(1):
+        length = int(m.group(2))
+        return (max(0, size - length), size - 1) if length and size else False
+    start = int(m.group(1))
+    end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头与正文分两次写出，小响应会被 Nagle + 延迟确认卡住约 40ms
+    disable_nagle_algorithm = True
+    stats = Counter()
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.stats[key] += 1
+
+    def _send(self, status, body=b"", headers=(), head=False):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(body)
+        self._count(status)
+
+    def _resource(self, snapshot):
+        # 请求行按 latin-1 解码；未做百分号编码的中文频道名在这里还原为 UTF-8
+        parts = urlsplit(self.path.encode('latin-1', 'ignore').decode('utf-8', 'replace'))
+        if parts.path == "/final_hotel.m3u" and parts.query:
+            query = parse_qs(parts.query)
+            if query.get("group") or query.get("name"):
+                self._count("view")
+                return snapshot.view(query.get("group", []), query.get("name", []))
+        return snapshot.resources.get(parts.path)
+
+    def _serve(self, head):
+        self._count("requests")
+        snapshot = self.server.store.snapshot  # 整个请求只用这一个快照
+        if urlsplit(self.path).path == "/_stats":
+            with self.lock:
+                stats = {str(k): v for k, v in self.stats.items()}
+            body = json.dumps({"requests": stats, "loaded": snapshot.loaded, "reloads": self.server.store.reloads,
+                               "channels": len(snapshot.entries), "groups": len(snapshot.groups)}).encode('utf-8')
+            return self._send(200, body, [("Content-Type", "application/json")], head)
+        res = self._resource(snapshot)
+        if res is None:
+            return self._send(404, b"not found", [("Content-Type", "text/plain")], head)
+
+        use_gzip = res.gzip is not None and accepts_gzip(self.headers.get("Accept-Encoding"))
+        body, tag = (res.gzip, res.gzip_etag) if use_gzip else (res.body, res.etag)
+        headers = [("ETag", tag), ("Vary", "Accept-Encoding"), ("Cache-Control", "no-cache"),
+                   ("Accept-Ranges", "bytes")]
+        if use_gzip:
+            headers.append(("Content-Encoding", "gzip"))
+            self._count("gzip")
+
+        inm = self.headers.get("If-None-Match")
+        if inm and etag_matches(inm, tag):
+            return self._send(304, b"", headers, head=True)
+
+        headers.append(("Content-Type", res.content_type))
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if range_header and (not if_range or if_range.strip() == tag):
+            span = parse_range(range_header, len(body))
+            if span is False:
+                return self._send(416, b"", headers + [("Content-Range", f"bytes */{len(body)}")], head)
+            if span is not None:
+                start, end = span
+                headers.append(("Content-Range", f"bytes {start}-{end}/{len(body)}"))
+                return self._send(206, body[start:end + 1], headers, head)
+        self._send(200, body, headers, head)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+
+class PlaylistServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+def serve(port=0, root=PARENT_DIR, reload_interval=RELOAD_INTERVAL):
+    """启动服务 (后台线程)，返回 (server, base_url)；server.store 为 PlaylistStore"""
+    server = PlaylistServer(("127.0.0.1", int(port)), Handler)
+    server.store = PlaylistStore(root, reload_interval)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    port = sys.argv[1] if len(sys.argv) > 1 else PORT
+    root = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else PARENT_DIR
+    server, url = serve(port, root)
+    snap = server.store.snapshot
+    print(f"📺 播放列表服务: {url}/final_hotel.m3u ({len(snap.entries)} 个频道，{len(snap.groups)} 个分组，"
+          f"目录 {root})")
+    print(f"   过滤示例: {url}/final_hotel.m3u?name=CCTV1  {url}/groups.json")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.store.stop()
+        server.shutdown()
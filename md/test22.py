@@ -1,10 +1,18 @@
 import re
+import json
+import hashlib
 import requests
 from pathlib import Path
 import os
 import sys
+import queue
+import threading
 from collections import defaultdict
 
+import metrics
+from channel_alias import AliasResolver, normalize
+from channel_list import iter_m3u
+
 # 禁用 SSL 警告（忽略过期证书等）
 import urllib3
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -44,7 +52,64 @@ CATEGORY_ORDER = ["4K","央视频道","卫视频道","国际频道","CIBN","求
     "陕西","青海","黑龙江","地方频道","其它频道"]
 
 # ==================== 1. 从 md/httop_links.txt 下载 m3u ====================
-def download_m3u_from_links() -> str:
+# 所有链接并发下载，第一个有效的 m3u 胜出，其余取消；
+# 上次胜出的链接带 ETag / Last-Modified 条件请求，304 且构建输入未变时直接结束；
+# 条件请求先单独跑 CONDITIONAL_HEAD_START 秒，免得其余镜像的完整 200 抢在 304 之前
+FETCH_CACHE = Path("md/.cache/m3u_source.json")
+FETCH_TIMEOUT = 30
+CONDITIONAL_HEAD_START = 3
+FETCH_CHUNK = 64 * 1024
+
+def logo_sources_signature() -> str:
+    """alias.txt 内容 + 台标文件清单(路径/大小)的摘要；不用 mtime，CI 每次检出都会刷新 mtime"""
+    h = hashlib.sha1()
+    if ALIAS_FILE.exists():
+        h.update(ALIAS_FILE.read_bytes())
+    for directory in (TVLOGO_DIR, IMG_DIR):
+        if directory.exists():
+            for f in sorted(directory.rglob("*")):
+                if f.is_file():
+                    h.update(f"{f.as_posix()}:{f.stat().st_size}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def build_signature() -> str:
+    """除 m3u 内容外决定输出的全部输入：本脚本 + alias.txt + 台标文件清单"""
+    return hashlib.sha1(Path(__file__).read_bytes() + logo_sources_signature().encode()).hexdigest()
+
+def load_fetch_cache() -> dict:
+    try:
+        return json.loads(FETCH_CACHE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def save_fetch_cache(state: dict):
+    FETCH_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    FETCH_CACHE.write_text(json.dumps(state, ensure_ascii=False, indent=1), encoding="utf-8")
+
+def fetch_link(session, url: str, validators: dict, stop: threading.Event):
+    """
+    下载单个链接 -> (状态码, 文本, 响应头)；被取消时返回 (None, None, None)
+    接受 gzip；validators 非空时发送条件请求
+    """
+    headers = {"Accept-Encoding": "gzip, deflate"}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    with session.get(url, timeout=FETCH_TIMEOUT, verify=False, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            return 304, None, response.headers
+        response.raise_for_status()
+        chunks = []
+        for chunk in response.iter_content(FETCH_CHUNK):
+            if stop.is_set():
+                return None, None, None
+            chunks.append(chunk)
+        charset = response.encoding if "charset" in response.headers.get("Content-Type", "") else "utf-8"
+        return response.status_code, b"".join(chunks).decode(charset, errors="replace"), response.headers
+
+def download_m3u_from_links():
+    """返回 (m3u 文本, 胜出的链接, 该链接的缓存校验头)；源返回 304 且输出不会改变时返回 None"""
     if not LINKS_FILE_PATH.exists():
         print(f"❌ 链接文件不存在: {LINKS_FILE_PATH}")
         sys.exit(1)
@@ -59,14 +124,68 @@ def download_m3u_from_links() -> str:
         print(f"❌ {LINKS_FILE_PATH} 中没有有效的链接")
         sys.exit(1)
 
-    print(f"🔗 发现 {len(links)} 个待尝试的链接")
+    print(f"🔗 发现 {len(links)} 个链接，并发下载")
+
+    # 只有上次胜出的链接的内容留在本地 (SAVE_ORIGINAL_PATH)，所以只对它发条件请求
+    cache = load_fetch_cache()
+    last_winner = cache.get("winner") if SAVE_ORIGINAL_PATH.exists() else None
+    stop = threading.Event()
+    session = requests.Session()
+    results = queue.Queue()
 
-    for idx, url in enumerate(links, 1):
-        print(f"[{idx}/{len(links)}] 正在尝试下载: {url}")
+    started = set()
+
+    def worker(idx, url, validators):
         try:
-            response = requests.get(url, timeout=30, verify=False)
-            response.raise_for_status()
-            content = response.text.strip()
+            results.put((idx, url, fetch_link(session, url, validators, stop), None))
+        except Exception as e:
+            results.put((idx, url, None, e))
+
+    def start(idx, url):
+        # 守护线程：胜出后不必等待仍卡在死链上的下载
+        validators = cache.get("validators", {}) if url == last_winner else {}
+        started.add(url)
+        threading.Thread(target=worker, args=(idx, url, validators), daemon=True).start()
+
+    def start_rest():
+        for idx, url in enumerate(links, 1):
+            if url not in started:
+                start(idx, url)
+
+    # 条件请求先行：304 只有几百字节，通常远早于任何镜像的完整下载返回；
+    # 超时、失败或内容无效时再启动其余镜像
+    if last_winner in links:
+        start(links.index(last_winner) + 1, last_winner)
+    else:
+        start_rest()
+
+    received = 0
+    try:
+        while received < len(links):
+            try:
+                item = results.get(timeout=CONDITIONAL_HEAD_START if len(started) < len(links) else None)
+            except queue.Empty:
+                print(f"⏱️ 条件请求 {CONDITIONAL_HEAD_START}s 内未返回，启动其余 {len(links) - len(started)} 个链接")
+                start_rest()
+                continue
+            received += 1
+            idx, url, result, error = item
+            if error is not None:
+                print(f"❌ 下载失败 {url}: {error}")
+                start_rest()
+                continue
+            status, content, headers = result
+            if status is None:
+                continue
+
+            if status == 304:
+                if cache.get("build") == build_signature() and OUTPUT_M3U.exists() and OUTPUT_TXT.exists():
+                    print(f"⏭️ {url} 返回 304，且别名表/台标/脚本均未变化，输出不会改变，本次跳过")
+                    return None
+                print(f"♻️ {url} 返回 304，构建输入有变化，使用本地备份 {SAVE_ORIGINAL_PATH} 重新生成")
+                return SAVE_ORIGINAL_PATH.read_text(encoding="utf-8"), url, cache.get("validators", {})
+
+            content = content.strip()
             if content.startswith("#EXTM3U") or "#EXTINF" in content:
                 print(f"✅ 成功下载有效内容: {url}")
                 # 保存本次成功的原始备份
@@ -75,35 +194,41 @@ def download_m3u_from_links() -> str:
                 save_path.write_text(content, encoding="utf-8")
                 print(f"💾 已保存原始文件: {save_path}")
                 # 更新主备份路径为最新成功文件（可选）
-                content_to_use = content
                 SAVE_ORIGINAL_PATH.write_text(content, encoding="utf-8")
                 print(f"💾 主备份已更新: {SAVE_ORIGINAL_PATH}")
-                return content_to_use
+                validators = {"etag": headers.get("ETag"), "last_modified": headers.get("Last-Modified")}
+                return content, url, validators
             else:
                 print(f"⚠️ 下载内容无效（非 m3u 格式）: {url}")
-        except Exception as e:
-            print(f"❌ 下载失败 {url}: {e}")
+                start_rest()
+    finally:
+        # 胜出后通知其余下载在下一个数据块处退出
+        stop.set()
 
     print("❌ 所有链接均下载失败或内容无效")
     sys.exit(1)
 
-m3u_content = download_m3u_from_links()
+with metrics.stage("抓取"):
+    fetched = download_m3u_from_links()
+if fetched is None:
+    # 先写出阶段指标再退出，跳过的运行也留有记录
+    metrics.write_report()
+    sys.exit(0)
+m3u_content, source_url, source_validators = fetched
 
 # ==================== 2. 加载别名表 ====================
-alias_db = {}
-if ALIAS_FILE.exists():
-    for line in ALIAS_FILE.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"): 
-            continue
-        parts = [p.strip() for p in line.split(",") if p.strip()]
-        if not parts: 
-            continue
-        main_name = parts[0]
-        alias_db[main_name] = set(parts)
+# 精确别名 + 通配别名 (*) 统一由 channel_alias 编译解析
+resolver = AliasResolver(ALIAS_FILE)
+alias_db = resolver.aliases
 
 # ==================== 3. 加载台标库 ====================
+# 台标索引: 归一化频道名 -> (分类, 文件名)，构建一次后缓存到磁盘，
+# 台标目录或 alias.txt 有任何变化时自动重建
+LOGO_CACHE = Path("md/.cache/logo_index.json")
+QUALITY_RE = re.compile(r"(高清|HD|超清|4K|PLUS).*$", re.I)
+
 logo_map = {}
+
 def load_logos_from_dir(directory: Path, base_cat: str = None) -> int:
     if not directory.exists(): 
         return 0
@@ -115,26 +240,18 @@ def load_logos_from_dir(directory: Path, base_cat: str = None) -> int:
         cat = base_cat if base_cat is not None else directory.name
         logo_stem = f.stem
         logo_name = f.name
+        clean_stem = normalize(logo_stem)
        
         # 阶段 A: 通过 alias.txt 映射
-        main_name_found = None
-        for main, aliases in alias_db.items():
-            clean_logo_stem = re.sub(r"[-_ .]","", logo_stem).upper()
-            for alias in aliases:
-                clean_alias = re.sub(r"[-_ .]","", alias).upper()
-                if clean_logo_stem == clean_alias:
-                    main_name_found = main
-                    break
-            if main_name_found: 
-                break
+        main_name_found = resolver.exact.get(clean_stem)
        
         if main_name_found:
             all_aliases = alias_db.get(main_name_found, {main_name_found})
             for alias in all_aliases:
                 keys_to_add = {
                     alias.upper(),
-                    re.sub(r"[-_ .]","", alias).upper(),
-                    re.sub(r"(高清|HD|超清|4K|PLUS).*$","", alias, flags=re.I).strip().upper()
+                    normalize(alias),
+                    QUALITY_RE.sub("", alias).strip().upper()
                 }
                 for k in keys_to_add:
                     if k and k not in logo_map:
@@ -142,7 +259,6 @@ def load_logos_from_dir(directory: Path, base_cat: str = None) -> int:
                         new_aliases += 1
        
         # 阶段 B: 添加文件名本身映射
-        clean_stem = re.sub(r"[-_ .]","", logo_stem).upper()
         if logo_stem.upper() not in logo_map:
             logo_map[logo_stem.upper()] = (cat, logo_name)
             new_aliases += 1
@@ -152,32 +268,46 @@ def load_logos_from_dir(directory: Path, base_cat: str = None) -> int:
    
     return new_aliases
 
-total_aliases = 0
-if TVLOGO_DIR.exists():
-    for folder in TVLOGO_DIR.iterdir():
-        if folder.is_dir():
-            total_aliases += load_logos_from_dir(folder)
-if IMG_DIR.exists():
-    total_aliases += load_logos_from_dir(IMG_DIR, base_cat='img')
-print(f"台标库加载完成：共映射 {total_aliases} 个频道名称变体。")
+signature = logo_sources_signature()
+cached = None
+if LOGO_CACHE.exists():
+    try:
+        cached = json.loads(LOGO_CACHE.read_text(encoding="utf-8"))
+    except ValueError:
+        cached = None
+
+if cached and cached.get("signature") == signature:
+    logo_map = {k: tuple(v) for k, v in cached["logo_map"].items()}
+    total_aliases = cached["total"]
+    print(f"台标库索引命中缓存：共映射 {total_aliases} 个频道名称变体。")
+else:
+    total_aliases = 0
+    if TVLOGO_DIR.exists():
+        for folder in sorted(TVLOGO_DIR.iterdir()):
+            if folder.is_dir():
+                total_aliases += load_logos_from_dir(folder)
+    if IMG_DIR.exists():
+        total_aliases += load_logos_from_dir(IMG_DIR, base_cat='img')
+    print(f"台标库加载完成：共映射 {total_aliases} 个频道名称变体。")
+    LOGO_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    LOGO_CACHE.write_text(json.dumps({"signature": signature, "total": total_aliases,
+                                      "logo_map": logo_map}, ensure_ascii=False), encoding="utf-8")
 
 # ==================== 4. 主程序（解析下载的 m3u 内容） ====================
+SUFFIX_RES = [re.compile(f'{re.escape(suffix)}$', re.I)
+              for suffix in ["频道", "卫视", "台", "高清", "HD", "超清", "4K", "PLUS"]]
 grouped_channels = defaultdict(lambda: defaultdict(list))
 total = 0
-extinf = None
-for raw in m3u_content.splitlines():
-    line = raw.strip()
-   
-    if line.startswith("#EXTINF:"):
-        extinf = line
-    elif line and not line.startswith("#"):
-        if not extinf:
-            extinf = None
+# 分类循环是全脚本的热点，STAGE_PROFILE=cprofile 时可单独剖析
+with metrics.stage("分类"):
+    for ch in iter_m3u(m3u_content.splitlines()):
+        if ch.extinf is None:
             continue
-       
-        raw_name = extinf.split(",",1)[-1].strip() if "," in extinf else ""
+        extinf = ch.extinf
+   
+        raw_name = ch.name
         name_upper = raw_name.upper()
-        stream_url = line
+        stream_url = ch.url
         skip_processing = False
        
         # A. 预处理：纯数字频道保留
@@ -192,15 +322,18 @@ for raw in m3u_content.splitlines():
             best_match_cat = None
            
             aggressive_clean_name = raw_name
-            for suffix in ["频道", "卫视", "台", "高清", "HD", "超清", "4K", "PLUS"]:
-                aggressive_clean_name = re.sub(f'{re.escape(suffix)}$', '', aggressive_clean_name, flags=re.I).strip()
+            for suffix_re in SUFFIX_RES:
+                aggressive_clean_name = suffix_re.sub('', aggressive_clean_name).strip()
            
-            candidates = {
+            # 先按 alias.txt 解析出的主名找台标，再退回原名的各种变体
+            canonical = resolver.resolve(raw_name)
+            candidates = [normalize(canonical)] if canonical else []
+            candidates += [
                 name_upper,
-                re.sub(r"[-_ .]","", name_upper),
+                normalize(name_upper),
                 aggressive_clean_name.upper(),
-                re.sub(r"[-_ .]","", aggressive_clean_name).upper()
-            }
+                normalize(aggressive_clean_name)
+            ]
            
             for key in candidates:
                 if logo_map.get(key):
@@ -253,45 +386,49 @@ for raw in m3u_content.splitlines():
             'url': stream_url
         })
         total += 1
-        extinf = None
 
 # ==================== 5. 排序 + 写入文件 ====================
 def get_sort_key(group_internal_name):
     display_name = GROUP_MAPPING.get(group_internal_name, group_internal_name)
     return CATEGORY_ORDER.index(display_name) if display_name in CATEGORY_ORDER else 9999
 
-sorted_groups_internal = sorted(grouped_channels.keys(), key=get_sort_key)
-m3u_lines = ['#EXTM3U x-tvg-url="https://live.fanmingming.com/e.xml"']
-txt_lines = []
+with metrics.stage("写入"):
+    sorted_groups_internal = sorted(grouped_channels.keys(), key=get_sort_key)
+    m3u_lines = ['#EXTM3U x-tvg-url="https://live.fanmingming.com/e.xml"']
+    txt_lines = []
 
-for group_internal_name in sorted_groups_internal:
-    channels = grouped_channels[group_internal_name]
-    group_display_name = GROUP_MAPPING.get(group_internal_name, group_internal_name)
+    for group_internal_name in sorted_groups_internal:
+        channels = grouped_channels[group_internal_name]
+        group_display_name = GROUP_MAPPING.get(group_internal_name, group_internal_name)
    
-    sorted_channels = sorted(channels.keys(), key=lambda c: channels[c][0]['channel_sort_key'])
+        sorted_channels = sorted(channels.keys(), key=lambda c: channels[c][0]['channel_sort_key'])
    
-    txt_lines.append(f"{group_display_name},#genre#")
-    txt_lines.append("")  # 空行分隔
+        txt_lines.append(f"{group_display_name},#genre#")
+        txt_lines.append("")  # 空行分隔
    
-    for channel_name in sorted_channels:
-        links = channels[channel_name]
-        for item in links:
-            m3u_lines.append(item['extinf'])
-            m3u_lines.append(item['url'])
-            txt_lines.append(f"{channel_name},{item['url']}")
-
-# 写入 M3U
-try:
-    OUTPUT_M3U.write_text('\n'.join(m3u_lines) + '\n', encoding="utf-8")
-    print(f"✅ 已生成 M3U 文件: {OUTPUT_M3U.name}")
-except Exception as e:
-    print(f"❌ 写入 M3U 失败: {e}")
-
-# 写入 TXT
-try:
-    OUTPUT_TXT.write_text('\n'.join(txt_lines) + '\n', encoding="utf-8")
-    print(f"✅ 已生成 TVbox TXT 文件: {OUTPUT_TXT.name}")
-except Exception as e:
-    print(f"❌ 写入 TXT 失败: {e}")
+        for channel_name in sorted_channels:
+            links = channels[channel_name]
+            for item in links:
+                m3u_lines.append(item['extinf'])
+                m3u_lines.append(item['url'])
+                txt_lines.append(f"{channel_name},{item['url']}")
+
+    # 写入 M3U
+    try:
+        OUTPUT_M3U.write_text('\n'.join(m3u_lines) + '\n', encoding="utf-8")
+        print(f"✅ 已生成 M3U 文件: {OUTPUT_M3U.name}")
+    except Exception as e:
+        print(f"❌ 写入 M3U 失败: {e}")
+
+    # 写入 TXT
+    try:
+        OUTPUT_TXT.write_text('\n'.join(txt_lines) + '\n', encoding="utf-8")
+        print(f"✅ 已生成 TVbox TXT 文件: {OUTPUT_TXT.name}")
+    except Exception as e:
+        print(f"❌ 写入 TXT 失败: {e}")
+
+# 记录本次的源与构建输入，下次源返回 304 且输入未变时可直接跳过
+save_fetch_cache({"winner": source_url, "validators": source_validators, "build": build_signature()})
 
 print(f"🎉 完美收工！共处理 {total} 条线路（包含纯数字频道）")
+metrics.write_report()
@@ -1,10 +1,21 @@
+import hashlib
+import io
+import json
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from urllib.parse import urlparse
 
+from channel_alias import ALIAS_FILE, resolve
+from channel_list import iter_m3u
+from history_pack import History
+
 # --- 配置 ---
 BASE_DIR = "history"
 SAVE_PATH = "hotel.txt"
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "hotel_scan.json")
+CACHE_VERSION = 2
+POOL_THRESHOLD = 8  # 待解析文件不超过这个数时直接在本进程解析，省掉进程池启动开销
 
 def get_ip_from_url(url):
     """提取 IP:Port"""
@@ -16,7 +27,10 @@ def get_ip_from_url(url):
         return None
 
 def clean_name(name):
-    """标准化频道名：CCTV-01 -> CCTV-1"""
+    """标准化频道名：优先映射为 alias.txt 主名，未收录的再做 CCTV-01 -> CCTV-1"""
+    canonical = resolve(name)
+    if canonical:
+        return canonical
     name = re.sub(r'(高清|标清|普清|超清|超高清|H\.265|4K|HD|SD|hd|sd)', '', name, flags=re.I)
     name = re.sub(r'[\(\)\[\]\-\s\t]+', '', name)
     cctv_match = re.search(r'CCTV[- ]?(\d+)', name, re.I)
@@ -24,6 +38,93 @@ def clean_name(name):
         return f"CCTV-{int(cctv_match.group(1))}"
     return name
 
+def parse_file(text):
+    """
+    解析单个快照的内容 -> [[IP:Port, 标准频道名, URL], ...]
+    文件内已按 (IP:Port, 频道名) 去重，保留首次出现的链接
+    """
+    entries, seen = [], set()
+    for ch in iter_m3u(io.StringIO(text, newline=None)):
+        if not ch.url.startswith("http"): continue
+        url = ch.url
+        # 获取频道名
+        raw_name = ch.extinf.split(',')[-1] if ch.extinf else "未知频道"
+        ip_port = get_ip_from_url(url)
+
+        if ip_port:
+            std_name = clean_name(raw_name)
+            if (ip_port, std_name) not in seen:
+                seen.add((ip_port, std_name))
+                entries.append([ip_port, std_name, url])
+    return entries
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def alias_signature():
+    """频道名标准化依赖 alias.txt，内容变了缓存整体作废"""
+    return file_digest(ALIAS_FILE) if os.path.exists(ALIAS_FILE) else ""
+
+def load_cache(signature):
+    try:
+        with open(CACHE_PATH, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if cache.get("version") != CACHE_VERSION or cache.get("alias") != signature:
+        return {}
+    return cache["files"]
+
+def save_cache(signature, files):
+    os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+    tmp = CACHE_PATH + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({"version": CACHE_VERSION, "alias": signature, "files": files}, f, ensure_ascii=False)
+    os.replace(tmp, CACHE_PATH)
+
+def scan_history(base_dir):
+    """
+    按 (路径, 大小, mtime) 复用缓存中的单文件解析结果，其余文件分片交给进程池；
+    大小一致但 mtime 变了 (如 CI 重新检出) 时再比对内容摘要，内容未变仍算命中。
+    已打包进 history/pack/ 的快照没有 mtime，直接比对归档记录头中的摘要，不用解压。
+    返回按路径排序的 [(路径, 条目)]，合并顺序与文件系统的遍历顺序无关
+    """
+    history = History(base_dir)
+    names = history.names((".m3u", ".txt"))
+    paths = [os.path.join(base_dir, name) for name in names]
+
+    signature = alias_signature()
+    cached = load_cache(signature)
+    files, misses = {}, []
+    for path, name in zip(paths, names):
+        loose = history.path(name)
+        mtime = os.stat(loose).st_mtime if loose else None
+        entry = cached.get(path)
+        if entry and entry["size"] == history.size(name):
+            if mtime is None or entry["mtime"] != mtime:
+                if history.digest(name) != entry["sha256"]:
+                    misses.append((path, name, mtime))
+                    continue
+                entry["mtime"] = mtime
+            files[path] = entry
+        else:
+            misses.append((path, name, mtime))
+
+    texts = [history.read_text(name) for _, name, _ in misses]
+    workers = os.cpu_count() or 1
+    if len(misses) > POOL_THRESHOLD and workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(parse_file, texts, chunksize=max(1, len(misses) // (workers * 4))))
+    else:
+        results = [parse_file(text) for text in texts]
+    for (path, name, mtime), entries in zip(misses, results):
+        files[path] = {"size": history.size(name), "mtime": mtime, "sha256": history.digest(name), "entries": entries}
+
+    print(f"📂 共 {len(paths)} 个文件：缓存命中 {len(paths) - len(misses)}，重新解析 {len(misses)}")
+    save_cache(signature, files)
+    return [(path, files[path]["entries"]) for path in paths]
+
 def main():
     # 数据结构: { "IP:Port": { "频道名": "URL" } }
     ip_groups = {}
@@ -32,32 +133,12 @@ def main():
         print(f"Directory {BASE_DIR} not found.")
         return
 
-    # 递归遍历所有子文件夹
-    for root, _, files in os.walk(BASE_DIR):
-        for file in files:
-            if file.endswith((".m3u", ".txt")):
-                with open(os.path.join(root, file), 'r', encoding='utf-8', errors='ignore') as f:
-                    current_info = ""
-                    for line in f:
-                        line = line.strip()
-                        if not line: continue
-                        if line.startswith("#EXTINF"):
-                            current_info = line
-                        elif line.startswith("http"):
-                            url = line
-                            # 获取频道名
-                            raw_name = current_info.split(',')[-1] if current_info else "未知频道"
-                            ip_port = get_ip_from_url(url)
-                            
-                            if ip_port:
-                                if ip_port not in ip_groups:
-                                    ip_groups[ip_port] = {}
-                                
-                                std_name = clean_name(raw_name)
-                                # 去重：同一IP下同名频道只保留一个
-                                if std_name not in ip_groups[ip_port]:
-                                    ip_groups[ip_port][std_name] = url
-                            current_info = ""
+    # 按文件顺序合并各分片：同一IP下同名频道只保留最先出现的一个
+    for _, entries in scan_history(BASE_DIR):
+        for ip_port, std_name, url in entries:
+            channels = ip_groups.setdefault(ip_port, {})
+            if std_name not in channels:
+                channels[std_name] = url
 
     # 写入结果
     with open(SAVE_PATH, 'w', encoding='utf-8') as f:
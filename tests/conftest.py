@@ -0,0 +1,5 @@
+import os
+import sys
+
+# md/ 下的脚本以同目录模块互相导入 (python md/xxx.py)，测试同样把 md/ 放进 sys.path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "md"))
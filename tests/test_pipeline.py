@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from benchmark import FARM_DEAD_BLOCKS, _farm_inputs
+from iptv_farm import Farm
+
+OUTPUTS = ("final_hotel.txt", "final_hotel.m3u")
+
+
+@pytest.fixture(scope="module")
+def farm():
+    # 每段只有一台存活主机：抢救结果唯一，与候选排序、探测完成顺序无关
+    farm = Farm(subnets=3, live_per_subnet=1, hang_per_subnet=0, port=18470, latency_ms=0,
+                jitter_ms=0, error_rate=0, timeout_rate=0).start()
+    yield farm
+    farm.stop()
+
+
+def run_pipeline(farm, root, *flags):
+    _farm_inputs(farm, str(root))
+    # 底库只含失效块，补上存活块，让体检也有存活结果
+    with open(root / "md" / "manual_fix.txt", "a", encoding="utf-8") as f:
+        for host in farm.live_hosts():
+            f.write(f"\n{host},#genre#\n" + "".join(f"CCTV{k},http://{host}/hls/{k}/index.m3u8\n" for k in range(1, 5)))
+    env = dict(os.environ, LIVENESS_CACHE=str(root / "liveness.sqlite3"), HOST_HISTORY=str(root / "history.sqlite3"))
+    subprocess.run([sys.executable, os.path.join("md", "pipeline.py"), *flags], cwd=root, env=env,
+                   check=True, stdout=subprocess.DEVNULL, timeout=120)
+    return {name: (root / name).read_bytes() for name in OUTPUTS}
+
+
+def test_stream_output_matches_serial(farm, tmp_path):
+    serial = run_pipeline(farm, tmp_path / "serial")
+    stream = run_pipeline(farm, tmp_path / "stream", "--stream")
+    # 每段: 1 个存活块 + FARM_DEAD_BLOCKS 个抢救成功的块
+    assert serial["final_hotel.txt"].count(b"#genre#") == (1 + FARM_DEAD_BLOCKS) * len(farm.prefixes)
+    assert serial == stream
@@ -0,0 +1,70 @@
+import asyncio
+import errno
+import time
+
+import probe
+from liveness_cache import LivenessCache, _split
+
+URL = "http://10.0.0.1:8080/hls/1/index.m3u8"
+
+
+def fail_connect(monkeypatch, exc):
+    async def connect(parts, timeout):
+        raise exc
+    monkeypatch.setattr(probe, "_connect", connect)
+
+
+def run_probe(cache):
+    async def collect():
+        return [res async for res in probe.probe([URL], cache=cache)]
+    return asyncio.run(collect())
+
+
+def cache_row(cache, url=URL):
+    cache.flush()
+    return cache._db.execute("SELECT ok, checked FROM liveness WHERE host = ? AND path = ?", _split(url)).fetchone()
+
+
+def test_probe_resource_failure_leaves_cache_untouched(tmp_path, monkeypatch):
+    cache = LivenessCache(str(tmp_path / "liveness.sqlite3"))
+    expired = time.time() - cache.positive_ttl - 60
+    cache.put(URL, True, checked=expired)
+    fail_connect(monkeypatch, OSError(errno.EMFILE, "Too many open files"))
+
+    [res] = run_probe(cache)
+
+    assert res.error == "resource" and not res.cached
+    assert cache_row(cache) == (1, expired)
+    cache.close()
+
+
+def test_probe_refused_is_cached_as_dead(tmp_path, monkeypatch):
+    cache = LivenessCache(str(tmp_path / "liveness.sqlite3"))
+    fail_connect(monkeypatch, ConnectionRefusedError(errno.ECONNREFUSED, "Connection refused"))
+
+    [res] = run_probe(cache)
+
+    assert res.error == "refused"
+    assert cache_row(cache)[0] == 0
+    cache.close()
+
+
+def test_verify_block_resource_failure_is_unknown(tmp_path, monkeypatch):
+    cache = LivenessCache(str(tmp_path / "liveness.sqlite3"))
+    urls = [URL, URL.replace("/1/", "/2/")]
+    fail_connect(monkeypatch, OSError(errno.ENOBUFS, "No buffer space available"))
+
+    results = asyncio.run(probe.verify_block(urls, cache=cache))
+
+    assert results == {url: None for url in urls}
+    assert not probe.conclusive(results)
+    assert all(cache_row(cache, url) is None for url in urls)
+    cache.close()
+
+
+def test_sweep_counts_resource_failures(monkeypatch):
+    fail_connect(monkeypatch, OSError(errno.EMFILE, "Too many open files"))
+
+    result = asyncio.run(probe.sweep("10.0.0", 8080, "/live", hosts=range(1, 5)))
+
+    assert result.hosts == [] and result.starved == 4